@@ -1,28 +1,52 @@
 import os
+import sys
 import io
 import json
 import logging
-import re
+import functools
+import hashlib
+import csv
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from PIL import Image
 from dotenv import load_dotenv
-from typing import Union, List, Any, Dict
-from google.api_core.exceptions import ResourceExhausted
+from typing import Union, List, Any, Dict, Tuple, TYPE_CHECKING
 import random
 from datetime import datetime, timedelta
 
-import vertexai
-from vertexai.generative_models import (
-    GenerationConfig,
-    GenerativeModel,
-    HarmCategory,
-    Part,
-)
-import vertexai.generative_models as generative_models
+if TYPE_CHECKING:
+    from vertexai.generative_models import GenerationConfig, GenerativeModel, Part
 
 # Import tenacity for retry logic
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+# Prompts, schemas and their version stamps are shared with the FastAPI backend
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "pic2catalog-react", "backend"))
+from catalog_registry import (
+    BATCH_REVIEWS_PROMPT,
+    MODEL_NAME,
+    REVIEWS_PROMPT,
+    SUMMARY_PROMPT,
+    catalog_prompt,
+    merge_review_shards,
+    pipeline_version,
+    render_batch_reviews_prompt,
+    render_review_shard_prompts,
+    render_reviews_prompt,
+    render_summary_prompt,
+    review_batch_size,
+    split_batch_reviews,
+)
+from response_json import clean_json_response
+from image_tools import ImageRejectedError, probe_image, check_image_limits, downscale_to_budget, flatten_to_rgb
+from call_timeouts import ModelCallTimeout, call_with_timeout
+from vertex_sdk import vertex_sdk
+
 # Load environment variables
 load_dotenv()
 
@@ -30,6 +54,56 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Decompression-bomb guard: reject images above MAX_IMAGE_PIXELS,
+# downscale anything above IMAGE_PIXEL_BUDGET before display and generation
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", 50_000_000))
+IMAGE_PIXEL_BUDGET = int(os.environ.get("IMAGE_PIXEL_BUDGET", 4_000_000))
+MAX_IMAGE_FRAMES = int(os.environ.get("MAX_IMAGE_FRAMES", 50))
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# Generated results are cached per image content hash across reruns and sessions
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get("RESULT_CACHE_TTL_SECONDS", 3600))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 256))
+
+# Output token budget per generation stage
+STAGE_OUTPUT_BUDGETS = {
+    "catalog": int(os.environ.get("CATALOG_MAX_OUTPUT_TOKENS", 8192)),
+    "reviews": int(os.environ.get("REVIEWS_MAX_OUTPUT_TOKENS", 8192)),
+    "reviews_shard": int(os.environ.get("REVIEWS_SHARD_MAX_OUTPUT_TOKENS", 4096)),
+    "summary": int(os.environ.get("SUMMARY_MAX_OUTPUT_TOKENS", 8192)),
+    "batch_reviews": int(os.environ.get("BATCH_REVIEWS_MAX_OUTPUT_TOKENS", 8192)),
+}
+
+# Maximum number of images generated at once in multi-file mode
+BATCH_MAX_WORKERS = int(os.environ.get("BATCH_MAX_WORKERS", 4))
+BATCH_GRID_COLUMNS = 4
+
+# In multi-file mode, reviews are generated for several products per call: as many
+# as the batch_reviews budget fits at BATCH_REVIEWS_TOKENS_PER_PRODUCT output tokens
+# each, up to BATCH_REVIEWS_MAX_SIZE
+BATCH_REVIEWS_MAX_SIZE = int(os.environ.get("BATCH_REVIEWS_MAX_SIZE", 8))
+BATCH_REVIEWS_TOKENS_PER_PRODUCT = int(os.environ.get("BATCH_REVIEWS_TOKENS_PER_PRODUCT", 1500))
+
+# Single-image mode can generate the reviews as parallel, shorter calls, one per
+# reviewer profile, merged and de-duplicated: lower latency for a little extra cost
+REVIEWS_SHARDED = os.environ.get("REVIEWS_SHARDED", "false").lower() in ("1", "true", "yes")
+
+PIPELINE_VERSION = pipeline_version(sharded_reviews=REVIEWS_SHARDED)
+
+# Per-attempt model call timeouts in seconds, (connect, read), for calls carrying images
+# and for text-only calls; the connect timeout is added on a region's first call. A timed-out
+# attempt moves on to the next region right away.
+MODEL_CALL_TIMEOUTS = {
+    "image": (
+        float(os.environ.get("IMAGE_CONNECT_TIMEOUT_SECONDS", 10)),
+        float(os.environ.get("IMAGE_READ_TIMEOUT_SECONDS", 120)),
+    ),
+    "text": (
+        float(os.environ.get("TEXT_CONNECT_TIMEOUT_SECONDS", 10)),
+        float(os.environ.get("TEXT_READ_TIMEOUT_SECONDS", 60)),
+    ),
+}
+
 # Set Material UI theme
 st.set_page_config(
     page_title="Pic2Catalog: Gerador de Catálogo de Produtos",
@@ -553,13 +627,16 @@ class GeminiRegionClient:
     A client for interacting with Gemini API with region fallback capabilities.
     """
     
-    def __init__(self, project_id: str = None, logger: logging.Logger = None):
+    def __init__(self, project_id: str = None, logger: logging.Logger = None,
+                 call_timeouts: Dict[str, Tuple[float, float]] = None):
         """
         Initialize the GeminiRegionClient.
         
         Args:
             project_id (str, optional): Google Cloud Project ID. If None, will try to get from environment.
             logger (logging.Logger, optional): Custom logger instance. If None, will create a new one.
+            call_timeouts (dict, optional): (connect, read) timeouts in seconds per call kind,
+                "image" or "text". Calls of a kind without timeouts wait indefinitely.
         """
         self.project_id = project_id or os.environ.get("GCP_PROJECT")
         if not self.project_id:
@@ -577,16 +654,29 @@ class GeminiRegionClient:
             "asia-south1"
         ]
         
-        # Safety settings configuration
-        self.safety_settings = {
-            generative_models.HarmCategory.HARM_CATEGORY_HATE_SPEECH: generative_models.HarmBlockThreshold.BLOCK_NONE,
-            generative_models.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: generative_models.HarmBlockThreshold.BLOCK_NONE,
-            generative_models.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: generative_models.HarmBlockThreshold.BLOCK_NONE,
-            generative_models.HarmCategory.HARM_CATEGORY_HARASSMENT: generative_models.HarmBlockThreshold.BLOCK_NONE,
+        self.call_timeouts = call_timeouts or {}
+        # Regions with an established channel (a call has succeeded)
+        self._connected: set = set()
+        self._call_executor = ThreadPoolExecutor(thread_name_prefix="gemini-call")
+        # Model instances per region; batch generation calls the client from several threads
+        self._models: Dict[str, "GenerativeModel"] = {}
+        self._models_lock = threading.Lock()
+
+    @functools.cached_property
+    def safety_settings(self) -> Dict:
+        """Safety settings configuration, built on first model use."""
+        sdk = vertex_sdk()
+        return {
+            sdk.HarmCategory.HARM_CATEGORY_HATE_SPEECH: sdk.HarmBlockThreshold.BLOCK_NONE,
+            sdk.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: sdk.HarmBlockThreshold.BLOCK_NONE,
+            sdk.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: sdk.HarmBlockThreshold.BLOCK_NONE,
+            sdk.HarmCategory.HARM_CATEGORY_HARASSMENT: sdk.HarmBlockThreshold.BLOCK_NONE,
         }
-        
-        # Default generation config
-        self.default_generation_config = GenerationConfig(
+
+    @functools.cached_property
+    def default_generation_config(self) -> "GenerationConfig":
+        """Default generation config, built on first model use."""
+        return vertex_sdk().GenerationConfig(
             max_output_tokens=8192,
             temperature=0.1,
             top_p=0.95,
@@ -595,15 +685,40 @@ class GeminiRegionClient:
 
     def _initialize_region(self, region: str) -> None:
         """Initialize Vertex AI with the specified region."""
-        vertexai.init(project=self.project_id, location=region)
+        vertex_sdk().vertexai.init(project=self.project_id, location=region)
         
-    def _get_model(self) -> GenerativeModel:
-        """Get the Gemini model instance."""
-        return GenerativeModel("gemini-2.0-flash-001")
+    def _get_model(self, region: str) -> "GenerativeModel":
+        """Get the Gemini model instance for a region, initializing the region on first use."""
+        # vertexai.init sets process-wide state, so regions are initialized one at a time;
+        # each model keeps the location it was created with
+        with self._models_lock:
+            model = self._models.get(region)
+            if model is None:
+                self._initialize_region(region)
+                model = vertex_sdk().GenerativeModel(MODEL_NAME)
+                self._models[region] = model
+            return model
+
+    def _call_with_timeout(self, region: str, call_kind: str, call):
+        """
+        Run a model call under the timeouts of its kind, abandoning it if they expire.
+        
+        Raises:
+            ModelCallTimeout: If the call does not return in time
+        """
+        timeouts = self.call_timeouts.get(call_kind)
+        if not timeouts:
+            return call()
+        
+        connect_timeout, read_timeout = timeouts
+        timeout = read_timeout if region in self._connected else connect_timeout + read_timeout
+        result = call_with_timeout(self._call_executor, call, timeout, f"{MODEL_NAME} in {region}")
+        self._connected.add(region)
+        return result
 
     @retry(wait=wait_exponential(multiplier=1, min=2, max=10), stop=stop_after_attempt(3))
     def generate_content(self, 
-                        prompt: Union[str, List[Union[str, Part]]], 
+                        prompt: Union[str, List[Union[str, "Part"]]], 
                         response_mime_type: str = None,
                         **kwargs) -> str:
         """
@@ -620,40 +735,45 @@ class GeminiRegionClient:
         Raises:
             Exception: If all regions fail
         """
+        sdk = vertex_sdk()
         last_error = None
         
+        # Prepare generation config (once, so every region gets the caller's config)
+        gen_config = kwargs.pop('generation_config', self.default_generation_config)
+        if response_mime_type:
+            gen_config = sdk.GenerationConfig(
+                **gen_config.to_dict(),
+                response_mime_type=response_mime_type
+            )
+        
         for region in self.regions:
             try:
-                self._initialize_region(region)
-                model = self._get_model()
-                
-                # Prepare generation config
-                gen_config = kwargs.pop('generation_config', self.default_generation_config)
-                if response_mime_type:
-                    gen_config = GenerationConfig(
-                        **gen_config.to_dict(),
-                        response_mime_type=response_mime_type
-                    )
+                model = self._get_model(region)
                 
                 # Process multimodal input if needed
                 if isinstance(prompt, list) and len(prompt) == 2:
                     image_content, text_prompt = prompt
-                    if not isinstance(image_content, Part):
-                        image_content = Part.from_data(image_content, mime_type="image/jpeg")
+                    if not isinstance(image_content, sdk.Part):
+                        image_content = sdk.Part.from_data(image_content, mime_type="image/jpeg")
                     prompt = [image_content, text_prompt]
                 
-                response = model.generate_content(
+                call_kind = "image" if isinstance(prompt, list) else "text"
+                response = self._call_with_timeout(region, call_kind, functools.partial(
+                    model.generate_content,
                     prompt,
                     generation_config=gen_config,
                     safety_settings=self.safety_settings,
                     **kwargs
-                )
+                ))
                 
                 return response.text
                 
-            except ResourceExhausted as e:
+            except sdk.ResourceExhausted as e:
                 self.logger.warning(f"Region {region} exhausted. Trying next region...")
                 last_error = e
+            except ModelCallTimeout as e:
+                self.logger.warning(f"Region {region} timed out ({str(e)}). Trying next region...")
+                last_error = e
             except Exception as e:
                 self.logger.warning(f"Unexpected error with region {region}: {str(e)}")
                 last_error = e
@@ -661,269 +781,501 @@ class GeminiRegionClient:
         raise Exception(f"All regions failed. Last error: {str(last_error)}") from last_error
 
 
-def clean_json_response(response_text):
+def generate_product_catalog_info(client, image_bytes):
     """
-    Clean the JSON response from Gemini to ensure it's valid JSON.
+    Generate product catalog information using Gemini.
     
     Args:
-        response_text: The raw text response from Gemini
+        client: GeminiRegionClient instance
+        image_bytes: Image bytes to analyze
         
     Returns:
-        dict: Parsed JSON object
+        dict: Generated product catalog information as a JSON object
     """
-    # Remove markdown code block markers if present
-    cleaned_text = re.sub(r'^```json\s*', '', response_text, flags=re.MULTILINE)
-    cleaned_text = re.sub(r'\s*```$', '', cleaned_text, flags=re.MULTILINE)
-    
-    # Remove any other markdown formatting that might be present
-    cleaned_text = re.sub(r'^```\s*', '', cleaned_text, flags=re.MULTILINE)
+    definition = catalog_prompt()
+    generation_config = definition.generation_config(STAGE_OUTPUT_BUDGETS["catalog"])
+
+    prompt = [image_bytes, definition.render()]
     
-    try:
-        # Parse the cleaned text as JSON
-        return json.loads(cleaned_text)
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON parsing error: {e}")
-        logger.error(f"Cleaned text: {cleaned_text}")
-        raise ValueError(f"Failed to parse JSON response: {e}")
+    response_text = client.generate_content(prompt, generation_config=generation_config)
+    return clean_json_response(response_text)
 
 
-def generate_product_catalog_info(client, image_bytes):
+def generate_product_reviews(client, product_info: Dict):
     """
-    Generate product catalog information using Gemini.
+    Generate AI reviews for the product using Gemini.
     
     Args:
         client: GeminiRegionClient instance
-        image_bytes: Image bytes to analyze
+        product_info: Dictionary containing product information
         
     Returns:
-        dict: Generated product catalog information as a JSON object
+        dict: Generated reviews and summary
     """
-    # Define the catalog schema
-    catalog_schema = {
-        "type": "OBJECT",
-        "properties": {
-            "Nome do Produto": {"type": "STRING"},
-            "Marca": {"type": "STRING"},
-            "Categoria": {"type": "STRING"},
-            "Subcategoria": {"type": "STRING"},
-            "Descrição Curta": {"type": "STRING"},
-            "Descrição Longa": {"type": "STRING"},
-            "Características Principais": {
-                "type": "ARRAY",
-                "items": {"type": "STRING"},
-                "minItems": 3
-            },
-            "Especificações Técnicas": {
-                "type": "OBJECT",
-                "properties": {
-                    "Material": {"type": "STRING"},
-                    "Modelo": {"type": "STRING"},
-                    "Fabricante": {"type": "STRING"},
-                    "País de Origem": {"type": "STRING"},
-                    "Garantia": {"type": "STRING"},
-                    "Certificações": {"type": "STRING"}
-                }
-            },
-            "Dimensões": {
-                "type": "OBJECT",
-                "properties": {
-                    "Altura": {"type": "STRING"},
-                    "Largura": {"type": "STRING"},
-                    "Profundidade": {"type": "STRING"},
-                    "Peso": {"type": "STRING"}
-                }
-            },
-            "Opções de Cores": {
-                "type": "ARRAY",
-                "items": {"type": "STRING"},
-                "minItems": 1
-            },
-            "Faixa de Preço Sugerida": {"type": "STRING"},
-            "Público-Alvo": {"type": "STRING"},
-            "Palavras-chave SEO": {
-                "type": "ARRAY",
-                "items": {"type": "STRING"},
-                "minItems": 3
-            },
-            "Tags de Busca": {
-                "type": "ARRAY",
-                "items": {"type": "STRING"},
-                "minItems": 3
-            }
-        },
-        "required": [
-            "Nome do Produto",
-            "Categoria",
-            "Descrição Curta",
-            "Descrição Longa",
-            "Características Principais"
-        ],
-        "propertyOrdering": [
-            "Nome do Produto",
-            "Marca",
-            "Categoria",
-            "Subcategoria",
-            "Descrição Curta",
-            "Descrição Longa",
-            "Características Principais",
-            "Especificações Técnicas",
-            "Dimensões",
-            "Opções de Cores",
-            "Faixa de Preço Sugerida",
-            "Público-Alvo",
-            "Palavras-chave SEO",
-            "Tags de Busca"
-        ]
+    if REVIEWS_SHARDED:
+        reviews_data = generate_sharded_reviews(client, product_info)
+    else:
+        generation_config = REVIEWS_PROMPT.generation_config(STAGE_OUTPUT_BUDGETS["reviews"])
+        prompt = render_reviews_prompt(product_info)
+        
+        response_text = client.generate_content(prompt, generation_config=generation_config)
+        reviews_data = clean_json_response(response_text)
+    
+    summary_generation_config = SUMMARY_PROMPT.generation_config(STAGE_OUTPUT_BUDGETS["summary"])
+    summary_prompt = render_summary_prompt(reviews_data)
+    
+    summary_response = client.generate_content(summary_prompt, generation_config=summary_generation_config)
+    summary_data = clean_json_response(summary_response)
+    
+    return {
+        "reviews": reviews_data["reviews"],
+        "summary": summary_data
     }
 
-    generation_config = GenerationConfig(
-        max_output_tokens=8192,
-        temperature=0.1,
-        top_p=0.95,
-        response_mime_type="application/json",
-        response_schema=catalog_schema
-    )
 
-    prompt = [
-        image_bytes,
-        """Gere uma entrada detalhada de catálogo de e-commerce para este item em português. Inclua:
+def generate_sharded_reviews(client, product_info: Dict) -> Dict:
+    """
+    Generate the reviews for a product as parallel shards, one per reviewer profile.
+    
+    Args:
+        client: GeminiRegionClient instance
+        product_info: Dictionary containing product information
+        
+    Returns:
+        dict: The merged, de-duplicated reviews under the "reviews" key
+    """
+    def generate_shard(definition, prompt):
+        generation_config = definition.generation_config(STAGE_OUTPUT_BUDGETS["reviews_shard"])
+        return clean_json_response(client.generate_content(prompt, generation_config=generation_config))
+    
+    shard_prompts = render_review_shard_prompts(product_info)
+    with ThreadPoolExecutor(max_workers=len(shard_prompts)) as executor:
+        shards = list(executor.map(lambda shard: generate_shard(*shard), shard_prompts))
+    return merge_review_shards(shards)
 
-1. Nome do Produto
-2. Marca (se visível)
-3. Categoria
-4. Subcategoria
-5. Descrição Curta (50-60 palavras)
-6. Descrição Longa (100-150 palavras)
-7. Características Principais (mínimo 3 características)
-8. Especificações Técnicas (incluindo material, modelo, fabricante, país de origem, garantia e certificações)
-9. Dimensões (altura, largura, profundidade e peso)
-10. Opções de Cores (mínimo 1 cor)
-11. Faixa de Preço Sugerida
-12. Público-Alvo
-13. Palavras-chave SEO (mínimo 3 palavras-chave)
-14. Tags de Busca (mínimo 3 tags)
 
-A saída deve seguir estritamente o schema JSON fornecido.
-"""
-    ]
+def generate_batch_reviews(client, products: Dict[str, Dict]) -> Dict[str, Dict]:
+    """
+    Generate reviews and their summary for several products in one call.
+    
+    Products the response leaves out (usually because it ran into the output
+    budget) are retried in two smaller batches, so only they are paid for again.
+    
+    Args:
+        client: GeminiRegionClient instance
+        products: Catalog entries keyed by product id
+        
+    Returns:
+        dict: {"reviews": [...], "summary": {...}} keyed by product id
+        
+    Raises:
+        ValueError: If a product is still left out when reviewed on its own
+    """
+    generation_config = BATCH_REVIEWS_PROMPT.generation_config(STAGE_OUTPUT_BUDGETS["batch_reviews"])
+    prompt = render_batch_reviews_prompt(products)
     
     response_text = client.generate_content(prompt, generation_config=generation_config)
-    return clean_json_response(response_text)
+    batch_reviews = split_batch_reviews(clean_json_response(response_text))
+    reviews = {product_id: batch_reviews[product_id] for product_id in products if product_id in batch_reviews}
+    
+    missing = [product_id for product_id in products if product_id not in reviews]
+    if not missing:
+        return reviews
+    if len(products) == 1:
+        raise ValueError(f"Batched reviews left out product {missing[0]}")
+    
+    logger.warning(f"Batched reviews left out {len(missing)} of {len(products)} products; retrying them")
+    half = (len(missing) + 1) // 2
+    for part in (missing[:half], missing[half:]):
+        if part:
+            reviews.update(generate_batch_reviews(client, {product_id: products[product_id] for product_id in part}))
+    return reviews
 
 
-def generate_product_reviews(client, product_info: Dict):
+def rejection_message(error: ImageRejectedError) -> str:
+    """Word an image rejection for the user (the shared helpers raise English messages)."""
+    if error.reason == "pixels":
+        return f"Imagem com {error.value} pixels; o limite é {error.limit} pixels"
+    if error.reason == "frames":
+        return f"Imagem com {error.value} quadros; o limite é {error.limit}"
+    return f"Imagem grande demais para ser aberta com segurança ({error})"
+
+
+def load_uploaded_image(uploaded_file) -> Image.Image:
     """
-    Generate AI reviews for the product using Gemini.
+    Open an uploaded image, checking its header before any pixel decode.
     
     Args:
-        client: GeminiRegionClient instance
-        product_info: Dictionary containing product information
+        uploaded_file: File returned by st.file_uploader
+        
+    Returns:
+        Image.Image: The image, downscaled to IMAGE_PIXEL_BUDGET if needed
+        
+    Raises:
+        ImageRejectedError: If the image exceeds the configured limits
+    """
+    try:
+        image = Image.open(uploaded_file)
+    except Image.DecompressionBombError as e:
+        raise ImageRejectedError(str(e)) from e
+    
+    check_image_limits(probe_image(image), MAX_IMAGE_PIXELS, MAX_IMAGE_FRAMES)
+    return downscale_to_budget(image, IMAGE_PIXEL_BUDGET)
+
+def image_content_hash(uploaded_file) -> str:
+    """Return the SHA-256 of an uploaded file's bytes, used as the result cache key."""
+    return hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+
+
+@st.cache_resource(show_spinner=False)
+def get_gemini_client(project_id: str) -> GeminiRegionClient:
+    """Create the Gemini client once per project and reuse it across reruns."""
+    return GeminiRegionClient(project_id=project_id, logger=logger, call_timeouts=MODEL_CALL_TIMEOUTS)
+
+
+@st.cache_data(show_spinner=False, ttl=RESULT_CACHE_TTL_SECONDS, max_entries=RESULT_CACHE_MAX_ENTRIES)
+def cached_catalog_info(image_hash: str, pipeline_version: str, _client: GeminiRegionClient, _image: Image.Image) -> Dict:
+    """
+    Generate catalog information, cached by image content hash.
+    
+    Args:
+        image_hash: Content hash of the uploaded image (the cache key)
+        pipeline_version: Version stamp of the prompts and schemas (part of the cache key)
+        _client: GeminiRegionClient instance (not hashed)
+        _image: Image to analyze (not hashed)
+        
+    Returns:
+        dict: Generated product catalog information
+    """
+    buffer = io.BytesIO()
+    flatten_to_rgb(_image).save(buffer, format="JPEG")
+    return generate_product_catalog_info(_client, buffer.getvalue())
+
+
+@st.cache_data(show_spinner=False, ttl=RESULT_CACHE_TTL_SECONDS, max_entries=RESULT_CACHE_MAX_ENTRIES)
+def cached_product_reviews(image_hash: str, pipeline_version: str, _client: GeminiRegionClient, _product_info: Dict) -> Dict:
+    """
+    Generate reviews and summary, cached by image content hash.
+    
+    Args:
+        image_hash: Content hash of the uploaded image (the cache key)
+        pipeline_version: Version stamp of the prompts and schemas (part of the cache key)
+        _client: GeminiRegionClient instance (not hashed)
+        _product_info: Catalog information generated for the image (not hashed)
         
     Returns:
         dict: Generated reviews and summary
     """
-    # Define the reviews schema
-    reviews_schema = {
-        "type": "OBJECT",
-        "properties": {
-            "reviews": {
-                "type": "ARRAY",
-                "items": {
-                    "type": "OBJECT",
-                    "properties": {
-                        "nome": {"type": "STRING"},
-                        "estrelas": {"type": "INTEGER", "minimum": 1, "maximum": 5},
-                        "titulo": {"type": "STRING"},
-                        "texto": {"type": "STRING"},
-                        "data": {"type": "STRING", "format": "date"},
-                        "pros": {"type": "ARRAY", "items": {"type": "STRING"}, "minItems": 1},
-                        "contras": {"type": "ARRAY", "items": {"type": "STRING"}}
-                    },
-                    "required": ["nome", "estrelas", "titulo", "texto", "data", "pros"]
-                },
-                "minItems": 5,
-                "maxItems": 5
-            }
-        },
-        "required": ["reviews"],
-        "propertyOrdering": ["reviews"]
-    }
+    return generate_product_reviews(_client, _product_info)
 
-    generation_config = GenerationConfig(
-        max_output_tokens=8192,
-        temperature=0.7,
-        top_p=0.95,
-        response_mime_type="application/json",
-        response_schema=reviews_schema
-    )
 
-    prompt = f"""Com base nas informações do produto abaixo, gere 5 avaliações realistas de usuários em português.
-    Cada avaliação deve incluir:
-    1. Nome do usuário
-    2. Classificação (1-5 estrelas)
-    3. Título da avaliação
-    4. Texto da avaliação (2-3 frases)
-    5. Data (formato YYYY-MM-DD, últimos 30 dias)
-    6. Prós (mínimo 1) e Contras (opcional)
+class ProductReviewsCache:
+    """
+    Reviews generated in batches, cached per product by image content hash.
+    
+    Which products share a batch depends on the order their catalog entries
+    finish, so caching whole batches would miss on every repeat run; entries
+    expire after RESULT_CACHE_TTL_SECONDS, like the other result caches.
+    """
+    
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Tuple[str, str]) -> Union[Dict, None]:
+        """Return the cached reviews for (image hash, pipeline version), or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            return entry[1]
+    
+    def put(self, key: Tuple[str, str], reviews_info: Dict) -> None:
+        """Cache the reviews of one product, evicting the oldest entries past max_entries."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, reviews_info)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
 
-    Informações do Produto:
-    Nome: {product_info.get('Nome do Produto', '')}
-    Descrição: {product_info.get('Descrição Curta', '')}
-    Características: {product_info.get('Características Principais', [])}
+@st.cache_resource(show_spinner=False)
+def product_reviews_cache() -> ProductReviewsCache:
+    """Create the batched reviews cache once and share it across sessions."""
+    return ProductReviewsCache(RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_MAX_ENTRIES)
 
-    A saída deve seguir estritamente o schema JSON fornecido.
+
+def cached_batch_reviews(items: List[Dict], client: GeminiRegionClient, catalogs: List[Dict]) -> List[Dict]:
     """
+    Generate reviews and summaries for a batch of products, reusing the ones already cached.
     
-    response_text = client.generate_content(prompt, generation_config=generation_config)
-    reviews_data = clean_json_response(response_text)
-    
-    # Define the summary schema
-    summary_schema = {
-        "type": "OBJECT",
-        "properties": {
-            "pontos_fortes": {
-                "type": "ARRAY",
-                "items": {"type": "STRING"},
-                "minItems": 3
-            },
-            "criticas": {
-                "type": "ARRAY",
-                "items": {"type": "STRING"}
-            },
-            "sentimento_geral": {"type": "STRING"},
-            "recomendacoes": {"type": "STRING"}
-        },
-        "required": ["pontos_fortes", "criticas", "sentimento_geral", "recomendacoes"],
-        "propertyOrdering": ["pontos_fortes", "criticas", "sentimento_geral", "recomendacoes"]
-    }
+    Only the products missing from product_reviews_cache go into the batched call.
+    
+    Args:
+        items: Batch items with a "hash" key
+        client: GeminiRegionClient instance
+        catalogs: Catalog information generated for each item, in the same order
+        
+    Returns:
+        list: Generated reviews and summary per product, in the same order
+    """
+    cache = product_reviews_cache()
+    keys = [(item["hash"], PIPELINE_VERSION) for item in items]
+    reviews = [cache.get(key) for key in keys]
+    
+    # Product ids in the prompt are 1-based positions in the batch
+    missing = {str(number + 1): catalogs[number] for number, cached in enumerate(reviews) if cached is None}
+    if missing:
+        generated = generate_batch_reviews(client, missing)
+        for product_id, reviews_info in generated.items():
+            number = int(product_id) - 1
+            reviews[number] = reviews_info
+            cache.put(keys[number], reviews_info)
+    return reviews
 
-    summary_generation_config = GenerationConfig(
-        max_output_tokens=8192,
-        temperature=0.3,
-        top_p=0.95,
-        response_mime_type="application/json",
-        response_schema=summary_schema
+
+def batch_executor() -> ThreadPoolExecutor:
+    """Create the bounded pool for multi-file generation; its threads can use the result caches."""
+    ctx = get_script_run_ctx()
+    return ThreadPoolExecutor(
+        max_workers=BATCH_MAX_WORKERS,
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
     )
 
-    summary_prompt = f"""Com base nas avaliações abaixo, gere um resumo conciso em português que destaque:
-    1. Pontos fortes mais mencionados (mínimo 3)
-    2. Principais críticas (se houver)
-    3. Sentimento geral dos usuários
-    4. Recomendações para potenciais compradores
 
-    Avaliações:
-    {json.dumps(reviews_data, ensure_ascii=False, indent=2)}
+def generate_batch_catalog(position: int, item: Dict, client: GeminiRegionClient, events: queue.Queue) -> None:
+    """
+    Generate the catalog entry for one image of a batch.
+    
+    Progress is reported through the events queue as (position, status, payload)
+    tuples, where status is "started", "catalog" (with the catalog entry) or
+    "error", so the script thread can update the page while workers run.
+    
+    Args:
+        position: Index of the item in the batch
+        item: Batch item with "name", "hash" and "image" keys
+        client: GeminiRegionClient instance
+        events: Queue receiving progress events
+    """
+    events.put((position, "started", None))
+    try:
+        catalog_info = cached_catalog_info(item["hash"], PIPELINE_VERSION, client, item["image"])
+        events.put((position, "catalog", catalog_info))
+    except Exception as e:
+        logger.error(f"Erro na geração do catálogo para {item['name']}: {e}", exc_info=True)
+        events.put((position, "error", str(e)))
+
 
-    A saída deve seguir estritamente o schema JSON fornecido.
+def generate_batch_reviews_item(positions: List[int], items: List[Dict], catalogs: List[Dict],
+                                client: GeminiRegionClient, events: queue.Queue) -> None:
     """
+    Generate the reviews of several catalog entries of a batch in one call.
     
-    summary_response = client.generate_content(summary_prompt, generation_config=summary_generation_config)
-    summary_data = clean_json_response(summary_response)
+    Reports a "done" event (with the catalog entry and reviews) or an "error"
+    event for each position.
     
-    return {
-        "reviews": reviews_data["reviews"],
-        "summary": summary_data
-    }
+    Args:
+        positions: Indexes of the items in the batch
+        items: The batch items, in the same order
+        catalogs: Their catalog entries, in the same order
+        client: GeminiRegionClient instance
+        events: Queue receiving progress events
+    """
+    try:
+        reviews = cached_batch_reviews(items, client, catalogs)
+    except Exception as e:
+        logger.error(f"Erro na geração das avaliações para {len(items)} produtos: {e}", exc_info=True)
+        for position in positions:
+            events.put((position, "error", str(e)))
+        return
+    
+    for position, catalog_info, reviews_info in zip(positions, catalogs, reviews):
+        events.put((position, "done", {"catalog_info": catalog_info, "reviews_info": reviews_info}))
+
+
+def batch_results_to_jsonl(results: List[Dict]) -> str:
+    """Serialize batch results as JSON Lines, one product per line."""
+    return "\n".join(json.dumps(result, ensure_ascii=False) for result in results) + "\n"
+
+
+def batch_results_to_csv(results: List[Dict]) -> str:
+    """
+    Serialize the catalog fields of batch results as CSV.
+    
+    Lists are joined with "; " and nested objects are written as JSON.
+    
+    Args:
+        results: Batch results with "arquivo", "pipeline_version" and "catalog_info" keys
+        
+    Returns:
+        str: CSV text with one row per product
+    """
+    rows = []
+    fieldnames = ["arquivo", "pipeline_version"]
+    for result in results:
+        row = {"arquivo": result["arquivo"], "pipeline_version": result["pipeline_version"]}
+        for key, value in result["catalog_info"].items():
+            if key not in fieldnames:
+                fieldnames.append(key)
+            if isinstance(value, list):
+                value = "; ".join(str(v) for v in value)
+            elif isinstance(value, dict):
+                value = json.dumps(value, ensure_ascii=False)
+            row[key] = value
+        rows.append(row)
+    
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=fieldnames)
+    writer.writeheader()
+    writer.writerows(rows)
+    return output.getvalue()
+
+
+def render_batch_generator(uploaded_files: List, gemini_client: GeminiRegionClient):
+    """Render the multi-file generator: a per-image progress grid and combined downloads"""
+    status_labels = {
+        "queued": "⏳ Na fila",
+        "started": "⚙️ Gerando...",
+        "catalog": "📝 Gerando avaliações...",
+        "done": "✅ Concluído",
+        "error": "❌ Erro",
+    }
+    
+    reviews_batch_size = review_batch_size(
+        STAGE_OUTPUT_BUDGETS["batch_reviews"], BATCH_REVIEWS_TOKENS_PER_PRODUCT, BATCH_REVIEWS_MAX_SIZE
+    )
+    
+    # Probe every upload before anything is decoded or scheduled
+    items = []
+    for uploaded_file in uploaded_files:
+        item = {"name": uploaded_file.name, "image": None, "error": None}
+        try:
+            item["image"] = load_uploaded_image(uploaded_file)
+            item["hash"] = image_content_hash(uploaded_file)
+        except ImageRejectedError as e:
+            item["error"] = rejection_message(e)
+        items.append(item)
+    
+    # Results of an earlier upload set are not offered for download with this one
+    upload_key = tuple((uploaded_file.name, image_content_hash(uploaded_file)) for uploaded_file in uploaded_files)
+    if st.session_state.get("batch_upload_key") != upload_key:
+        st.session_state.batch_upload_key = upload_key
+        st.session_state.batch_results = []
+    
+    st.markdown(f"""
+    <div class="card">
+        {len(items)} imagens enviadas. As entradas de catálogo serão geradas em paralelo
+        (até {BATCH_MAX_WORKERS} por vez), e as avaliações em lotes de até {reviews_batch_size} produtos.
+    </div>
+    """, unsafe_allow_html=True)
+    
+    start = st.button("Gerar Entradas de Catálogo")
+    progress_bar = st.progress(0.0)
+    
+    # Per-item progress grid
+    placeholders = []
+    for row_start in range(0, len(items), BATCH_GRID_COLUMNS):
+        columns = st.columns(BATCH_GRID_COLUMNS)
+        for column, item in zip(columns, items[row_start:row_start + BATCH_GRID_COLUMNS]):
+            with column:
+                if item["image"] is not None:
+                    st.image(item["image"], caption=item["name"], use_column_width=True)
+                else:
+                    st.caption(item["name"])
+                placeholders.append(st.empty())
+    
+    for placeholder, item in zip(placeholders, items):
+        if item["error"]:
+            placeholder.markdown(f"{status_labels['error']}: {item['error']}")
+        else:
+            placeholder.markdown(status_labels["queued"])
+    
+    if start:
+        pending = [(index, item) for index, item in enumerate(items) if not item["error"]]
+        results_by_index = {}
+        events = queue.Queue()
+        
+        with batch_executor() as executor:
+            for position, (_, item) in enumerate(pending):
+                executor.submit(generate_batch_catalog, position, item, gemini_client, events)
+            
+            # Drain progress events on the script thread, which owns the page.
+            # Catalog entries are queued for reviews, which go out in batches as they fill up
+            finished = 0
+            catalogs = {}
+            catalogs_pending = len(pending)
+            awaiting_reviews = []
+            while finished < len(pending):
+                position, status, payload = events.get()
+                index, item = pending[position]
+                if status == "catalog":
+                    catalogs[position] = payload
+                    awaiting_reviews.append(position)
+                    catalogs_pending -= 1
+                elif status == "error" and position not in catalogs:
+                    catalogs_pending -= 1
+                
+                while len(awaiting_reviews) >= reviews_batch_size or (awaiting_reviews and not catalogs_pending):
+                    batch = awaiting_reviews[:reviews_batch_size]
+                    awaiting_reviews = awaiting_reviews[reviews_batch_size:]
+                    executor.submit(
+                        generate_batch_reviews_item, batch,
+                        [pending[batch_position][1] for batch_position in batch],
+                        [catalogs[batch_position] for batch_position in batch],
+                        gemini_client, events
+                    )
+                
+                if status in ("started", "catalog"):
+                    placeholders[index].markdown(status_labels[status])
+                    continue
+                
+                finished += 1
+                progress_bar.progress(finished / len(pending))
+                if status == "done":
+                    placeholders[index].markdown(status_labels["done"])
+                    results_by_index[index] = {
+                        "arquivo": item["name"],
+                        "pipeline_version": PIPELINE_VERSION,
+                        **payload
+                    }
+                else:
+                    placeholders[index].markdown(f"{status_labels['error']}: {payload}")
+        
+        # Keep results in upload order
+        results = [results_by_index[index] for index in sorted(results_by_index)]
+        st.session_state.batch_results = results
+        if results:
+            st.session_state.product_info = results[-1]["catalog_info"]
+            st.session_state.reviews_info = results[-1]["reviews_info"]
+    
+    results = st.session_state.get("batch_results") or []
+    if results:
+        st.markdown(f"""
+        <div class="success-msg">
+            ✅ {len(results)} entradas de catálogo geradas com sucesso!
+        </div>
+        """, unsafe_allow_html=True)
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                label="Baixar JSONL",
+                data=batch_results_to_jsonl(results),
+                file_name="catalogo_produtos.jsonl",
+                mime="application/jsonl"
+            )
+        with col2:
+            st.download_button(
+                label="Baixar CSV",
+                data=batch_results_to_csv(results),
+                file_name="catalogo_produtos.csv",
+                mime="text/csv"
+            )
 
 def render_product_page(product_info: Dict, reviews_info: Dict):
     """Render a beautiful product page with the generated information"""
@@ -1301,9 +1653,9 @@ def main():
             </div>
             """, unsafe_allow_html=True)
         
-        # Initialize Gemini client
+        # Get the shared Gemini client
         try:
-            gemini_client = GeminiRegionClient(project_id=project_id, logger=logger)
+            gemini_client = get_gemini_client(project_id)
         except Exception as e:
             st.markdown(f"""
             <div class="error-msg">
@@ -1312,12 +1664,27 @@ def main():
             """, unsafe_allow_html=True)
             return
         
-        # Image upload
-        uploaded_file = st.file_uploader("Faça upload de uma imagem do produto", type=["jpg", "jpeg", "png"])
+        # Image upload (several images switch to batch mode)
+        uploaded_files = st.file_uploader(
+            "Faça upload de uma ou mais imagens do produto",
+            type=["jpg", "jpeg", "png"],
+            accept_multiple_files=True
+        )
+        uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None
         
-        if uploaded_file:
-            # Display the uploaded image
-            image = Image.open(uploaded_file)
+        if len(uploaded_files) > 1:
+            render_batch_generator(uploaded_files, gemini_client)
+        elif uploaded_file:
+            # Probe the header before decoding, then display the uploaded image
+            try:
+                image = load_uploaded_image(uploaded_file)
+            except ImageRejectedError as e:
+                st.markdown(f"""
+                <div class="error-msg">
+                    Imagem rejeitada: {rejection_message(e)}
+                </div>
+                """, unsafe_allow_html=True)
+                return
             st.session_state.image = image  # Store image in session state
             col1, col2 = st.columns([1, 2])
             
@@ -1332,18 +1699,15 @@ def main():
                 if st.button("Gerar Entrada de Catálogo"):
                     with st.spinner("Analisando imagem e gerando informações do catálogo..."):
                         try:
-                            # Convert image to bytes
-                            buffer = io.BytesIO()
-                            image.save(buffer, format="JPEG")
-                            image_bytes = buffer.getvalue()
+                            image_hash = image_content_hash(uploaded_file)
                             
-                            # Generate catalog information
-                            catalog_info = generate_product_catalog_info(gemini_client, image_bytes)
+                            # Generate catalog information (cached per image)
+                            catalog_info = cached_catalog_info(image_hash, PIPELINE_VERSION, gemini_client, image)
                             st.session_state.product_info = catalog_info
                             
-                            # Generate reviews
+                            # Generate reviews (cached per image)
                             with st.spinner("Gerando avaliações de usuários..."):
-                                reviews_info = generate_product_reviews(gemini_client, catalog_info)
+                                reviews_info = cached_product_reviews(image_hash, PIPELINE_VERSION, gemini_client, catalog_info)
                                 st.session_state.reviews_info = reviews_info
                             
                             # Show results
@@ -0,0 +1,100 @@
+"""
+Startup import-time benchmark.
+
+Imports a module in a fresh interpreter with ``python -X importtime``, reports
+the slowest imports and fails when the median total import time exceeds the
+budget, or when the Vertex AI SDK is imported at startup instead of lazily on
+first model use.
+
+Usage:
+    python bench_startup.py
+    python bench_startup.py --runs 10 --budget-ms 800
+    python bench_startup.py --module app --path ../..
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Median import-time budget for the module, in milliseconds
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", 1500))
+
+# Packages that must only be imported on first model use
+LAZY_PACKAGES = ["vertexai", "google.cloud.aiplatform", "google.api_core"]
+
+
+def measure_import(module: str, path: str) -> Tuple[float, Dict[str, float]]:
+    """
+    Import a module once with -X importtime.
+    
+    Args:
+        module: Module to import
+        path: Directory to import it from
+        
+    Returns:
+        tuple: (total milliseconds, cumulative milliseconds per imported package)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=path,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+    
+    total_us = 0
+    cumulative: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        package = name.strip()
+        cumulative[package] = int(cumulative_us) / 1000
+        # Nested imports are indented two more spaces per level; only top-level entries (one
+        # space) are summed, since their cumulative times already include everything nested
+        if len(name) - len(name.lstrip()) == 1:
+            total_us += int(cumulative_us)
+    
+    return total_us / 1000, cumulative
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="Module to import (default: main)")
+    parser.add_argument("--path", default=os.path.dirname(os.path.abspath(__file__)), help="Directory to import from")
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh interpreters to measure")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_TIME_BUDGET_MS, help="Median import-time budget")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest imports to list")
+    args = parser.parse_args(argv)
+    
+    totals = []
+    cumulative: Dict[str, float] = {}
+    for _ in range(args.runs):
+        total_ms, cumulative = measure_import(args.module, args.path)
+        totals.append(total_ms)
+    
+    median_ms = statistics.median(totals)
+    print(f"import {args.module}: median {median_ms:.1f} ms over {args.runs} runs "
+          f"(min {min(totals):.1f}, max {max(totals):.1f}, budget {args.budget_ms:.0f} ms)")
+    
+    print("\nSlowest imports (cumulative, last run):")
+    for package, ms in sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {ms:9.1f} ms  {package}")
+    
+    failed = False
+    eager = [package for package in LAZY_PACKAGES if package in cumulative]
+    if eager:
+        print(f"\nFAIL: imported at startup, should be lazy: {', '.join(eager)}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"\nFAIL: median import time {median_ms:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+        failed = True
+    
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
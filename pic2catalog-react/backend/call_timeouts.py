@@ -0,0 +1,48 @@
+import time
+from concurrent.futures import Executor, wait
+from typing import Any, Callable, Optional
+
+# Deadlines for blocking calls. The Vertex AI SDK's generate_content takes no
+# timeout, so calls run on a pool and the caller waits on them with a deadline.
+
+
+class ModelCallTimeout(TimeoutError):
+    """Raised when a model call attempt exceeds its timeout."""
+
+
+def call_with_timeout(executor: Executor, call: Callable[[], Any], timeout: float, description: str,
+                      check: Optional[Callable[[], None]] = None, check_interval: float = 0.5) -> Any:
+    """
+    Run a blocking call on executor and wait at most timeout seconds for it.
+
+    A call that times out is abandoned: its thread is freed only when the call
+    returns, and its result is discarded.
+
+    Args:
+        executor: Pool the call runs on
+        call: The blocking call
+        timeout: Seconds to wait
+        description: What is being called, for the timeout message
+        check: Called every check_interval seconds while waiting; raising from
+            it (e.g. on request cancellation) abandons the call too
+        check_interval: Seconds between checks
+
+    Returns:
+        The result of call
+
+    Raises:
+        ModelCallTimeout: If the call does not return in time
+    """
+    future = executor.submit(call)
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        step = remaining if check is None else min(check_interval, remaining)
+        done, _ = wait([future], timeout=max(0.0, step))
+        if done:
+            return future.result()
+        if time.monotonic() >= deadline:
+            future.cancel()
+            raise ModelCallTimeout(f"{description} did not respond within {timeout:g}s")
+        if check is not None:
+            check()
@@ -0,0 +1,642 @@
+import json
+import hashlib
+import functools
+from typing import Any, Dict, List, Optional, Tuple
+
+# Registry of every prompt, response schema and sampling setting the catalog pipeline
+# uses. Each is defined once, at import time, with a content fingerprint that changes
+# whenever the definition does, so cached results never outlive the prompt behind them.
+
+MODEL_NAME = "gemini-2.0-flash-001"
+
+
+def fingerprint(value: Any) -> str:
+    """Return a short, stable content hash of a JSON-serializable value."""
+    encoded = json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:12]
+
+
+class PromptDefinition:
+    """
+    A pipeline stage's prompt template, response schema and sampling settings.
+    """
+
+    def __init__(self, stage: str, prompt_template: str, response_schema: Dict[str, Any],
+                 temperature: float, top_p: float = 0.95):
+        """
+        Initialize the PromptDefinition.
+
+        Args:
+            stage (str): Pipeline stage the definition belongs to
+            prompt_template (str): Prompt text with str.format placeholders
+            response_schema (dict): JSON schema the model output must follow
+            temperature (float): Sampling temperature
+            top_p (float): Nucleus sampling threshold
+        """
+        self.stage = stage
+        self.prompt_template = prompt_template
+        self.response_schema = response_schema
+        self.temperature = temperature
+        self.top_p = top_p
+        self.fingerprint = fingerprint({
+            "stage": stage,
+            "prompt": prompt_template,
+            "schema": response_schema,
+            "temperature": temperature,
+            "top_p": top_p,
+        })
+        self._generation_configs: Dict[int, Any] = {}
+
+    def render(self, **values) -> str:
+        """Fill the prompt template."""
+        return self.prompt_template.format(**values) if values else self.prompt_template
+
+    def generation_config(self, max_output_tokens: int):
+        """
+        Return the GenerationConfig for this stage, built once per output budget.
+
+        The Vertex AI SDK is imported here, on first use, to keep it off the startup path.
+        """
+        config = self._generation_configs.get(max_output_tokens)
+        if config is None:
+            from vertexai.generative_models import GenerationConfig
+
+            config = GenerationConfig(
+                max_output_tokens=max_output_tokens,
+                temperature=self.temperature,
+                top_p=self.top_p,
+                response_mime_type="application/json",
+                response_schema=self.response_schema
+            )
+            self._generation_configs[max_output_tokens] = config
+        return config
+
+
+# Catalog fields in output order: (API alias, response schema, prompt line)
+CATALOG_FIELDS = {
+    "Nome do Produto": ("name", {"type": "STRING"}, "Nome do Produto"),
+    "Marca": ("brand", {"type": "STRING"}, "Marca (se visível)"),
+    "Categoria": ("category", {"type": "STRING"}, "Categoria"),
+    "Subcategoria": ("subcategory", {"type": "STRING"}, "Subcategoria"),
+    "Descrição Curta": ("short_description", {"type": "STRING"}, "Descrição Curta (50-60 palavras)"),
+    "Descrição Longa": ("long_description", {"type": "STRING"}, "Descrição Longa (100-150 palavras)"),
+    "Características Principais": (
+        "features",
+        {
+            "type": "ARRAY",
+            "items": {"type": "STRING"},
+            "minItems": 3
+        },
+        "Características Principais (mínimo 3 características)"
+    ),
+    "Especificações Técnicas": (
+        "specifications",
+        {
+            "type": "OBJECT",
+            "properties": {
+                "Material": {"type": "STRING"},
+                "Modelo": {"type": "STRING"},
+                "Fabricante": {"type": "STRING"},
+                "País de Origem": {"type": "STRING"},
+                "Garantia": {"type": "STRING"},
+                "Certificações": {"type": "STRING"}
+            }
+        },
+        "Especificações Técnicas (incluindo material, modelo, fabricante, país de origem, garantia e certificações)"
+    ),
+    "Dimensões": (
+        "dimensions",
+        {
+            "type": "OBJECT",
+            "properties": {
+                "Altura": {"type": "STRING"},
+                "Largura": {"type": "STRING"},
+                "Profundidade": {"type": "STRING"},
+                "Peso": {"type": "STRING"}
+            }
+        },
+        "Dimensões (altura, largura, profundidade e peso)"
+    ),
+    "Opções de Cores": (
+        "colors",
+        {
+            "type": "ARRAY",
+            "items": {"type": "STRING"},
+            "minItems": 1
+        },
+        "Opções de Cores (mínimo 1 cor)"
+    ),
+    "Faixa de Preço Sugerida": ("price_range", {"type": "STRING"}, "Faixa de Preço Sugerida"),
+    "Público-Alvo": ("audience", {"type": "STRING"}, "Público-Alvo"),
+    "Palavras-chave SEO": (
+        "seo_keywords",
+        {
+            "type": "ARRAY",
+            "items": {"type": "STRING"},
+            "minItems": 3
+        },
+        "Palavras-chave SEO (mínimo 3 palavras-chave)"
+    ),
+    "Tags de Busca": (
+        "tags",
+        {
+            "type": "ARRAY",
+            "items": {"type": "STRING"},
+            "minItems": 3
+        },
+        "Tags de Busca (mínimo 3 tags)"
+    ),
+}
+
+CATALOG_REQUIRED_FIELDS = [
+    "Nome do Produto",
+    "Categoria",
+    "Descrição Curta",
+    "Descrição Longa",
+    "Características Principais"
+]
+
+# Catalog fields the reviews stage reads; always generated so reviews stay grounded
+REVIEW_INPUT_FIELDS = ["Nome do Produto", "Descrição Curta", "Características Principais"]
+
+CATALOG_FIELD_ALIASES = {alias: name for name, (alias, _, _) in CATALOG_FIELDS.items()}
+
+
+def resolve_catalog_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """
+    Parse a comma-separated field selection into catalog field names.
+
+    Accepts either the catalog field names or their API aliases (e.g. "name",
+    "short_description"). The fields the reviews stage needs are always added.
+
+    Args:
+        fields: Comma-separated selection, or None for every field
+
+    Returns:
+        tuple: Selected field names in catalog order, or None for every field
+
+    Raises:
+        ValueError: If a field is unknown
+    """
+    if not fields:
+        return None
+
+    selected = set(REVIEW_INPUT_FIELDS)
+    for field in (f.strip() for f in fields.split(",")):
+        if not field:
+            continue
+        name = CATALOG_FIELD_ALIASES.get(field, field)
+        if name not in CATALOG_FIELDS:
+            raise ValueError(f"Unknown catalog field: {field}")
+        selected.add(name)
+
+    if len(selected) == len(CATALOG_FIELDS):
+        return None
+    return tuple(name for name in CATALOG_FIELDS if name in selected)
+
+
+def catalog_field_lines(names) -> str:
+    """Return the numbered list of catalog fields the prompts ask for."""
+    return "\n".join(
+        f"{number}. {CATALOG_FIELDS[name][2]}" for number, name in enumerate(names, start=1)
+    )
+
+
+@functools.lru_cache(maxsize=128)
+def catalog_prompt(fields: Optional[Tuple[str, ...]] = None) -> PromptDefinition:
+    """
+    Build the catalog stage definition for a field selection.
+
+    Variants are cached, so each selection is compiled once per process.
+    Callers must not mutate the returned schema.
+
+    Args:
+        fields: Field names to request, or None for every field
+
+    Returns:
+        PromptDefinition: The catalog prompt, schema and settings
+    """
+    names = list(fields or CATALOG_FIELDS)
+
+    catalog_schema = {
+        "type": "OBJECT",
+        "properties": {name: CATALOG_FIELDS[name][1] for name in names},
+        "required": [name for name in CATALOG_REQUIRED_FIELDS if name in names],
+        "propertyOrdering": names
+    }
+
+    prompt_text = f"""Gere uma entrada detalhada de catálogo de e-commerce para este item em português. Inclua:
+
+{catalog_field_lines(names)}
+
+A saída deve seguir estritamente o schema JSON fornecido.
+"""
+    return PromptDefinition("catalog", prompt_text, catalog_schema, temperature=0.1)
+
+
+# Where a detected product is in the image: [ymin, xmin, ymax, xmax], normalized to 0-1000
+BOUNDING_BOX_FIELD = "caixa_delimitadora"
+
+
+@functools.lru_cache(maxsize=128)
+def detection_prompt(fields: Optional[Tuple[str, ...]] = None, max_products: int = 20) -> PromptDefinition:
+    """
+    Build the multi-product stage definition: every product in one image, each
+    with its bounding box and a catalog entry for a field selection.
+
+    Args:
+        fields: Catalog field names to request per product, or None for every field
+        max_products: Most products the response may list
+
+    Returns:
+        PromptDefinition: The detection prompt, schema and settings
+    """
+    catalog = catalog_prompt(fields)
+    product_schema = {
+        "type": "OBJECT",
+        "properties": {
+            BOUNDING_BOX_FIELD: {
+                "type": "ARRAY",
+                "items": {"type": "INTEGER", "minimum": 0, "maximum": 1000},
+                "minItems": 4,
+                "maxItems": 4
+            },
+            **catalog.response_schema["properties"]
+        },
+        "required": [BOUNDING_BOX_FIELD, *catalog.response_schema["required"]],
+        "propertyOrdering": [BOUNDING_BOX_FIELD, *catalog.response_schema["propertyOrdering"]]
+    }
+    detection_schema = {
+        "type": "OBJECT",
+        "properties": {
+            "produtos": {"type": "ARRAY", "items": product_schema, "maxItems": max_products}
+        },
+        "required": ["produtos"],
+        "propertyOrdering": ["produtos"]
+    }
+
+    prompt_text = f"""Esta imagem mostra um ou mais produtos. Identifique cada produto visível (no máximo {max_products}) e gere, para cada um, uma entrada detalhada de catálogo de e-commerce em português.
+
+Para cada produto, inclua a caixa delimitadora do produto na imagem ({BOUNDING_BOX_FIELD}), no formato [ymin, xmin, ymax, xmax] com coordenadas normalizadas de 0 a 1000, e:
+
+{catalog_field_lines(catalog.response_schema["propertyOrdering"])}
+
+A saída deve seguir estritamente o schema JSON fornecido.
+"""
+    return PromptDefinition("detection", prompt_text, detection_schema, temperature=0.1)
+
+
+# Prepended to the catalog prompt when a product is shown in several images
+MULTI_IMAGE_TEMPLATE = "As {quantidade} imagens acima mostram o mesmo item, de ângulos diferentes.\n\n"
+
+
+def image_count_note(image_count: int) -> str:
+    """Return the text telling the model several images show one product ("" for one image)."""
+    return MULTI_IMAGE_TEMPLATE.format(quantidade=image_count) if image_count > 1 else ""
+
+
+# Prepended to a catalog prompt narrowed to the fields a response got wrong, so a
+# follow-up call regenerates only those and stays consistent with the rest
+CATALOG_REPAIR_TEMPLATE = """Estes campos já foram gerados para o mesmo item:
+
+{entrada}
+
+Agora gere apenas os campos listados a seguir, de forma coerente com a entrada acima.
+
+"""
+
+
+def render_catalog_repair_prompt(fields: Tuple[str, ...], catalog_info: Dict) -> Tuple[PromptDefinition, str]:
+    """
+    Build the follow-up prompt that regenerates only some catalog fields.
+
+    Args:
+        fields: Field names to regenerate, in catalog order
+        catalog_info: The fields already generated correctly
+
+    Returns:
+        tuple: (PromptDefinition of the narrowed catalog stage, prompt text)
+    """
+    definition = catalog_prompt(fields)
+    context = CATALOG_REPAIR_TEMPLATE.format(
+        entrada=json.dumps(catalog_info, ensure_ascii=False, indent=2)
+    )
+    return definition, context + definition.render()
+
+
+REVIEWS_PROMPT = PromptDefinition(
+    "reviews",
+    """Com base nas informações do produto abaixo, gere 5 avaliações realistas de usuários em português.
+    Cada avaliação deve incluir:
+    1. Nome do usuário
+    2. Classificação (1-5 estrelas)
+    3. Título da avaliação
+    4. Texto da avaliação (2-3 frases)
+    5. Data (formato YYYY-MM-DD, últimos 30 dias)
+    6. Prós (mínimo 1) e Contras (opcional)
+
+    Informações do Produto:
+    Nome: {nome}
+    Descrição: {descricao}
+    Características: {caracteristicas}
+
+    A saída deve seguir estritamente o schema JSON fornecido.
+    """,
+    {
+        "type": "OBJECT",
+        "properties": {
+            "reviews": {
+                "type": "ARRAY",
+                "items": {
+                    "type": "OBJECT",
+                    "properties": {
+                        "nome": {"type": "STRING"},
+                        "estrelas": {"type": "INTEGER", "minimum": 1, "maximum": 5},
+                        "titulo": {"type": "STRING"},
+                        "texto": {"type": "STRING"},
+                        "data": {"type": "STRING", "format": "date"},
+                        "pros": {"type": "ARRAY", "items": {"type": "STRING"}, "minItems": 1},
+                        "contras": {"type": "ARRAY", "items": {"type": "STRING"}}
+                    },
+                    "required": ["nome", "estrelas", "titulo", "texto", "data", "pros"]
+                },
+                "minItems": 5,
+                "maxItems": 5
+            }
+        },
+        "required": ["reviews"],
+        "propertyOrdering": ["reviews"]
+    },
+    temperature=0.7
+)
+
+SUMMARY_PROMPT = PromptDefinition(
+    "summary",
+    """Com base nas avaliações abaixo, gere um resumo conciso em português que destaque:
+    1. Pontos fortes mais mencionados (mínimo 3)
+    2. Principais críticas (se houver)
+    3. Sentimento geral dos usuários
+    4. Recomendações para potenciais compradores
+
+    Avaliações:
+    {avaliacoes}
+
+    A saída deve seguir estritamente o schema JSON fornecido.
+    """,
+    {
+        "type": "OBJECT",
+        "properties": {
+            "pontos_fortes": {
+                "type": "ARRAY",
+                "items": {"type": "STRING"},
+                "minItems": 3
+            },
+            "criticas": {
+                "type": "ARRAY",
+                "items": {"type": "STRING"}
+            },
+            "sentimento_geral": {"type": "STRING"},
+            "recomendacoes": {"type": "STRING"}
+        },
+        "required": ["pontos_fortes", "criticas", "sentimento_geral", "recomendacoes"],
+        "propertyOrdering": ["pontos_fortes", "criticas", "sentimento_geral", "recomendacoes"]
+    },
+    temperature=0.3
+)
+
+
+# Sharded reviews: the same five reviews split by reviewer profile, each group generated
+# by its own shorter call, in parallel: (profile, number of reviews)
+REVIEW_SHARDS = (
+    ("compradores práticos, atentos ao custo-benefício e ao uso no dia a dia", 2),
+    ("usuários exigentes, atentos à qualidade, ao acabamento e ao desempenho", 2),
+    ("pessoas que compraram o produto para presentear", 1),
+)
+
+REVIEW_SHARD_TEMPLATE = """Com base nas informações do produto abaixo, gere {quantidade} avaliação(ões) realista(s) de usuários em português,
+    escritas por {perfil}. A classificação deve refletir a experiência de cada usuário.
+    Cada avaliação deve incluir:
+    1. Nome do usuário
+    2. Classificação (1-5 estrelas)
+    3. Título da avaliação
+    4. Texto da avaliação (2-3 frases)
+    5. Data (formato YYYY-MM-DD, últimos 30 dias)
+    6. Prós (mínimo 1) e Contras (opcional)
+
+    Informações do Produto:
+    Nome: {nome}
+    Descrição: {descricao}
+    Características: {caracteristicas}
+
+    A saída deve seguir estritamente o schema JSON fornecido.
+    """
+
+
+@functools.lru_cache(maxsize=16)
+def review_shard_prompt(count: int) -> PromptDefinition:
+    """Return the prompt definition of a reviews shard, once per review count."""
+    reviews_schema = dict(REVIEWS_PROMPT.response_schema["properties"]["reviews"], minItems=count, maxItems=count)
+    return PromptDefinition(
+        "reviews_shard",
+        REVIEW_SHARD_TEMPLATE,
+        {
+            "type": "OBJECT",
+            "properties": {"reviews": reviews_schema},
+            "required": ["reviews"],
+            "propertyOrdering": ["reviews"]
+        },
+        temperature=REVIEWS_PROMPT.temperature,
+        top_p=REVIEWS_PROMPT.top_p
+    )
+
+
+BATCH_REVIEWS_PROMPT = PromptDefinition(
+    "batch_reviews",
+    """Para cada produto da lista abaixo, gere 5 avaliações realistas de usuários em português e um resumo dessas avaliações.
+    Cada avaliação deve incluir:
+    1. Nome do usuário
+    2. Classificação (1-5 estrelas)
+    3. Título da avaliação
+    4. Texto da avaliação (2-3 frases)
+    5. Data (formato YYYY-MM-DD, últimos 30 dias)
+    6. Prós (mínimo 1) e Contras (opcional)
+
+    O resumo de cada produto deve destacar:
+    1. Pontos fortes mais mencionados (mínimo 3)
+    2. Principais críticas (se houver)
+    3. Sentimento geral dos usuários
+    4. Recomendações para potenciais compradores
+
+    Responda com um item por produto, usando o mesmo "id" da lista.
+
+    Produtos:
+    {produtos}
+
+    A saída deve seguir estritamente o schema JSON fornecido.
+    """,
+    {
+        "type": "OBJECT",
+        "properties": {
+            "produtos": {
+                "type": "ARRAY",
+                "items": {
+                    "type": "OBJECT",
+                    "properties": {
+                        "id": {"type": "STRING"},
+                        "reviews": REVIEWS_PROMPT.response_schema["properties"]["reviews"],
+                        "resumo": SUMMARY_PROMPT.response_schema
+                    },
+                    "required": ["id", "reviews", "resumo"],
+                    "propertyOrdering": ["id", "reviews", "resumo"]
+                }
+            }
+        },
+        "required": ["produtos"],
+        "propertyOrdering": ["produtos"]
+    },
+    temperature=0.7
+)
+
+
+def render_reviews_prompt(product_info: Dict) -> str:
+    """Fill the reviews prompt from a catalog entry."""
+    return REVIEWS_PROMPT.render(
+        nome=product_info.get('Nome do Produto', ''),
+        descricao=product_info.get('Descrição Curta', ''),
+        caracteristicas=product_info.get('Características Principais', [])
+    )
+
+
+def render_review_shard_prompts(product_info: Dict) -> List[Tuple[PromptDefinition, str]]:
+    """Return the (definition, prompt text) of every reviews shard (REVIEW_SHARDS) for a catalog entry."""
+    return [
+        (
+            review_shard_prompt(count),
+            review_shard_prompt(count).render(
+                quantidade=count,
+                perfil=profile,
+                nome=product_info.get('Nome do Produto', ''),
+                descricao=product_info.get('Descrição Curta', ''),
+                caracteristicas=product_info.get('Características Principais', [])
+            )
+        )
+        for profile, count in REVIEW_SHARDS
+    ]
+
+
+def merge_review_shards(shards: List[Any]) -> Dict[str, List]:
+    """
+    Merge the reviews of every shard into one reviews response, in shard order.
+
+    Reviews repeating the title or text of an earlier one (ignoring case and
+    spacing) are dropped, so the result may come out short; it is then up to
+    schema validation to reject it.
+
+    Args:
+        shards: Parsed response of each shard
+
+    Returns:
+        dict: The merged reviews under the "reviews" key
+    """
+    def normalized(value: Any) -> str:
+        return " ".join(str(value or "").lower().split())
+
+    merged = []
+    seen = set()
+    for shard in shards:
+        reviews = shard.get("reviews", []) if isinstance(shard, dict) else []
+        for review in reviews:
+            if not isinstance(review, dict):
+                continue
+            keys = {("titulo", normalized(review.get("titulo"))), ("texto", normalized(review.get("texto")))}
+            if keys & seen:
+                continue
+            seen.update(keys)
+            merged.append(review)
+    return {"reviews": merged}
+
+
+def render_summary_prompt(reviews_data: Dict) -> str:
+    """Fill the summary prompt from generated reviews."""
+    return SUMMARY_PROMPT.render(avaliacoes=json.dumps(reviews_data, ensure_ascii=False, indent=2))
+
+
+def render_batch_reviews_prompt(products: Dict[str, Dict]) -> str:
+    """Fill the batched reviews prompt from catalog entries keyed by product id."""
+    listing = [
+        {
+            "id": product_id,
+            "nome": product_info.get('Nome do Produto', ''),
+            "descricao": product_info.get('Descrição Curta', ''),
+            "caracteristicas": product_info.get('Características Principais', [])
+        }
+        for product_id, product_info in products.items()
+    ]
+    return BATCH_REVIEWS_PROMPT.render(produtos=json.dumps(listing, ensure_ascii=False, indent=2))
+
+
+# Share of the output budget a review batch is planned to fill; the rest absorbs
+# products whose reviews come out longer than usual
+BATCH_OUTPUT_HEADROOM = 0.8
+
+
+def review_batch_size(output_budget: int, tokens_per_product: float, max_batch_size: int) -> int:
+    """
+    Return how many products to review per batched call.
+
+    Args:
+        output_budget: max_output_tokens of the batched reviews call
+        tokens_per_product: Expected output tokens of one product's reviews and summary
+        max_batch_size: Upper bound, whatever the budget allows
+
+    Returns:
+        int: Products per batch, at least 1
+    """
+    fits = int(output_budget * BATCH_OUTPUT_HEADROOM // max(tokens_per_product, 1))
+    return max(1, min(max_batch_size, fits))
+
+
+def split_batch_reviews(batch_data: Any) -> Dict[str, Dict]:
+    """
+    Split a batched reviews response back per product.
+
+    Returns:
+        dict: {"reviews": [...], "summary": {...}} keyed by product id, for every
+            product the response covers
+    """
+    items = batch_data.get("produtos", []) if isinstance(batch_data, dict) else []
+    return {
+        str(item["id"]): {"reviews": item.get("reviews"), "summary": item.get("resumo")}
+        for item in items
+        if isinstance(item, dict) and "id" in item
+    }
+
+
+def pipeline_version(fields: Optional[Tuple[str, ...]] = None,
+                     models: Optional[Dict[str, Tuple[str, ...]]] = None,
+                     max_products: int = 20, sharded_reviews: bool = False) -> str:
+    """
+    Return the version stamp of the whole pipeline for a catalog field selection.
+
+    Changes whenever the models or any stage's prompt, schema or settings change,
+    so it is safe to use in cache keys and to record next to generated catalogs.
+
+    Args:
+        fields: Catalog field names requested, or None for every field
+        models: Model tiers per stage, or None when every stage uses MODEL_NAME
+        max_products: Product limit of the multi-product detection prompt
+        sharded_reviews: Whether reviews are generated in shards (REVIEW_SHARDS)
+    """
+    shards = [fingerprint([REVIEW_SHARDS, REVIEW_SHARD_TEMPLATE])] if sharded_reviews else []
+    return fingerprint([
+        MODEL_NAME if models is None else {stage: list(tiers) for stage, tiers in models.items()},
+        catalog_prompt(fields).fingerprint,
+        fingerprint([CATALOG_REPAIR_TEMPLATE, MULTI_IMAGE_TEMPLATE]),
+        detection_prompt(fields, max_products).fingerprint,
+        REVIEWS_PROMPT.fingerprint,
+        SUMMARY_PROMPT.fingerprint,
+        BATCH_REVIEWS_PROMPT.fingerprint,
+    ] + shards)
+
+
+PIPELINE_VERSION = pipeline_version()
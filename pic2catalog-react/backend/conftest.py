@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# main.py opens the shared store at import; keep the tests' store out of the real one
+os.environ.setdefault("SHARED_STORE_PATH", os.path.join(tempfile.mkdtemp(), "shared_store.db"))
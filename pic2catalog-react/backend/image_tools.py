@@ -0,0 +1,114 @@
+import math
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+# Image intake: size and frame checks read only the header, before any pixel is
+# decoded, and oversized images are downscaled while they are decoded.
+
+
+class ImageRejectedError(ValueError):
+    """
+    Raised when an image fails the pre-decode size checks.
+
+    reason is "pixels", "frames" or "decompression_bomb"; for the first two,
+    value and limit hold the offending number and the configured limit, so
+    callers can word the error for their own users.
+    """
+
+    def __init__(self, message: str, reason: str = "decompression_bomb",
+                 value: Optional[int] = None, limit: Optional[int] = None):
+        super().__init__(message)
+        self.reason = reason
+        self.value = value
+        self.limit = limit
+
+
+def probe_image(image: Image.Image) -> Dict[str, Any]:
+    """
+    Read format, dimensions and frame count from an opened image.
+
+    Image.open only parses the header, so this never touches pixel data.
+
+    Args:
+        image: Image returned by Image.open, not yet loaded
+
+    Returns:
+        dict: format, width, height and frames
+    """
+    width, height = image.size
+    return {
+        "format": image.format,
+        "width": width,
+        "height": height,
+        "frames": getattr(image, "n_frames", 1)
+    }
+
+
+def check_image_limits(probe: Dict[str, Any], max_pixels: int, max_frames: int) -> None:
+    """
+    Reject images whose header describes more pixels or frames than allowed.
+
+    Args:
+        probe: Result of probe_image
+        max_pixels: Maximum width x height
+        max_frames: Maximum number of frames (animations, multi-page files)
+
+    Raises:
+        ImageRejectedError: If a limit is exceeded
+    """
+    pixels = probe["width"] * probe["height"]
+    if pixels > max_pixels:
+        raise ImageRejectedError(
+            f"Image is {probe['width']}x{probe['height']} ({pixels} pixels); the limit is {max_pixels} pixels",
+            reason="pixels", value=pixels, limit=max_pixels
+        )
+    if probe["frames"] > max_frames:
+        raise ImageRejectedError(
+            f"Image has {probe['frames']} frames; the limit is {max_frames}",
+            reason="frames", value=probe["frames"], limit=max_frames
+        )
+
+
+def flatten_to_rgb(image: Image.Image, background=(255, 255, 255)) -> Image.Image:
+    """
+    Convert an image to RGB, compositing any transparency onto a white background.
+
+    A plain convert("RGB") drops the alpha channel, which turns transparent
+    product cut-outs into objects on black.
+    """
+    if image.mode == "RGB":
+        return image
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        rgba = image.convert("RGBA")
+        flattened = Image.new("RGB", rgba.size, background)
+        flattened.paste(rgba, mask=rgba.getchannel("A"))
+        return flattened
+    return image.convert("RGB")
+
+
+def downscale_to_budget(image: Image.Image, pixel_budget: int) -> Image.Image:
+    """
+    Shrink an image to fit a pixel budget, keeping its aspect ratio.
+
+    For JPEGs the decoder is asked to decode at a reduced scale, so the
+    full-resolution pixels are never materialized. Transparency is composited
+    onto white (see flatten_to_rgb).
+
+    Args:
+        image: Opened image
+        pixel_budget: Maximum number of pixels in the result
+
+    Returns:
+        Image.Image: The image itself if it already fits, otherwise a downscaled RGB copy
+    """
+    width, height = image.size
+    if width * height <= pixel_budget:
+        return image
+
+    scale = math.sqrt(pixel_budget / (width * height))
+    target_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    image.draft("RGB", target_size)
+    image = flatten_to_rgb(image)
+    image.thumbnail(target_size, Image.LANCZOS)
+    return image
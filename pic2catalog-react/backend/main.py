@@ -1,27 +1,61 @@
 import os
 import io
-import json
 import logging
-import re
-from fastapi import FastAPI, File, UploadFile, HTTPException
+import functools
+import hashlib
+import hmac
+import heapq
+import itertools
+import asyncio
+import math
+import threading
+import time
+import contextlib
+import contextvars
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import Depends, FastAPI, File, UploadFile, HTTPException, Request, Header
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from PIL import Image
 from dotenv import load_dotenv
-from typing import Union, List, Any, Dict, Optional
-from google.api_core.exceptions import ResourceExhausted
+from typing import Annotated, Union, List, Any, Dict, Optional, Tuple, Type, TYPE_CHECKING
+from types import SimpleNamespace
 import random
 from datetime import datetime, timedelta
-from pydantic import BaseModel
-
-import vertexai
-from vertexai.generative_models import (
-    GenerationConfig,
-    GenerativeModel,
-    HarmCategory,
-    Part,
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, create_model
+from starlette.concurrency import run_in_threadpool
+
+from shared_store import SharedStore
+from catalog_registry import (
+    BATCH_REVIEWS_PROMPT,
+    BOUNDING_BOX_FIELD,
+    CATALOG_FIELDS,
+    MODEL_NAME,
+    REVIEWS_PROMPT,
+    SUMMARY_PROMPT,
+    catalog_prompt,
+    detection_prompt,
+    fingerprint,
+    image_count_note,
+    merge_review_shards,
+    pipeline_version,
+    render_batch_reviews_prompt,
+    render_catalog_repair_prompt,
+    render_review_shard_prompts,
+    render_reviews_prompt,
+    render_summary_prompt,
+    resolve_catalog_fields,
+    review_batch_size,
+    split_batch_reviews,
 )
-import vertexai.generative_models as generative_models
+from response_json import clean_json_response
+from image_tools import ImageRejectedError, probe_image, check_image_limits, downscale_to_budget, flatten_to_rgb
+from vertex_sdk import vertex_sdk
+from call_timeouts import ModelCallTimeout, call_with_timeout
+
+if TYPE_CHECKING:
+    from vertexai.generative_models import GenerationConfig, GenerativeModel, Part
 
 # Import tenacity for retry logic
 from tenacity import retry, stop_after_attempt, wait_exponential
@@ -33,6 +67,189 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Upload limits
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+# Slack for the multipart boundary and part headers around the file itself
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+# Images of one product (e.g. several angles) sent in a single catalog call;
+# together they share IMAGE_PIXEL_BUDGET
+MAX_IMAGES_PER_PRODUCT = int(os.environ.get("MAX_IMAGES_PER_PRODUCT", 6))
+# Products listed at most in multi-product mode (one shelf or flat-lay photo)
+MAX_PRODUCTS_PER_IMAGE = int(os.environ.get("MAX_PRODUCTS_PER_IMAGE", 20))
+
+# Image formats the model accepts as-is, without re-encoding
+MODEL_IMAGE_MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+}
+
+# Decompression-bomb guard: reject images above MAX_IMAGE_PIXELS,
+# downscale anything above IMAGE_PIXEL_BUDGET before sending it to the model
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", 50_000_000))
+IMAGE_PIXEL_BUDGET = int(os.environ.get("IMAGE_PIXEL_BUDGET", 4_000_000))
+MAX_IMAGE_FRAMES = int(os.environ.get("MAX_IMAGE_FRAMES", 50))
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# Image processing pool: "thread" (default) or "process"
+IMAGE_WORKER_MODE = os.environ.get("IMAGE_WORKER_MODE", "thread").lower()
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", os.cpu_count() or 2))
+IMAGE_CONCURRENCY = int(os.environ.get("IMAGE_CONCURRENCY", IMAGE_WORKERS))
+
+# Optional warm-up at startup: pre-create region clients and, with WARMUP_PROBE,
+# send a tiny request per region to seed latency stats. /readyz reports 503 until done.
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "false").lower() in ("1", "true", "yes")
+WARMUP_PROBE = os.environ.get("WARMUP_PROBE", "false").lower() in ("1", "true", "yes")
+WARMUP_RETRY_SECONDS = int(os.environ.get("WARMUP_RETRY_SECONDS", 30))
+
+# Generated results are cached per image content hash in the store shared by all workers
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get("RESULT_CACHE_TTL_SECONDS", 3600))
+
+# Pipeline stages, in order; each one's result is checkpointed so retries resume after it
+PIPELINE_STAGES = ("catalog", "reviews", "summary")
+# Stages of multi-product mode: detect and catalog every product, then review them in one batch
+MULTI_PRODUCT_STAGES = ("detection", "batch_reviews")
+# Checkpoints only serve retries of a failed run; a completed run deletes them
+CHECKPOINT_TTL_SECONDS = int(os.environ.get("CHECKPOINT_TTL_SECONDS", 24 * 3600))
+
+# Output token budget per pipeline stage. With OUTPUT_BUDGET_AUTOTUNE, a stage's budget
+# drops to the one suggested by observed usage once enough calls have been recorded
+STAGE_OUTPUT_BUDGETS = {
+    "catalog": int(os.environ.get("CATALOG_MAX_OUTPUT_TOKENS", 8192)),
+    "reviews": int(os.environ.get("REVIEWS_MAX_OUTPUT_TOKENS", 8192)),
+    "reviews_shard": int(os.environ.get("REVIEWS_SHARD_MAX_OUTPUT_TOKENS", 4096)),
+    "summary": int(os.environ.get("SUMMARY_MAX_OUTPUT_TOKENS", 8192)),
+    "catalog_repair": int(os.environ.get("CATALOG_REPAIR_MAX_OUTPUT_TOKENS", 4096)),
+    "detection": int(os.environ.get("DETECTION_MAX_OUTPUT_TOKENS", 8192)),
+    "batch_reviews": int(os.environ.get("BATCH_REVIEWS_MAX_OUTPUT_TOKENS", 8192)),
+}
+OUTPUT_BUDGET_AUTOTUNE = os.environ.get("OUTPUT_BUDGET_AUTOTUNE", "false").lower() in ("1", "true", "yes")
+OUTPUT_BUDGET_MIN_SAMPLES = int(os.environ.get("OUTPUT_BUDGET_MIN_SAMPLES", 50))
+
+
+
+def parse_pairs(value: str) -> Dict[str, str]:
+    """Parse a comma-separated list of name=value pairs."""
+    return {
+        name.strip(): setting.strip()
+        for name, setting in (pair.split("=", 1) for pair in value.split(",") if pair.strip())
+    }
+
+
+def parse_model_tiers(value: str) -> Tuple[str, ...]:
+    """Parse a comma-separated list of model names, cheapest tier first."""
+    return tuple(name.strip() for name in value.split(",") if name.strip()) or (MODEL_NAME,)
+
+
+# Models per pipeline stage, cheapest first. With several tiers, a stage runs on
+# the first one and escalates to the next only when the output fails validation.
+STAGE_MODELS = {
+    "catalog": parse_model_tiers(os.environ.get("CATALOG_MODELS", MODEL_NAME)),
+    "reviews": parse_model_tiers(os.environ.get("REVIEWS_MODELS", MODEL_NAME)),
+    "summary": parse_model_tiers(os.environ.get("SUMMARY_MODELS", MODEL_NAME)),
+}
+# Multi-product mode defaults to the catalog and reviews models
+STAGE_MODELS["detection"] = parse_model_tiers(os.environ.get("DETECTION_MODELS", ",".join(STAGE_MODELS["catalog"])))
+STAGE_MODELS["batch_reviews"] = parse_model_tiers(
+    os.environ.get("BATCH_REVIEWS_MODELS", ",".join(STAGE_MODELS["reviews"]))
+)
+
+# Batched reviews: products per call are sized so the expected output fits the
+# batch_reviews budget, up to BATCH_REVIEWS_MAX_SIZE. Until enough single-product
+# reviews and summaries were observed, one product is expected to need
+# BATCH_REVIEWS_TOKENS_PER_PRODUCT output tokens.
+BATCH_REVIEWS_MAX_SIZE = int(os.environ.get("BATCH_REVIEWS_MAX_SIZE", 8))
+BATCH_REVIEWS_TOKENS_PER_PRODUCT = int(os.environ.get("BATCH_REVIEWS_TOKENS_PER_PRODUCT", 1500))
+# Review coalescing: single-product requests of these priority classes (comma-separated;
+# empty disables it) get their reviews from batched calls shared with the tenant's other
+# requests arriving within REVIEW_COALESCE_WINDOW_SECONDS, so a bulk import through
+# /generate_catalog pays one reviews call per batch instead of two calls per product
+REVIEW_COALESCE_PRIORITIES = tuple(
+    priority.strip() for priority in os.environ.get("REVIEW_COALESCE_PRIORITIES", "batch,backfill").split(",")
+    if priority.strip()
+)
+REVIEW_COALESCE_WINDOW_SECONDS = float(os.environ.get("REVIEW_COALESCE_WINDOW_SECONDS", 2.0))
+
+# Sharded reviews: the reviews stage runs as parallel, shorter calls, one per reviewer
+# profile, merged and de-duplicated. Costs some extra prompt tokens, but the stage
+# takes as long as its slowest shard instead of one long generation. REVIEWS_SHARDED
+# is the default of the sharded_reviews request option.
+REVIEWS_SHARDED = os.environ.get("REVIEWS_SHARDED", "false").lower() in ("1", "true", "yes")
+REVIEW_SHARD_WORKERS = int(os.environ.get("REVIEW_SHARD_WORKERS", 16))
+
+# Follow-up calls that regenerate only the catalog fields failing validation,
+# before the catalog stage gives up
+CATALOG_REPAIR_ATTEMPTS = int(os.environ.get("CATALOG_REPAIR_ATTEMPTS", 1))
+
+# Idempotency-Key handling: how long outcomes are kept for replay, how long an
+# in-progress marker survives a crashed worker, and how long a repeat waits for
+# a run happening in another worker before getting 409
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", 24 * 3600))
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", 600))
+IDEMPOTENCY_WAIT_SECONDS = int(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", 60))
+
+# Per-attempt model call timeouts in seconds, (connect, read), for calls carrying images
+# and for text-only calls. A region's first call to a model also sets up its channel, so
+# it gets the connect timeout on top of the read timeout. A timed-out attempt counts as
+# a region failure and the call moves on to the next region right away.
+MODEL_CALL_TIMEOUTS = {
+    "image": (
+        float(os.environ.get("IMAGE_CONNECT_TIMEOUT_SECONDS", 10)),
+        float(os.environ.get("IMAGE_READ_TIMEOUT_SECONDS", 120)),
+    ),
+    "text": (
+        float(os.environ.get("TEXT_CONNECT_TIMEOUT_SECONDS", 10)),
+        float(os.environ.get("TEXT_READ_TIMEOUT_SECONDS", 60)),
+    ),
+}
+# Threads running model calls under a timeout; a timed-out call keeps its thread until it returns
+MODEL_CALL_WORKERS = int(os.environ.get("MODEL_CALL_WORKERS", 64))
+
+# Model calls run at once per worker process (0 disables the limit). When all slots are
+# busy, waiting calls are admitted in weighted fair order across priority classes, so
+# interactive requests overtake queued bulk jobs; weights are class=weight pairs
+MODEL_CONCURRENCY = int(os.environ.get("MODEL_CONCURRENCY", 16))
+PRIORITY_WEIGHTS = {
+    name: float(weight)
+    for name, weight in parse_pairs(os.environ.get("PRIORITY_WEIGHTS", "interactive=8,batch=2,backfill=1")).items()
+}
+DEFAULT_PRIORITY = os.environ.get("DEFAULT_PRIORITY", "interactive")
+
+# Tenants, as api_key=tenant pairs. When set, every request must send a known key in
+# the X-API-Key header; otherwise all requests belong to DEFAULT_TENANT.
+TENANT_API_KEYS = parse_pairs(os.environ.get("TENANT_API_KEYS", ""))
+DEFAULT_TENANT = "default"
+# With tenants, GET /usage shows each tenant only its own counters; the process-wide
+# sections (stages, cascade, scheduler) need this key in the X-Admin-Key header
+USAGE_ADMIN_API_KEY = os.environ.get("USAGE_ADMIN_API_KEY", "")
+# Per-tenant limits: requests in progress per worker process, and requests per minute
+# across all workers (0 disables either). TENANT_LIMITS overrides them per tenant as
+# tenant=concurrency/requests_per_minute pairs, e.g. "loja-a=8/120,loja-b=2/30"
+TENANT_MAX_CONCURRENCY = int(os.environ.get("TENANT_MAX_CONCURRENCY", 0))
+TENANT_REQUESTS_PER_MINUTE = float(os.environ.get("TENANT_REQUESTS_PER_MINUTE", 0))
+TENANT_RATE_LIMIT_BURST = float(os.environ.get("TENANT_RATE_LIMIT_BURST", 10))
+TENANT_LIMITS = {
+    tenant: (int(concurrency), float(requests_per_minute))
+    for tenant, (concurrency, requests_per_minute) in (
+        (tenant, limits.split("/", 1)) for tenant, limits in parse_pairs(os.environ.get("TENANT_LIMITS", "")).items()
+    )
+}
+
+# How often a request waiting on the model checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = float(os.environ.get("DISCONNECT_POLL_SECONDS", 1.0))
+# Threads running request pipelines per priority class, i.e. requests of a class in progress
+# per worker process. Each class has its own threads, so a bulk backlog never holds the ones
+# interactive requests need; keep it above MODEL_CONCURRENCY so the model call scheduler
+# has queued calls to order
+PIPELINE_WORKERS = int(os.environ.get("PIPELINE_WORKERS", 64))
+
+# Gemini calls allowed per minute across all workers on this host (0 disables the limit)
+GEMINI_REQUESTS_PER_MINUTE = float(os.environ.get("GEMINI_REQUESTS_PER_MINUTE", 0))
+GEMINI_RATE_LIMIT_BURST = float(os.environ.get("GEMINI_RATE_LIMIT_BURST", 10))
+
+shared_store = SharedStore()
+
 # Init FastAPI
 app = FastAPI(
     title="Pic2Catalog API",
@@ -40,7 +257,73 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Add CORS middleware
+class RequestBodyLimitMiddleware:
+    """
+    Enforce a request body size cap while the body is received, before it is parsed.
+    
+    A declared Content-Length above the cap is rejected up front. Otherwise the
+    body is counted as it arrives (which also covers chunked uploads without a
+    Content-Length), and receiving fails with 413 as soon as it passes the cap,
+    so an oversized upload is never spooled in full.
+    """
+    
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+    
+    def too_large(self) -> HTTPException:
+        return HTTPException(status_code=413, detail=f"Upload exceeds the {self.max_bytes} byte limit")
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None:
+            try:
+                declared_size = int(content_length)
+            except ValueError:
+                await JSONResponse(status_code=400, content={"detail": "Invalid Content-Length header"})(scope, receive, send)
+                return
+            if declared_size > self.max_bytes:
+                error = self.too_large()
+                await JSONResponse(status_code=error.status_code, content={"detail": error.detail})(scope, receive, send)
+                return
+        
+        received = 0
+        response_started = False
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise self.too_large()
+            return message
+        
+        async def tracked_send(message):
+            nonlocal response_started
+            response_started = response_started or message["type"] == "http.response.start"
+            await send(message)
+        
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except HTTPException as e:
+            # Raised by limited_receive outside the app's own exception handling
+            if e.status_code != 413 or response_started:
+                raise
+            await JSONResponse(status_code=413, content={"detail": e.detail})(scope, receive, send)
+
+
+app.add_middleware(
+    RequestBodyLimitMiddleware,
+    max_bytes=MAX_IMAGES_PER_PRODUCT * (MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES)
+)
+
+# Add CORS middleware; added last, it is the outermost layer, so responses from the
+# middleware above (e.g. the body limit's 413) carry CORS headers too
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # In production, replace with your frontend URL
@@ -49,24 +332,313 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class UsageRecorder:
+    """
+    Accumulates the token usage of one request's model calls.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls: List[Dict[str, Any]] = []
+    
+    def record(self, stage: str, region: str, prompt_tokens: int, output_tokens: int) -> None:
+        """Record one model call."""
+        with self._lock:
+            self.calls.append({
+                "stage": stage,
+                "region": region,
+                "prompt_tokens": prompt_tokens,
+                "output_tokens": output_tokens,
+            })
+    
+    def summary(self) -> Dict[str, Any]:
+        """Return usage totals for the request, per stage and per region."""
+        def totals(calls):
+            return {
+                "calls": len(calls),
+                "prompt_tokens": sum(call["prompt_tokens"] for call in calls),
+                "output_tokens": sum(call["output_tokens"] for call in calls),
+            }
+        
+        with self._lock:
+            calls = list(self.calls)
+        return {
+            "total": totals(calls),
+            "stages": {stage: totals([c for c in calls if c["stage"] == stage])
+                       for stage in dict.fromkeys(c["stage"] for c in calls)},
+            "regions": {region: totals([c for c in calls if c["region"] == region])
+                        for region in dict.fromkeys(c["region"] for c in calls)},
+        }
+
+
+# Usage recorder of the request being served; model calls made in the threadpool inherit it
+request_usage: contextvars.ContextVar[Optional[UsageRecorder]] = contextvars.ContextVar("request_usage", default=None)
+
+
+class RequestCancelled(BaseException):
+    """
+    Raised in pipeline threads once the request they serve was cancelled.
+    
+    A BaseException, like asyncio.CancelledError, so that region fallback,
+    retries and stage error handling (which catch Exception) let it through.
+    """
+
+
+# Cancellation flag of the request being served; set when its client disconnects
+request_cancelled: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar(
+    "request_cancelled", default=None
+)
+
+
+def check_cancelled() -> None:
+    """Raise RequestCancelled if the request being served was cancelled."""
+    cancelled = request_cancelled.get()
+    if cancelled is not None and cancelled.is_set():
+        raise RequestCancelled()
+
+
+async def run_cancellable(func, *args):
+    """
+    Run a blocking function on the pipeline pool of this request's priority
+    class, in this task's context, and stop waiting for it as soon as this task
+    is cancelled.
+    
+    Unlike run_in_threadpool, cancellation does not wait for the thread: it
+    returns at once and flags the request as cancelled, so the thread stops at
+    its next check_cancelled (before the next stage, model call, retry or region)
+    instead of running the remaining model calls.
+    
+    Args:
+        func: Blocking function to run
+        *args: Arguments for func
+        
+    Returns:
+        The result of func
+    """
+    cancelled = threading.Event()
+    context = contextvars.copy_context()
+    context.run(request_cancelled.set, cancelled)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            pipeline_executors[request_priority.get()], context.run, func, *args
+        )
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
+
+
+# Priority class and tenant of the request being served; model calls made in its threads inherit them
+request_priority: contextvars.ContextVar[str] = contextvars.ContextVar("request_priority", default=DEFAULT_PRIORITY)
+request_tenant: contextvars.ContextVar[str] = contextvars.ContextVar("request_tenant", default=DEFAULT_TENANT)
+
+pipeline_executors = {
+    priority: ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix=f"pipeline-{priority}")
+    for priority in PRIORITY_WEIGHTS
+}
+
+
+class PriorityScheduler:
+    """
+    Admits model calls through a fixed number of slots, in weighted fair order
+    across priority classes and tenants.
+    
+    Each tenant's calls of a class form a flow. Each waiting call gets a virtual
+    finish time: its flow's previous finish time (or the virtual time of the
+    call last admitted, if later) plus 1/weight of its class. Free slots go to
+    the smallest finish time, so backlogged flows share the slots in proportion
+    to their weights: a call of a heavier class overtakes the calls of lighter
+    classes already queued, and a tenant with many queued calls does not hold
+    back another tenant's calls of the same class.
+    """
+    
+    # How often a waiting call checks whether its request was cancelled
+    CANCEL_CHECK_SECONDS = 0.5
+    
+    def __init__(self, slots: int, weights: Dict[str, float]):
+        """
+        Initialize the PriorityScheduler.
+        
+        Args:
+            slots (int): Calls running at once; 0 admits every call immediately
+            weights (dict): Share of the slots per priority class
+        """
+        self.slots = slots
+        self.weights = weights
+        self._condition = threading.Condition()
+        self._running = 0
+        self._queue: List[Tuple[float, int, str]] = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish: Dict[Tuple[str, str], float] = {}
+        self._stats = {
+            priority: {"admitted": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            for priority in weights
+        }
+    
+    @contextlib.contextmanager
+    def slot(self, priority: str, tenant: str = DEFAULT_TENANT):
+        """Hold a slot for the duration of the block, waiting for one in fair order."""
+        if not self.slots:
+            yield
+            return
+        self._acquire(priority, tenant)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._running -= 1
+                self._condition.notify_all()
+    
+    def _acquire(self, priority: str, tenant: str) -> None:
+        """
+        Wait until the call is the first in fair order and a slot is free.
+        
+        Raises:
+            RequestCancelled: If the request was cancelled while waiting
+        """
+        start = time.monotonic()
+        with self._condition:
+            flow = (priority, tenant)
+            finish = max(self._virtual_time, self._last_finish.get(flow, 0.0)) + 1 / self.weights[priority]
+            self._last_finish[flow] = finish
+            entry = (finish, next(self._sequence), priority)
+            heapq.heappush(self._queue, entry)
+            try:
+                while self._running >= self.slots or self._queue[0] is not entry:
+                    self._condition.wait(self.CANCEL_CHECK_SECONDS)
+                    check_cancelled()
+            except BaseException:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._condition.notify_all()
+                raise
+            
+            heapq.heappop(self._queue)
+            self._running += 1
+            self._virtual_time = finish
+            waited = time.monotonic() - start
+            stats = self._stats[priority]
+            stats["admitted"] += 1
+            stats["wait_seconds"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+            # The next call in line may fit in a slot too
+            self._condition.notify_all()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return slot usage, queue depth and admission waits per priority class."""
+        with self._condition:
+            waiting = {priority: 0 for priority in self.weights}
+            for _, _, priority in self._queue:
+                waiting[priority] += 1
+            return {
+                "slots": self.slots,
+                "running": self._running,
+                "classes": {
+                    priority: {
+                        "weight": self.weights[priority],
+                        "waiting": waiting[priority],
+                        "admitted": stats["admitted"],
+                        "mean_wait_seconds": stats["wait_seconds"] / stats["admitted"] if stats["admitted"] else 0.0,
+                        "max_wait_seconds": stats["max_wait_seconds"],
+                    }
+                    for priority, stats in self._stats.items()
+                },
+            }
+
+
+model_scheduler = PriorityScheduler(MODEL_CONCURRENCY, PRIORITY_WEIGHTS)
+
+
+def suggest_output_budget(stats: Dict[str, Any]) -> int:
+    """
+    Suggest an output token budget from observed usage of a stage.
+    
+    Covers both the largest output seen and mean + 3 standard deviations, with
+    25% headroom, rounded up to a multiple of 256.
+    
+    Args:
+        stats: Usage totals with calls, output_tokens, output_tokens_squared and max_output_tokens
+        
+    Returns:
+        int: Suggested max_output_tokens
+    """
+    mean = stats["output_tokens"] / stats["calls"]
+    variance = max(0.0, stats["output_tokens_squared"] / stats["calls"] - mean ** 2)
+    observed = max(stats["max_output_tokens"], mean + 3 * math.sqrt(variance))
+    return int(math.ceil(observed * 1.25 / 256) * 256)
+
+
+def stage_usage_stats(stage: str) -> Optional[Dict[str, Any]]:
+    """Return a stage's usage totals across all regions and workers, or None if unused."""
+    regions = shared_store.usage_stats().get(stage)
+    if not regions:
+        return None
+    return {
+        "calls": sum(r["calls"] for r in regions.values()),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in regions.values()),
+        "output_tokens": sum(r["output_tokens"] for r in regions.values()),
+        "output_tokens_squared": sum(r["output_tokens_squared"] for r in regions.values()),
+        "max_output_tokens": max(r["max_output_tokens"] for r in regions.values()),
+    }
+
+
+def output_budget(stage: str) -> int:
+    """Return the max_output_tokens to use for a pipeline stage."""
+    budget = STAGE_OUTPUT_BUDGETS[stage]
+    if OUTPUT_BUDGET_AUTOTUNE:
+        stats = stage_usage_stats(stage)
+        if stats and stats["calls"] >= OUTPUT_BUDGET_MIN_SAMPLES:
+            budget = min(budget, suggest_output_budget(stats))
+    return budget
+
+
+class ImageData:
+    """
+    A prepared image, as bytes and MIME type.
+    
+    Turned into a Part by generate_content, in the pipeline thread, so building
+    it (and the SDK import the first time) never runs on the event loop.
+    """
+    
+    def __init__(self, data: bytes, mime_type: str):
+        self.data = data
+        self.mime_type = mime_type
+
+
 class GeminiRegionClient:
     """
     A client for interacting with Gemini API with region fallback capabilities.
     """
     
-    def __init__(self, project_id: str = None, logger: logging.Logger = None):
+    def __init__(self, project_id: str = None, logger: logging.Logger = None,
+                 store: SharedStore = None, requests_per_minute: float = 0,
+                 call_timeouts: Dict[str, Tuple[float, float]] = None, call_workers: int = 64,
+                 scheduler: PriorityScheduler = None):
         """
         Initialize the GeminiRegionClient.
         
         Args:
             project_id (str, optional): Google Cloud Project ID. If None, will try to get from environment.
             logger (logging.Logger, optional): Custom logger instance. If None, will create a new one.
+            store (SharedStore, optional): Store for region stats and rate limiting shared across workers.
+            requests_per_minute (float, optional): Shared limit on model calls per minute; 0 disables it.
+            call_timeouts (dict, optional): (connect, read) timeouts in seconds per call kind,
+                "image" or "text". Calls of a kind without timeouts wait indefinitely.
+            call_workers (int, optional): Threads running model calls under a timeout.
+            scheduler (PriorityScheduler, optional): Admits model calls by the priority
+                class of the request making them (request_priority).
         """
         self.project_id = project_id or os.environ.get("GCP_PROJECT")
         if not self.project_id:
             raise ValueError("Project ID must be provided or set in GCP_PROJECT environment variable")
             
         self.logger = logger or logging.getLogger(__name__)
+        self.store = store
+        self.requests_per_minute = requests_per_minute
+        self.call_timeouts = call_timeouts or {}
+        self.call_workers = call_workers
+        self._call_executor = ThreadPoolExecutor(max_workers=call_workers, thread_name_prefix="gemini-call")
+        self.scheduler = scheduler
         
         # List of regions to try
         self.regions = [
@@ -78,16 +650,40 @@ class GeminiRegionClient:
             "asia-south1"
         ]
         
-        # Safety settings configuration
-        self.safety_settings = {
-            generative_models.HarmCategory.HARM_CATEGORY_HATE_SPEECH: generative_models.HarmBlockThreshold.BLOCK_NONE,
-            generative_models.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: generative_models.HarmBlockThreshold.BLOCK_NONE,
-            generative_models.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: generative_models.HarmBlockThreshold.BLOCK_NONE,
-            generative_models.HarmCategory.HARM_CATEGORY_HARASSMENT: generative_models.HarmBlockThreshold.BLOCK_NONE,
-        }
+        # Model instances per (region, model name), created on first use or at warm-up
+        self._models: Dict[Tuple[str, str], "GenerativeModel"] = {}
+        self._models_lock = threading.Lock()
+        # (region, model name) pairs with an established channel (a call has succeeded)
+        self._connected: set = set()
         
-        # Default generation config
-        self.default_generation_config = GenerationConfig(
+        # Observed latency (moving average) and outcomes per region; model calls run on
+        # many threads, so _stats_lock guards these and _connected
+        self._stats_lock = threading.Lock()
+        self.region_stats: Dict[str, Dict[str, Any]] = {
+            region: {"latency_ms": None, "successes": 0, "failures": 0}
+            for region in self.regions
+        }
+
+    # Weight of the newest sample in the region latency moving average
+    LATENCY_SMOOTHING = 0.2
+    # How often a call waiting under a timeout checks whether its request was cancelled
+    CANCEL_CHECK_SECONDS = 0.5
+
+    @functools.cached_property
+    def safety_settings(self) -> Dict:
+        """Safety settings configuration, built on first model use."""
+        sdk = vertex_sdk()
+        return {
+            sdk.HarmCategory.HARM_CATEGORY_HATE_SPEECH: sdk.HarmBlockThreshold.BLOCK_NONE,
+            sdk.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: sdk.HarmBlockThreshold.BLOCK_NONE,
+            sdk.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: sdk.HarmBlockThreshold.BLOCK_NONE,
+            sdk.HarmCategory.HARM_CATEGORY_HARASSMENT: sdk.HarmBlockThreshold.BLOCK_NONE,
+        }
+
+    @functools.cached_property
+    def default_generation_config(self) -> "GenerationConfig":
+        """Default generation config, built on first model use."""
+        return vertex_sdk().GenerationConfig(
             max_output_tokens=8192,
             temperature=0.1,
             top_p=0.95,
@@ -96,23 +692,172 @@ class GeminiRegionClient:
 
     def _initialize_region(self, region: str) -> None:
         """Initialize Vertex AI with the specified region."""
-        vertexai.init(project=self.project_id, location=region)
+        vertex_sdk().vertexai.init(project=self.project_id, location=region)
+        
+    def _get_model(self, region: str, model_name: str = MODEL_NAME) -> "GenerativeModel":
+        """Get a Gemini model instance for a region, initializing the region on first use."""
+        # vertexai.init sets process-wide state, so regions are initialized one at a time;
+        # each model keeps the location it was created with
+        with self._models_lock:
+            model = self._models.get((region, model_name))
+            if model is None:
+                self._initialize_region(region)
+                model = vertex_sdk().GenerativeModel(model_name)
+                self._models[(region, model_name)] = model
+            return model
+
+    def _record_region_result(self, region: str, latency_ms: float = None) -> None:
+        """Record a call outcome for a region; a missing latency counts as a failure."""
+        if self.store:
+            self.store.record_region_result(region, latency_ms, self.LATENCY_SMOOTHING)
+        
+        with self._stats_lock:
+            stats = self.region_stats[region]
+            if latency_ms is None:
+                stats["failures"] += 1
+                return
+            
+            stats["successes"] += 1
+            if stats["latency_ms"] is None:
+                stats["latency_ms"] = latency_ms
+            else:
+                stats["latency_ms"] += self.LATENCY_SMOOTHING * (latency_ms - stats["latency_ms"])
+
+    def get_region_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return region stats, aggregated across workers when a shared store is configured."""
+        with self._stats_lock:
+            region_stats = {region: dict(stats) for region, stats in self.region_stats.items()}
+        if self.store:
+            return {**region_stats, **self.store.region_stats()}
+        return region_stats
+
+    def shutdown(self) -> None:
+        """Shut down the pool running model calls under a timeout."""
+        self._call_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _wait_for_rate_limit(self) -> None:
+        """Block until the shared rate limit allows another model call."""
+        if not self.store or not self.requests_per_minute:
+            return
+        
+        while True:
+            check_cancelled()
+            wait_seconds = self.store.acquire_token(
+                "gemini", self.requests_per_minute / 60, GEMINI_RATE_LIMIT_BURST
+            )
+            if not wait_seconds:
+                return
+            time.sleep(wait_seconds)
+
+    def _record_usage(self, stage: str, region: str, response) -> None:
+        """Record a response's token usage for the current request and the shared totals."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        prompt_tokens = usage.prompt_token_count or 0
+        output_tokens = usage.candidates_token_count or 0
+        
+        recorder = request_usage.get()
+        if recorder is not None:
+            recorder.record(stage, region, prompt_tokens, output_tokens)
+        if self.store:
+            self.store.record_usage(stage, region, prompt_tokens, output_tokens)
+            self.store.record_tenant_usage(
+                request_tenant.get(), calls=1, prompt_tokens=prompt_tokens, output_tokens=output_tokens
+            )
+
+    def _call_with_timeout(self, region: str, model_name: str, call_kind: str, call):
+        """
+        Run a model call under the timeouts of its kind (see call_timeouts).
+        
+        The blocking SDK call runs on the call pool while this thread waits for it,
+        so a hung connection is abandoned once the timeout expires (or the request
+        is cancelled) instead of blocking the request.
+        
+        Raises:
+            ModelCallTimeout: If the call does not return in time
+            RequestCancelled: If the request was cancelled while waiting
+        """
+        timeouts = self.call_timeouts.get(call_kind)
+        if not timeouts:
+            return call()
+        
+        connect_timeout, read_timeout = timeouts
+        with self._stats_lock:
+            connected = (region, model_name) in self._connected
+        timeout = read_timeout if connected else connect_timeout + read_timeout
+        return call_with_timeout(
+            self._call_executor, call, timeout, f"{model_name} in {region}",
+            check=check_cancelled, check_interval=self.CANCEL_CHECK_SECONDS
+        )
+
+    def _generate_in_region(self, region: str, prompt, generation_config, stage: str = "other",
+                            model_name: str = MODEL_NAME, call_kind: str = "text", **kwargs):
+        """
+        Call a model in one region, recording latency, failures (timeouts included) and token usage.
+        
+        With a scheduler, the call first waits for a slot in the order of its request's priority and tenant.
+        """
+        model = self._get_model(region, model_name)
+        scheduled = self.scheduler.slot(request_priority.get(), request_tenant.get()) if self.scheduler else None
+        with scheduled or contextlib.nullcontext():
+            self._wait_for_rate_limit()
+            start = time.monotonic()
+            try:
+                response = self._call_with_timeout(region, model_name, call_kind, functools.partial(
+                    model.generate_content,
+                    prompt,
+                    generation_config=generation_config,
+                    safety_settings=self.safety_settings,
+                    **kwargs
+                ))
+            except Exception:
+                self._record_region_result(region)
+                raise
         
-    def _get_model(self) -> GenerativeModel:
-        """Get the Gemini model instance."""
-        return GenerativeModel("gemini-2.0-flash-001")
+        with self._stats_lock:
+            self._connected.add((region, model_name))
+        self._record_region_result(region, (time.monotonic() - start) * 1000)
+        self._record_usage(stage, region, response)
+        return response
+
+    def warm_region(self, region: str, probe: bool = False,
+                    model_names: Tuple[str, ...] = (MODEL_NAME,)) -> Dict[str, Any]:
+        """
+        Initialize a region ahead of traffic.
+        
+        Args:
+            region: Region to warm up
+            probe: Also send a one-token request to seed the region latency stats
+            model_names: Models to create in the region; the probe goes to the first
+            
+        Returns:
+            dict: The region stats after warm-up
+        """
+        for model_name in model_names:
+            self._get_model(region, model_name)
+        if probe:
+            probe_config = vertex_sdk().GenerationConfig(max_output_tokens=1, temperature=0)
+            self._generate_in_region(
+                region, "ping", probe_config, stage="warmup", model_name=model_names[0]
+            )
+        return dict(self.get_region_stats()[region])
 
     @retry(wait=wait_exponential(multiplier=1, min=2, max=10), stop=stop_after_attempt(3))
     def generate_content(self, 
-                        prompt: Union[str, List[Union[str, Part]]], 
+                        prompt: Union[str, List[Union[str, "Part"]]], 
                         response_mime_type: str = None,
+                        stage: str = "other",
+                        model_name: str = MODEL_NAME,
                         **kwargs) -> str:
         """
         Generate content using Gemini model with region fallback.
         
         Args:
-            prompt: The input prompt (string or list of string/Part for multimodal)
+            prompt: The input prompt (string, or list of strings, Parts, ImageData and image bytes for multimodal)
             response_mime_type: Optional MIME type for the response
+            stage: Pipeline stage the call belongs to, for token usage accounting
+            model_name: Gemini model to call (see STAGE_MODELS)
             **kwargs: Additional arguments to pass to generate_content
             
         Returns:
@@ -121,40 +866,44 @@ class GeminiRegionClient:
         Raises:
             Exception: If all regions fail
         """
+        sdk = vertex_sdk()
         last_error = None
         
+        # Prepare generation config (once, so every region gets the caller's config)
+        gen_config = kwargs.pop('generation_config', self.default_generation_config)
+        if response_mime_type:
+            gen_config = sdk.GenerationConfig(
+                **gen_config.to_dict(),
+                response_mime_type=response_mime_type
+            )
+        
+        # Process multimodal input if needed: prepared images and raw image bytes become Parts
+        call_kind = "text"
+        if isinstance(prompt, list):
+            prompt = [
+                sdk.Part.from_data(part.data, mime_type=part.mime_type) if isinstance(part, ImageData)
+                else part if isinstance(part, (str, sdk.Part))
+                else sdk.Part.from_data(part, mime_type="image/jpeg")
+                for part in prompt
+            ]
+            if not all(isinstance(part, str) for part in prompt):
+                call_kind = "image"
+        
         for region in self.regions:
+            # A cancelled request makes no further calls (nor retries, see RequestCancelled)
+            check_cancelled()
             try:
-                self._initialize_region(region)
-                model = self._get_model()
-                
-                # Prepare generation config
-                gen_config = kwargs.pop('generation_config', self.default_generation_config)
-                if response_mime_type:
-                    gen_config = GenerationConfig(
-                        **gen_config.to_dict(),
-                        response_mime_type=response_mime_type
-                    )
-                
-                # Process multimodal input if needed
-                if isinstance(prompt, list) and len(prompt) == 2:
-                    image_content, text_prompt = prompt
-                    if not isinstance(image_content, Part):
-                        image_content = Part.from_data(image_content, mime_type="image/jpeg")
-                    prompt = [image_content, text_prompt]
-                
-                response = model.generate_content(
-                    prompt,
-                    generation_config=gen_config,
-                    safety_settings=self.safety_settings,
-                    **kwargs
+                response = self._generate_in_region(
+                    region, prompt, gen_config, stage=stage, model_name=model_name, call_kind=call_kind, **kwargs
                 )
-                
                 return response.text
                 
-            except ResourceExhausted as e:
+            except sdk.ResourceExhausted as e:
                 self.logger.warning(f"Region {region} exhausted. Trying next region...")
                 last_error = e
+            except ModelCallTimeout as e:
+                self.logger.warning(f"Region {region} timed out ({str(e)}). Trying next region...")
+                last_error = e
             except Exception as e:
                 self.logger.warning(f"Unexpected error with region {region}: {str(e)}")
                 last_error = e
@@ -162,154 +911,240 @@ class GeminiRegionClient:
         raise Exception(f"All regions failed. Last error: {str(last_error)}") from last_error
 
 
-def clean_json_response(response_text):
+# Python types of the scalar types used in the response schemas
+SCHEMA_TYPES = {"STRING": str, "INTEGER": int, "NUMBER": float, "BOOLEAN": bool}
+
+
+def schema_annotation(schema: Dict[str, Any]) -> Any:
+    """Translate a response schema node into a type annotation pydantic can validate."""
+    if schema["type"] == "ARRAY":
+        return Annotated[
+            List[schema_annotation(schema["items"])],
+            Field(min_length=schema.get("minItems"), max_length=schema.get("maxItems"))
+        ]
+    if schema["type"] == "OBJECT":
+        # Objects without required properties (specifications, dimensions) are free-form
+        return schema_model(schema) if "required" in schema else Dict[str, Any]
+    return Annotated[
+        SCHEMA_TYPES[schema["type"]],
+        Field(ge=schema.get("minimum"), le=schema.get("maximum"))
+    ]
+
+
+def schema_model(schema: Dict[str, Any], model_name: str = "ResponseObject") -> Type[BaseModel]:
+    """Compile an object schema whose property names are identifiers into a pydantic model."""
+    required = schema.get("required", [])
+    definitions = {
+        name: (schema_annotation(property_schema), ...) if name in required
+        else (Optional[schema_annotation(property_schema)], None)
+        for name, property_schema in schema["properties"].items()
+    }
+    return create_model(model_name, __config__=ConfigDict(extra="ignore"), **definitions)
+
+
+# Typed models of the reviews and summary stage outputs, compiled once
+REVIEWS_MODEL = schema_model(REVIEWS_PROMPT.response_schema, "Reviews")
+SUMMARY_MODEL = schema_model(SUMMARY_PROMPT.response_schema, "ReviewSummary")
+BATCH_REVIEWS_MODEL = schema_model(BATCH_REVIEWS_PROMPT.response_schema, "BatchReviews")
+
+
+def validation_problem(response_model: Type[BaseModel], data: Any) -> Optional[str]:
+    """Return why data does not satisfy response_model, or None if it does."""
+    try:
+        response_model.model_validate(data)
+    except ValidationError as e:
+        first = e.errors()[0]
+        location = ".".join(str(part) for part in first["loc"]) or "response"
+        return f"{e.error_count()} validation error(s), first at {location}: {first['msg']}"
+    return None
+
+
+def run_model_cascade(stage: str, generate, response_model: Type[BaseModel] = None):
     """
-    Clean the JSON response from Gemini to ensure it's valid JSON.
+    Run a pipeline stage on its model tiers (STAGE_MODELS), cheapest first.
+    
+    A tier's output is accepted when it parses and satisfies response_model;
+    otherwise the stage escalates to the next tier, and the stage fails if the
+    last tier's output is still invalid (a truncated response repaired into a
+    partial object must not reach clients). Outcomes are recorded per tier, so
+    GET /usage can report hit rates.
     
     Args:
-        response_text: The raw text response from Gemini
+        stage: Pipeline stage to run
+        generate: Callable taking a model name and returning the stage output;
+            raises ValueError when the output can't be parsed or validated
+        response_model: Typed model the output must satisfy, if generate doesn't validate it
         
     Returns:
-        dict: Parsed JSON object
+        The accepted stage output
+        
+    Raises:
+        ValueError: If the last tier's output can't be parsed or validated
+    """
+    tiers = STAGE_MODELS[stage]
+    for tier, model_name in enumerate(tiers, start=1):
+        last_tier = tier == len(tiers)
+        try:
+            result = generate(model_name)
+        except ValueError as e:
+            shared_store.record_cascade_result(stage, model_name, accepted=False)
+            if last_tier:
+                raise
+            problem = str(e)
+        else:
+            problem = validation_problem(response_model, result) if response_model else None
+            shared_store.record_cascade_result(stage, model_name, accepted=problem is None)
+            if problem is None:
+                return result
+            if last_tier:
+                raise ValueError(f"Stage {stage} output of {model_name} failed validation: {problem}")
+        
+        logger.warning(f"Stage {stage} rejected output of {model_name} ({problem}); escalating to {tiers[tier]}")
+
+
+@functools.lru_cache(maxsize=128)
+def catalog_model(fields: Optional[Tuple[str, ...]] = None) -> Type[BaseModel]:
     """
-    # Remove markdown code block markers if present
-    cleaned_text = re.sub(r'^```json\s*', '', response_text, flags=re.MULTILINE)
-    cleaned_text = re.sub(r'\s*```$', '', cleaned_text, flags=re.MULTILINE)
+    Build the typed model a catalog entry must satisfy, once per field selection.
+    
+    The model is compiled from the same schema the catalog prompt sends, with
+    required text fields additionally required to be non-empty.
     
-    # Remove any other markdown formatting that might be present
-    cleaned_text = re.sub(r'^```\s*', '', cleaned_text, flags=re.MULTILINE)
+    Args:
+        fields: Field names requested, or None for every field
+        
+    Returns:
+        type: A pydantic model whose fields are aliased to the catalog field names
+    """
+    schema = catalog_prompt(fields).response_schema
+    definitions = {}
+    for name, field_schema in schema["properties"].items():
+        annotation = schema_annotation(field_schema)
+        if name not in schema["required"]:
+            definitions[CATALOG_FIELDS[name][0]] = (Optional[annotation], Field(None, alias=name))
+            continue
+        if field_schema["type"] == "STRING":
+            annotation = Annotated[str, Field(min_length=1)]
+        definitions[CATALOG_FIELDS[name][0]] = (annotation, Field(..., alias=name))
+    return create_model("CatalogEntry", __config__=ConfigDict(extra="ignore"), **definitions)
+
+
+def invalid_catalog_fields(catalog_info: Any, fields: Optional[Tuple[str, ...]] = None) -> Tuple[str, ...]:
+    """
+    Validate a generated catalog entry.
     
+    Args:
+        catalog_info: Parsed model output
+        fields: Field names requested, or None for every field
+        
+    Returns:
+        tuple: Names of the missing or invalid fields in catalog order (empty if valid)
+    """
+    requested = fields or tuple(CATALOG_FIELDS)
+    if not isinstance(catalog_info, dict):
+        return requested
     try:
-        # Parse the cleaned text as JSON
-        return json.loads(cleaned_text)
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON parsing error: {e}")
-        logger.error(f"Cleaned text: {cleaned_text}")
-        raise ValueError(f"Failed to parse JSON response: {e}")
+        catalog_model(fields).model_validate(catalog_info)
+    except ValidationError as e:
+        aliases = {CATALOG_FIELDS[name][0]: name for name in requested}
+        failed = {aliases.get(error["loc"][0], error["loc"][0]) for error in e.errors() if error["loc"]}
+        return tuple(name for name in requested if name in failed)
+    return ()
+
+
+def multimodal_prompt(images, prompt_text: str) -> List:
+    """
+    Put the product images ahead of the prompt text.
+    
+    Args:
+        images: Image bytes, ImageData or Part, or a list of them showing the same product
+        prompt_text: The stage prompt
+        
+    Returns:
+        list: Prompt parts for generate_content
+    """
+    images = list(images) if isinstance(images, (list, tuple)) else [images]
+    return [*images, image_count_note(len(images)) + prompt_text]
+
+
+def repair_catalog_fields(client, images, catalog_info: Dict, invalid_fields: Tuple[str, ...],
+                          model_name: str = MODEL_NAME) -> Dict:
+    """
+    Regenerate only the invalid fields of a catalog entry and merge them in.
+    
+    The follow-up call sees the image and the fields that were fine, and asks
+    for just the broken ones, which costs a fraction of a full regeneration.
+    
+    Args:
+        client: GeminiRegionClient instance
+        images: Image bytes, ImageData or Part, or a list of them, the entry was generated from
+        catalog_info: The entry that failed validation
+        invalid_fields: Field names to regenerate, in catalog order
+        model_name: Gemini model to call
+        
+    Returns:
+        dict: The merged entry, in catalog field order
+    """
+    valid = {name: value for name, value in catalog_info.items() if name not in invalid_fields}
+    definition, prompt_text = render_catalog_repair_prompt(invalid_fields, valid)
+    generation_config = definition.generation_config(output_budget("catalog_repair"))
+    
+    response_text = client.generate_content(
+        multimodal_prompt(images, prompt_text), generation_config=generation_config, stage="catalog_repair",
+        model_name=model_name
+    )
+    repaired = clean_json_response(response_text)
+    if isinstance(repaired, dict):
+        valid.update((name, repaired[name]) for name in invalid_fields if name in repaired)
+    
+    merged = {name: valid[name] for name in CATALOG_FIELDS if name in valid}
+    merged.update(valid)
+    return merged
 
 
-def generate_product_catalog_info(client, image_bytes):
+def generate_product_catalog_info(client, images, fields: Optional[Tuple[str, ...]] = None,
+                                  model_name: str = MODEL_NAME):
     """
     Generate product catalog information using Gemini.
     
+    Fields that fail validation are regenerated with targeted follow-up calls
+    (see repair_catalog_fields) instead of regenerating the whole entry.
+    
     Args:
         client: GeminiRegionClient instance
-        image_bytes: Image bytes to analyze
+        images: Image bytes, ImageData or Part to analyze, or a list of them showing the same product
+        fields: Catalog field names to generate (see resolve_catalog_fields), or None for every field
+        model_name: Gemini model to call
         
     Returns:
         dict: Generated product catalog information as a JSON object
+        
+    Raises:
+        ValueError: If the entry is still invalid after CATALOG_REPAIR_ATTEMPTS repairs
     """
-    # Define the catalog schema
-    catalog_schema = {
-        "type": "OBJECT",
-        "properties": {
-            "Nome do Produto": {"type": "STRING"},
-            "Marca": {"type": "STRING"},
-            "Categoria": {"type": "STRING"},
-            "Subcategoria": {"type": "STRING"},
-            "Descrição Curta": {"type": "STRING"},
-            "Descrição Longa": {"type": "STRING"},
-            "Características Principais": {
-                "type": "ARRAY",
-                "items": {"type": "STRING"},
-                "minItems": 3
-            },
-            "Especificações Técnicas": {
-                "type": "OBJECT",
-                "properties": {
-                    "Material": {"type": "STRING"},
-                    "Modelo": {"type": "STRING"},
-                    "Fabricante": {"type": "STRING"},
-                    "País de Origem": {"type": "STRING"},
-                    "Garantia": {"type": "STRING"},
-                    "Certificações": {"type": "STRING"}
-                }
-            },
-            "Dimensões": {
-                "type": "OBJECT",
-                "properties": {
-                    "Altura": {"type": "STRING"},
-                    "Largura": {"type": "STRING"},
-                    "Profundidade": {"type": "STRING"},
-                    "Peso": {"type": "STRING"}
-                }
-            },
-            "Opções de Cores": {
-                "type": "ARRAY",
-                "items": {"type": "STRING"},
-                "minItems": 1
-            },
-            "Faixa de Preço Sugerida": {"type": "STRING"},
-            "Público-Alvo": {"type": "STRING"},
-            "Palavras-chave SEO": {
-                "type": "ARRAY",
-                "items": {"type": "STRING"},
-                "minItems": 3
-            },
-            "Tags de Busca": {
-                "type": "ARRAY",
-                "items": {"type": "STRING"},
-                "minItems": 3
-            }
-        },
-        "required": [
-            "Nome do Produto",
-            "Categoria",
-            "Descrição Curta",
-            "Descrição Longa",
-            "Características Principais"
-        ],
-        "propertyOrdering": [
-            "Nome do Produto",
-            "Marca",
-            "Categoria",
-            "Subcategoria",
-            "Descrição Curta",
-            "Descrição Longa",
-            "Características Principais",
-            "Especificações Técnicas",
-            "Dimensões",
-            "Opções de Cores",
-            "Faixa de Preço Sugerida",
-            "Público-Alvo",
-            "Palavras-chave SEO",
-            "Tags de Busca"
-        ]
-    }
+    definition = catalog_prompt(fields)
+    generation_config = definition.generation_config(output_budget("catalog"))
 
-    generation_config = GenerationConfig(
-        max_output_tokens=8192,
-        temperature=0.1,
-        top_p=0.95,
-        response_mime_type="application/json",
-        response_schema=catalog_schema
+    prompt = multimodal_prompt(images, definition.render())
+    
+    response_text = client.generate_content(
+        prompt, generation_config=generation_config, stage="catalog", model_name=model_name
     )
-
-    prompt = [
-        image_bytes,
-        """Gere uma entrada detalhada de catálogo de e-commerce para este item em português. Inclua:
-
-1. Nome do Produto
-2. Marca (se visível)
-3. Categoria
-4. Subcategoria
-5. Descrição Curta (50-60 palavras)
-6. Descrição Longa (100-150 palavras)
-7. Características Principais (mínimo 3 características)
-8. Especificações Técnicas (incluindo material, modelo, fabricante, país de origem, garantia e certificações)
-9. Dimensões (altura, largura, profundidade e peso)
-10. Opções de Cores (mínimo 1 cor)
-11. Faixa de Preço Sugerida
-12. Público-Alvo
-13. Palavras-chave SEO (mínimo 3 palavras-chave)
-14. Tags de Busca (mínimo 3 tags)
-
-A saída deve seguir estritamente o schema JSON fornecido.
-"""
-    ]
+    catalog_info = clean_json_response(response_text)
     
-    response_text = client.generate_content(prompt, generation_config=generation_config)
-    return clean_json_response(response_text)
+    invalid_fields = invalid_catalog_fields(catalog_info, fields)
+    for _ in range(CATALOG_REPAIR_ATTEMPTS):
+        if not invalid_fields:
+            break
+        logger.warning(f"Catalog entry failed validation, repairing fields: {', '.join(invalid_fields)}")
+        if not isinstance(catalog_info, dict):
+            catalog_info = {}
+        catalog_info = repair_catalog_fields(client, images, catalog_info, invalid_fields, model_name)
+        invalid_fields = invalid_catalog_fields(catalog_info, fields)
+    
+    if invalid_fields:
+        raise ValueError(f"Catalog entry failed validation: {', '.join(invalid_fields)}")
+    return catalog_info
 
 
 def generate_product_reviews(client, product_info: Dict):
@@ -323,159 +1158,1396 @@ def generate_product_reviews(client, product_info: Dict):
     Returns:
         dict: Generated reviews and summary
     """
-    # Define the reviews schema
-    reviews_schema = {
-        "type": "OBJECT",
-        "properties": {
-            "reviews": {
-                "type": "ARRAY",
-                "items": {
-                    "type": "OBJECT",
-                    "properties": {
-                        "nome": {"type": "STRING"},
-                        "estrelas": {"type": "INTEGER", "minimum": 1, "maximum": 5},
-                        "titulo": {"type": "STRING"},
-                        "texto": {"type": "STRING"},
-                        "data": {"type": "STRING", "format": "date"},
-                        "pros": {"type": "ARRAY", "items": {"type": "STRING"}, "minItems": 1},
-                        "contras": {"type": "ARRAY", "items": {"type": "STRING"}}
-                    },
-                    "required": ["nome", "estrelas", "titulo", "texto", "data", "pros"]
-                },
-                "minItems": 5,
-                "maxItems": 5
-            }
-        },
-        "required": ["reviews"],
-        "propertyOrdering": ["reviews"]
-    }
+    reviews_data = run_model_cascade("reviews", functools.partial(generate_reviews, client, product_info), REVIEWS_MODEL)
+    summary_data = run_model_cascade("summary", functools.partial(generate_reviews_summary, client, reviews_data), SUMMARY_MODEL)
+    
+    return {
+        "reviews": reviews_data["reviews"],
+        "summary": summary_data
+    }
+
 
-    generation_config = GenerationConfig(
-        max_output_tokens=8192,
-        temperature=0.7,
-        top_p=0.95,
-        response_mime_type="application/json",
-        response_schema=reviews_schema
+def generate_reviews(client, product_info: Dict, model_name: str = MODEL_NAME) -> Dict:
+    """
+    Generate the user reviews for a product (the reviews pipeline stage).
+    
+    Args:
+        client: GeminiRegionClient instance
+        product_info: Dictionary containing product information
+        model_name: Gemini model to call
+        
+    Returns:
+        dict: Generated reviews under the "reviews" key
+    """
+    generation_config = REVIEWS_PROMPT.generation_config(output_budget("reviews"))
+    prompt = render_reviews_prompt(product_info)
+    
+    response_text = client.generate_content(
+        prompt, generation_config=generation_config, stage="reviews", model_name=model_name
     )
+    return clean_json_response(response_text)
 
-    prompt = f"""Com base nas informações do produto abaixo, gere 5 avaliações realistas de usuários em português.
-    Cada avaliação deve incluir:
-    1. Nome do usuário
-    2. Classificação (1-5 estrelas)
-    3. Título da avaliação
-    4. Texto da avaliação (2-3 frases)
-    5. Data (formato YYYY-MM-DD, últimos 30 dias)
-    6. Prós (mínimo 1) e Contras (opcional)
-
-    Informações do Produto:
-    Nome: {product_info.get('Nome do Produto', '')}
-    Descrição: {product_info.get('Descrição Curta', '')}
-    Características: {product_info.get('Características Principais', [])}
-
-    A saída deve seguir estritamente o schema JSON fornecido.
-    """
-    
-    response_text = client.generate_content(prompt, generation_config=generation_config)
-    reviews_data = clean_json_response(response_text)
-    
-    # Define the summary schema
-    summary_schema = {
-        "type": "OBJECT",
-        "properties": {
-            "pontos_fortes": {
-                "type": "ARRAY",
-                "items": {"type": "STRING"},
-                "minItems": 3
-            },
-            "criticas": {
-                "type": "ARRAY",
-                "items": {"type": "STRING"}
-            },
-            "sentimento_geral": {"type": "STRING"},
-            "recomendacoes": {"type": "STRING"}
-        },
-        "required": ["pontos_fortes", "criticas", "sentimento_geral", "recomendacoes"],
-        "propertyOrdering": ["pontos_fortes", "criticas", "sentimento_geral", "recomendacoes"]
-    }
 
-    summary_generation_config = GenerationConfig(
-        max_output_tokens=8192,
-        temperature=0.3,
-        top_p=0.95,
-        response_mime_type="application/json",
-        response_schema=summary_schema
+# Per priority class, like the pipeline pools
+review_shard_executors = {
+    priority: ThreadPoolExecutor(max_workers=REVIEW_SHARD_WORKERS, thread_name_prefix=f"review-shard-{priority}")
+    for priority in PRIORITY_WEIGHTS
+}
+
+
+def generate_review_shard(client, definition, prompt: str, model_name: str) -> Dict:
+    """Generate one shard of a product's reviews."""
+    response_text = client.generate_content(
+        prompt, generation_config=definition.generation_config(output_budget("reviews_shard")),
+        stage="reviews_shard", model_name=model_name
+    )
+    return clean_json_response(response_text)
+
+
+def generate_sharded_reviews(client, product_info: Dict, model_name: str = MODEL_NAME) -> Dict:
+    """
+    Generate the user reviews for a product as parallel shards (the reviews stage
+    with sharded reviews).
+    
+    Each shard (REVIEW_SHARDS) asks for the reviews of one reviewer profile; the
+    shards run at once and are merged, dropping duplicate reviews. The calls run
+    in this request's context, so their usage is recorded like any other.
+    
+    Args:
+        client: GeminiRegionClient instance
+        product_info: Dictionary containing product information
+        model_name: Gemini model to call
+        
+    Returns:
+        dict: Generated reviews under the "reviews" key
+        
+    Raises:
+        ValueError: If a shard's response can't be parsed
+    """
+    executor = review_shard_executors[request_priority.get()]
+    futures = [
+        executor.submit(
+            contextvars.copy_context().run, generate_review_shard, client, definition, prompt, model_name
+        )
+        for definition, prompt in render_review_shard_prompts(product_info)
+    ]
+    try:
+        shards = [future.result() for future in futures]
+    finally:
+        for future in futures:
+            future.cancel()
+    return merge_review_shards(shards)
+
+
+def generate_reviews_summary(client, reviews_data: Dict, model_name: str = MODEL_NAME) -> Dict:
+    """
+    Summarize generated reviews (the summary pipeline stage).
+    
+    Args:
+        client: GeminiRegionClient instance
+        reviews_data: Generated reviews under the "reviews" key
+        model_name: Gemini model to call
+        
+    Returns:
+        dict: Review summary
+    """
+    summary_generation_config = SUMMARY_PROMPT.generation_config(output_budget("summary"))
+    summary_prompt = render_summary_prompt(reviews_data)
+    
+    summary_response = client.generate_content(
+        summary_prompt, generation_config=summary_generation_config, stage="summary", model_name=model_name
+    )
+    return clean_json_response(summary_response)
+
+
+def valid_bounding_box(box: Any) -> bool:
+    """Check a [ymin, xmin, ymax, xmax] box normalized to 0-1000."""
+    return (
+        isinstance(box, list) and len(box) == 4
+        and all(isinstance(value, (int, float)) and 0 <= value <= 1000 for value in box)
+        and box[0] < box[2] and box[1] < box[3]
+    )
+
+
+def detect_products(client, images, fields: Optional[Tuple[str, ...]] = None,
+                    model_name: str = MODEL_NAME) -> List[Dict[str, Any]]:
+    """
+    Find every product in a shelf or flat-lay photo and catalog each, in one call.
+    
+    Products whose bounding box or catalog entry fails validation are dropped,
+    so one bad entry (e.g. the last one, cut off by the output budget) doesn't
+    cost the whole response.
+    
+    Args:
+        client: GeminiRegionClient instance
+        images: Image bytes, ImageData or Part to analyze
+        fields: Catalog field names to generate per product, or None for every field
+        model_name: Gemini model to call
+        
+    Returns:
+        list: {"bounding_box": [ymin, xmin, ymax, xmax] (0-1000), "catalog_info": {...}}
+            per product, in the order the model listed them
+        
+    Raises:
+        ValueError: If the response has no product list, or none of its products is valid
+    """
+    definition = detection_prompt(fields, MAX_PRODUCTS_PER_IMAGE)
+    generation_config = definition.generation_config(output_budget("detection"))
+    
+    response_text = client.generate_content(
+        multimodal_prompt(images, definition.render()), generation_config=generation_config,
+        stage="detection", model_name=model_name
+    )
+    detected = clean_json_response(response_text)
+    items = detected.get("produtos") if isinstance(detected, dict) else None
+    if not isinstance(items, list):
+        raise ValueError("Detection response has no product list")
+    
+    products = []
+    for position, item in enumerate(items, start=1):
+        if not isinstance(item, dict):
+            continue
+        box = item.get(BOUNDING_BOX_FIELD)
+        catalog_info = {name: value for name, value in item.items() if name != BOUNDING_BOX_FIELD}
+        invalid_fields = invalid_catalog_fields(catalog_info, fields)
+        if invalid_fields or not valid_bounding_box(box):
+            logger.warning(
+                f"Dropping detected product {position}: invalid {', '.join(invalid_fields) or 'bounding box'}"
+            )
+            continue
+        products.append({"bounding_box": [int(value) for value in box], "catalog_info": catalog_info})
+    
+    if items and not products:
+        raise ValueError("None of the detected products passed validation")
+    return products
+
+
+def generate_batch_reviews(client, products: Dict[str, Dict], model_name: str = MODEL_NAME) -> Dict:
+    """
+    Generate reviews and a review summary for several products in one call.
+    
+    Replaces the two calls per product of generate_product_reviews; split the
+    result per product with split_batch_reviews. A response cut short by the
+    output budget may leave products out (see review_batch).
+    
+    Args:
+        client: GeminiRegionClient instance
+        products: Catalog entries keyed by product id
+        model_name: Gemini model to call
+        
+    Returns:
+        dict: The parsed response, one item per product under "produtos"
+    """
+    generation_config = BATCH_REVIEWS_PROMPT.generation_config(output_budget("batch_reviews"))
+    prompt = render_batch_reviews_prompt(products)
+    
+    response_text = client.generate_content(
+        prompt, generation_config=generation_config, stage="batch_reviews", model_name=model_name
+    )
+    return clean_json_response(response_text)
+
+
+def review_tokens_per_product() -> float:
+    """Expected output tokens of one product's reviews and summary, from observed usage."""
+    reviews = stage_usage_stats("reviews")
+    summary = stage_usage_stats("summary")
+    if not reviews or not summary or min(reviews["calls"], summary["calls"]) < OUTPUT_BUDGET_MIN_SAMPLES:
+        return BATCH_REVIEWS_TOKENS_PER_PRODUCT
+    return reviews["output_tokens"] / reviews["calls"] + summary["output_tokens"] / summary["calls"]
+
+
+def review_batch(client, products: Dict[str, Dict]) -> Dict[str, Dict]:
+    """
+    Review one batch of products in a single call.
+    
+    Products the response leaves out (usually because it ran into the output
+    budget) are retried in two smaller batches, so only they are paid for again.
+    
+    Args:
+        client: GeminiRegionClient instance
+        products: Catalog entries keyed by product id
+        
+    Returns:
+        dict: {"reviews": [...], "summary": {...}} keyed by product id
+        
+    Raises:
+        ValueError: If a product is still left out when reviewed on its own
+    """
+    batch_data = run_model_cascade(
+        "batch_reviews", functools.partial(generate_batch_reviews, client, products), BATCH_REVIEWS_MODEL
+    )
+    batch_reviews = split_batch_reviews(batch_data)
+    reviews = {product_id: batch_reviews[product_id] for product_id in products if product_id in batch_reviews}
+    
+    missing = [product_id for product_id in products if product_id not in reviews]
+    if not missing:
+        return reviews
+    if len(products) == 1:
+        raise ValueError(f"Batched reviews left out product {missing[0]}")
+    
+    logger.warning(f"Batched reviews left out {len(missing)} of {len(products)} products; retrying them")
+    half = (len(missing) + 1) // 2
+    for part in (missing[:half], missing[half:]):
+        if part:
+            reviews.update(review_batch(client, {product_id: products[product_id] for product_id in part}))
+    return reviews
+
+
+def generate_reviews_in_batches(client, products: Dict[str, Dict]) -> Dict[str, Dict]:
+    """
+    Review many products with as few calls as the output budget allows.
+    
+    Products are packed K to a call, with K sized from the batch_reviews output
+    budget and the expected output per product (see review_batch_size).
+    
+    Args:
+        client: GeminiRegionClient instance
+        products: Catalog entries keyed by product id
+        
+    Returns:
+        dict: {"reviews": [...], "summary": {...}} keyed by product id
+    """
+    batch_size = review_batch_size(
+        output_budget("batch_reviews"), review_tokens_per_product(), BATCH_REVIEWS_MAX_SIZE
+    )
+    product_ids = list(products)
+    reviews = {}
+    for start in range(0, len(product_ids), batch_size):
+        batch_ids = product_ids[start:start + batch_size]
+        reviews.update(review_batch(client, {product_id: products[product_id] for product_id in batch_ids}))
+    return reviews
+
+def close_spools(spools: List) -> None:
+    """Close upload spools; closing one twice is harmless."""
+    for spool in spools:
+        spool.close()
+
+
+def hash_spool(spool) -> str:
+    """Return the SHA-256 hex digest of a spooled upload, leaving it rewound to the start."""
+    digest = hashlib.sha256()
+    spool.seek(0)
+    for chunk in iter(lambda: spool.read(UPLOAD_CHUNK_BYTES), b""):
+        digest.update(chunk)
+    spool.seek(0)
+    return digest.hexdigest()
+
+
+async def take_upload_spool(upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES):
+    """
+    Take over the file Starlette spooled an upload into, without copying it.
+    
+    The UploadFile is left with an empty buffer, so closing the form after the
+    response does not close a spool that a shared run may still be reading;
+    the caller owns the spool and closes it (see close_spools).
+    
+    Args:
+        upload: The uploaded file
+        max_bytes: Maximum number of bytes accepted per file
+        
+    Returns:
+        tuple: (spooled file rewound to the start, SHA-256 hex digest of the upload)
+        
+    Raises:
+        HTTPException: 413 if the file is larger than max_bytes
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds the {max_bytes} byte limit")
+    spool, upload.file = upload.file, io.BytesIO()
+    try:
+        return spool, await run_in_threadpool(hash_spool, spool)
+    except BaseException:
+        spool.close()
+        raise
+
+
+def prepare_image(source, pixel_budget: int = IMAGE_PIXEL_BUDGET) -> Tuple[bytes, str]:
+    """
+    Validate an uploaded image and get the bytes to send to the model.
+    
+    The header is probed before any pixel decode; oversized images are rejected
+    or downscaled to pixel_budget. Images already within budget and in a
+    format the model accepts are passed through unchanged; anything else is
+    re-encoded as JPEG. This is CPU-bound and runs in the image worker pool,
+    so it must stay a picklable module-level function.
+    
+    Args:
+        source: Seekable binary file positioned at the start of the image, or raw bytes
+        pixel_budget: Maximum number of pixels sent to the model
+        
+    Returns:
+        tuple: (image bytes, MIME type)
+        
+    Raises:
+        ImageRejectedError: If the image exceeds the configured limits
+    """
+    buffer = io.BytesIO(source) if isinstance(source, bytes) else source
+    try:
+        image = Image.open(buffer)
+    except Image.DecompressionBombError as e:
+        raise ImageRejectedError(str(e)) from e
+    
+    probe = probe_image(image)
+    check_image_limits(probe, MAX_IMAGE_PIXELS, MAX_IMAGE_FRAMES)
+    
+    mime_type = MODEL_IMAGE_MIME_TYPES.get(image.format)
+    within_budget = probe["width"] * probe["height"] <= pixel_budget
+    
+    if mime_type and within_budget:
+        if isinstance(source, bytes):
+            return source, mime_type
+        buffer.seek(0)
+        return buffer.read(), mime_type
+    
+    image = downscale_to_budget(image, pixel_budget)
+    img_byte_arr = io.BytesIO()
+    flatten_to_rgb(image).save(img_byte_arr, format="JPEG")
+    return img_byte_arr.getvalue(), "image/jpeg"
+
+
+class ImageWorkerPool:
+    """
+    Runs CPU-bound image processing off the event loop with a concurrency cap.
+    """
+    
+    def __init__(self, mode: str = "thread", max_workers: int = 2, max_concurrency: int = 2):
+        """
+        Initialize the ImageWorkerPool.
+        
+        Args:
+            mode (str): "thread" or "process"
+            max_workers (int): Number of pool workers
+            max_concurrency (int): Maximum number of images processed at once
+        """
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Invalid image worker mode: {mode}")
+        
+        self.mode = mode
+        self.max_workers = max_workers
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._executor: Optional[Executor] = None
+    
+    def _get_executor(self) -> Executor:
+        """Create the executor on first use."""
+        if self._executor is None:
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="image-worker"
+                )
+        return self._executor
+    
+    async def run(self, func, *args):
+        """Run func(*args) in the pool once a concurrency slot is free."""
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+    
+    def shutdown(self) -> None:
+        """Shut down the underlying executor."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+image_pool = ImageWorkerPool(
+    mode=IMAGE_WORKER_MODE,
+    max_workers=IMAGE_WORKERS,
+    max_concurrency=IMAGE_CONCURRENCY
+)
+
+
+async def load_image_part(buffer, pixel_budget: int = IMAGE_PIXEL_BUDGET) -> ImageData:
+    """
+    Prepare an uploaded image for the model in the worker pool.
+    
+    Args:
+        buffer: Seekable binary file positioned at the start of the image
+        pixel_budget: Maximum number of pixels sent to the model
+        
+    Returns:
+        ImageData: Image bytes with the matching MIME type
+    """
+    # File objects can't cross process boundaries, so hand process workers the bytes
+    source = buffer.read() if image_pool.mode == "process" else buffer
+    data, mime_type = await image_pool.run(prepare_image, source, pixel_budget)
+    return ImageData(data, mime_type)
+
+
+async def load_image_parts(buffers: List) -> List[ImageData]:
+    """
+    Prepare the images of one product concurrently, splitting IMAGE_PIXEL_BUDGET between them.
+    
+    Args:
+        buffers: Seekable binary files positioned at the start of each image
+        
+    Returns:
+        list: Prepared images, in upload order
+    """
+    pixel_budget = IMAGE_PIXEL_BUDGET // len(buffers)
+    # Let every image finish before raising, so none is still reading a buffer the caller closes
+    parts = await asyncio.gather(
+        *(load_image_part(buffer, pixel_budget) for buffer in buffers), return_exceptions=True
     )
+    for part in parts:
+        if isinstance(part, BaseException):
+            raise part
+    return parts
+
+
+def combine_image_hashes(image_hashes: List[str]) -> str:
+    """Return the content hash of a product's images, in order; a single image keeps its own hash."""
+    if len(image_hashes) == 1:
+        return image_hashes[0]
+    return hashlib.sha256(",".join(image_hashes).encode("ascii")).hexdigest()
+
+
+class PipelineOptions(BaseModel):
+    """Options that change what the pipeline generates; part of every result key."""
+    fields: Optional[Tuple[str, ...]] = None
+    multi_product: bool = False
+    sharded_reviews: bool = REVIEWS_SHARDED
+    
+    @property
+    def version(self) -> str:
+        """Version stamp of the prompts, schemas and model these options run with."""
+        return pipeline_version(self.fields, STAGE_MODELS, MAX_PRODUCTS_PER_IMAGE, self.sharded_reviews)
+    
+    @property
+    def stages(self) -> Tuple[str, ...]:
+        """The pipeline stages these options run, in order."""
+        return MULTI_PRODUCT_STAGES if self.multi_product else PIPELINE_STAGES
+    
+    def cache_key(self, image_hash: str) -> str:
+        """Return the key for results generated from an upload with these options."""
+        return f"catalog:{self.version}:{image_hash}:{fingerprint(jsonable_encoder(self))}"
+
+
+class PipelineStageError(Exception):
+    """Raised when a pipeline stage fails; carries what the earlier stages produced."""
+    
+    def __init__(self, stage: str, results: Dict[str, Any], statuses: Dict[str, str], error: Exception):
+        super().__init__(f"Stage '{stage}' failed: {str(error)}")
+        self.stage = stage
+        self.results = results
+        self.statuses = statuses
+        self.usage: Optional[Dict[str, Any]] = None
+
+
+def checkpoint_key(cache_key: str, stage: str) -> str:
+    """Return the shared store key holding one stage's checkpoint."""
+    return f"{cache_key}:stage:{stage}"
+
+
+def load_checkpoints(cache_key: str, stages: Tuple[str, ...] = PIPELINE_STAGES) -> Dict[str, Any]:
+    """Return the stage results already checkpointed for a request key."""
+    checkpoints = {}
+    for stage in stages:
+        value = shared_store.cache_get(checkpoint_key(cache_key, stage))
+        if value is not None:
+            checkpoints[stage] = value
+    return checkpoints
 
-    summary_prompt = f"""Com base nas avaliações abaixo, gere um resumo conciso em português que destaque:
-    1. Pontos fortes mais mencionados (mínimo 3)
-    2. Principais críticas (se houver)
-    3. Sentimento geral dos usuários
-    4. Recomendações para potenciais compradores
 
-    Avaliações:
-    {json.dumps(reviews_data, ensure_ascii=False, indent=2)}
+def clear_checkpoints(cache_key: str, stages: Tuple[str, ...] = PIPELINE_STAGES) -> None:
+    """Drop a request key's checkpoints once its result is cached, so they don't outlive it."""
+    shared_store.cache_delete(*(checkpoint_key(cache_key, stage) for stage in stages))
 
-    A saída deve seguir estritamente o schema JSON fornecido.
+
+def run_catalog_pipeline(client, image_parts: Optional[List[ImageData]], cache_key: str,
+                         checkpoints: Dict[str, Any] = None,
+                         options: PipelineOptions = None) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Run the pipeline stages for one product's images, checkpointing each.
+    
+    That is catalog, reviews and summary, or in multi-product mode detection
+    and batch_reviews.
+    
+    Stages found in checkpoints are not run again, so a retry resumes at the
+    stage that failed and does not pay for the earlier model calls twice.
+    
+    Args:
+        client: GeminiRegionClient instance
+        image_parts: Images of the product; may be None when the catalog stage is checkpointed
+        cache_key: Request key the checkpoints are stored under
+        checkpoints: Stage results from earlier attempts
+        options: What to generate
+        
+    Returns:
+        tuple: (results per stage, status per stage)
+        
+    Raises:
+        PipelineStageError: If a stage fails
+    """
+    options = options or PipelineOptions()
+    results = dict(checkpoints or {})
+    statuses = {stage: "resumed" if stage in results else "pending" for stage in options.stages}
+    reviews_generator = generate_sharded_reviews if options.sharded_reviews else generate_reviews
+    # Bulk requests share batched reviews calls; the batch also yields the summary
+    coalesce_reviews = not options.multi_product and request_priority.get() in REVIEW_COALESCE_PRIORITIES
+    stage_runners = {
+        "catalog": lambda: run_model_cascade(
+            "catalog", functools.partial(generate_product_catalog_info, client, image_parts, options.fields)
+        ),
+        "reviews": lambda: review_coalescer.review(client, request_tenant.get(), results["catalog"])
+        if coalesce_reviews else run_model_cascade(
+            "reviews", functools.partial(reviews_generator, client, results["catalog"]), REVIEWS_MODEL
+        ),
+        "summary": lambda: results["reviews"].get("summary") or run_model_cascade(
+            "summary", functools.partial(generate_reviews_summary, client, results["reviews"]), SUMMARY_MODEL
+        ),
+        "detection": lambda: run_model_cascade(
+            "detection", functools.partial(detect_products, client, image_parts, options.fields)
+        ),
+        "batch_reviews": lambda: review_detected_products(client, results["detection"]),
+    }
+    
+    for stage in options.stages:
+        if stage in results:
+            continue
+        check_cancelled()
+        try:
+            results[stage] = stage_runners[stage]()
+        except Exception as e:
+            statuses[stage] = "failed"
+            raise PipelineStageError(stage, results, statuses, e) from e
+        shared_store.cache_set(checkpoint_key(cache_key, stage), results[stage], CHECKPOINT_TTL_SECONDS)
+        statuses[stage] = "completed"
+    
+    return results, statuses
+
+
+def review_detected_products(client, products: List[Dict[str, Any]]) -> Dict[str, Dict]:
     """
+    Review every detected product with batched calls (see generate_reviews_in_batches).
     
-    summary_response = client.generate_content(summary_prompt, generation_config=summary_generation_config)
-    summary_data = clean_json_response(summary_response)
+    Args:
+        client: GeminiRegionClient instance
+        products: Output of the detection stage
+        
+    Returns:
+        dict: {"reviews": [...], "summary": {...}} keyed by product id (1-based position)
+    """
+    catalogs = {str(number): product["catalog_info"] for number, product in enumerate(products, start=1)}
+    return generate_reviews_in_batches(client, catalogs)
+
+
+class ReviewCoalescer:
+    """
+    Reviews the products of concurrent requests together, in batched calls.
+    
+    The first request of a tenant opens a batch and waits up to window_seconds
+    (less if the batch fills up) for others to join, then reviews the batch
+    with review_batch and hands every request its product's reviews and summary.
+    Batches are per tenant, so tenants never share a call; the call's token usage
+    is recorded on the request that made it.
+    """
     
+    # How often a request waiting for its batch checks whether it was cancelled
+    CANCEL_CHECK_SECONDS = 0.5
+    
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._open: Dict[str, SimpleNamespace] = {}
+    
+    def review(self, client, tenant: str, product_info: Dict) -> Dict:
+        """
+        Get a product's reviews and summary from a batch shared with concurrent requests.
+        
+        Returns:
+            dict: {"reviews": [...], "summary": {...}}
+            
+        Raises:
+            ValueError: If the batch call fails or leaves the product out
+            RequestCancelled: If this request was cancelled while waiting
+        """
+        with self._lock:
+            batch = self._open.get(tenant)
+            leader = batch is None
+            if leader:
+                batch = SimpleNamespace(
+                    products={}, results={}, error=None, full=threading.Event(), done=threading.Event(),
+                    size=review_batch_size(output_budget("batch_reviews"), review_tokens_per_product(),
+                                           BATCH_REVIEWS_MAX_SIZE)
+                )
+                self._open[tenant] = batch
+            product_id = str(len(batch.products) + 1)
+            batch.products[product_id] = product_info
+            if len(batch.products) >= batch.size:
+                del self._open[tenant]
+                batch.full.set()
+        
+        if leader:
+            self._run(client, tenant, batch)
+        else:
+            while not batch.done.wait(self.CANCEL_CHECK_SECONDS):
+                check_cancelled()
+        
+        if batch.error is not None:
+            raise ValueError(f"Coalesced reviews failed: {batch.error}") from batch.error
+        return batch.results[product_id]
+    
+    def _run(self, client, tenant: str, batch: SimpleNamespace) -> None:
+        """Close the batch when it fills up or its window ends, then review it for every request."""
+        batch.full.wait(self.window_seconds)
+        with self._lock:
+            if self._open.get(tenant) is batch:
+                del self._open[tenant]
+        # The other requests depend on this call, so it is not cut short if this request is cancelled
+        context = contextvars.copy_context()
+        context.run(request_cancelled.set, None)
+        try:
+            batch.results = context.run(review_batch, client, batch.products)
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+        check_cancelled()
+
+
+review_coalescer = ReviewCoalescer(REVIEW_COALESCE_WINDOW_SECONDS)
+
+
+def assemble_result(results: Dict[str, Any], version: str, multi_product: bool = False) -> Dict[str, Any]:
+    """Build the API response body from the stage results available so far."""
+    if multi_product:
+        reviews = results.get("batch_reviews", {})
+        return {
+            "catalog_info": {},
+            "reviews_info": {},
+            "products": [
+                {**product, "reviews_info": reviews.get(str(number), {"reviews": [], "summary": None})}
+                for number, product in enumerate(results.get("detection", []), start=1)
+            ],
+            "pipeline_version": version
+        }
     return {
-        "reviews": reviews_data["reviews"],
-        "summary": summary_data
+        "catalog_info": results.get("catalog", {}),
+        "reviews_info": {
+            "reviews": results.get("reviews", {}).get("reviews", []),
+            "summary": results.get("summary")
+        },
+        "pipeline_version": version
     }
 
+
+class SingleFlight:
+    """
+    Deduplicates concurrent work that shares a key.
+    
+    The first caller for a key starts the work; callers arriving while it is
+    still running await the same task instead of starting their own. The work
+    is cancelled once every caller awaiting it has gone away. If that happens
+    before the work got to run at all, its own cleanup never runs either, so
+    the first caller's on_abandoned is called instead.
+    """
+    
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+    
+    def __contains__(self, key: str) -> bool:
+        return key in self._inflight
+    
+    async def run(self, key: str, func, *args, on_abandoned=None):
+        """
+        Run func(*args) for key, or join the run already in flight.
+        
+        Args:
+            key: Deduplication key
+            func: Coroutine function started only by the first caller
+            *args: Arguments for func
+            on_abandoned: Called if the run is cancelled before func started, to
+                release what was handed to it (e.g. close upload spools)
+            
+        Returns:
+            The result of the shared run
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            started = False
+            
+            async def start():
+                nonlocal started
+                started = True
+                return await func(*args)
+            
+            def abandon_unstarted(task: asyncio.Task) -> None:
+                if task.cancelled() and not started and on_abandoned is not None:
+                    on_abandoned()
+            
+            task = asyncio.ensure_future(start())
+            task.add_done_callback(abandon_unstarted)
+            self._inflight[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda _: (self._inflight.pop(key, None), self._waiters.pop(key, None)))
+        
+        # Shielded so one caller going away does not cancel the work for the others;
+        # when the last one goes, nobody wants the result any more
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if not task.done():
+                self._waiters[key] -= 1
+                if not self._waiters[key]:
+                    task.cancel()
+
+
+catalog_flights = SingleFlight()
+
+
+async def generate_catalog_result(client, spools: List, cache_key: str, options: PipelineOptions) -> Dict[str, Any]:
+    """
+    Prepare the uploaded images, run the model pipeline and cache the result.
+    
+    Takes ownership of the spools and closes them when done.
+    
+    Args:
+        client: GeminiRegionClient instance
+        spools: Buffers holding the uploaded images of one product
+        cache_key: Key the result is cached under
+        options: What to generate
+        
+    Returns:
+        dict: catalog_info, reviews_info, the status of each stage and token usage
+        
+    Raises:
+        PipelineStageError: If a stage fails
+    """
+    try:
+        # A retry resumes from the stages a previous attempt checkpointed
+        checkpoints = await run_in_threadpool(load_checkpoints, cache_key, options.stages)
+        
+        # Decode straight from the spools, off the event loop; not needed once the catalog exists
+        image_parts = None
+        if options.stages[0] not in checkpoints:
+            image_parts = await load_image_parts(spools)
+    finally:
+        close_spools(spools)
+    
+    # Run the model stages; the calls block, so keep them off the loop too.
+    # The thread inherits this task's context, so the calls report usage to the recorder;
+    # if this task is cancelled, the pipeline stops before its next model call
+    usage = UsageRecorder()
+    request_usage.set(usage)
+    try:
+        results, statuses = await run_cancellable(
+            run_catalog_pipeline, client, image_parts, cache_key, checkpoints, options
+        )
+    except PipelineStageError as e:
+        e.usage = usage.summary()
+        raise
+    
+    result = assemble_result(results, options.version, options.multi_product)
+    await run_in_threadpool(shared_store.cache_set, cache_key, result, RESULT_CACHE_TTL_SECONDS)
+    await run_in_threadpool(clear_checkpoints, cache_key, options.stages)
+    return {**result, "stages": statuses, "usage": usage.summary()}
+
+idempotency_flights = SingleFlight()
+
+
+async def execute_idempotent(store_key: str, fingerprint: str, func, *args) -> Tuple[int, Any]:
+    """
+    Run a request handler once for an idempotency key and store its outcome.
+    
+    Successful and client-error outcomes are kept for IDEMPOTENCY_TTL_SECONDS;
+    server errors release the key so a retry runs again.
+    
+    Returns:
+        tuple: (status code, JSON body)
+    """
+    try:
+        status_code, body = 200, jsonable_encoder(await func(*args))
+    except HTTPException as e:
+        if e.status_code >= 500:
+            await run_in_threadpool(shared_store.cache_delete, store_key)
+            raise
+        status_code, body = e.status_code, {"detail": e.detail}
+    except BaseException:
+        await run_in_threadpool(shared_store.cache_delete, store_key)
+        raise
+    
+    record = {"state": "completed", "fingerprint": fingerprint, "status_code": status_code, "body": body}
+    await run_in_threadpool(shared_store.cache_set, store_key, record, IDEMPOTENCY_TTL_SECONDS)
+    return status_code, body
+
+
+async def run_idempotent(key: str, fingerprint: str, func, *args, on_abandoned=None) -> Tuple[int, Any, bool]:
+    """
+    Run func(*args) at most once per idempotency key.
+    
+    A repeated key returns the stored outcome, joins the run in flight in this
+    worker, or waits up to IDEMPOTENCY_WAIT_SECONDS for a run in another worker.
+    
+    Args:
+        key: Client-supplied Idempotency-Key, prefixed with the tenant
+        fingerprint: Identifies the request payload; reusing a key for a different payload is rejected
+        func: Coroutine function handling the request
+        *args: Arguments for func
+        on_abandoned: Called if this run is cancelled before func started (see SingleFlight)
+        
+    Returns:
+        tuple: (status code, JSON body, whether the outcome was replayed)
+        
+    Raises:
+        HTTPException: 422 if the key was used for a different request, 409 if
+            another worker is still running it after the wait
+    """
+    store_key = f"idempotency:{key}"
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    
+    while True:
+        record = await run_in_threadpool(shared_store.cache_get, store_key)
+        if record and record["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if record and record["state"] == "completed":
+            return record["status_code"], record["body"], True
+        if store_key in idempotency_flights:
+            status_code, body = await idempotency_flights.run(store_key, None)
+            return status_code, body, True
+        if record is None:
+            claimed = await run_in_threadpool(
+                shared_store.cache_add, store_key,
+                {"state": "in_progress", "fingerprint": fingerprint}, IDEMPOTENCY_LOCK_SECONDS
+            )
+            if claimed:
+                break
+            continue
+        
+        # Another worker is running this key
+        if time.monotonic() > deadline:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        await asyncio.sleep(0.5)
+    
+    def abandoned() -> None:
+        # execute_idempotent never ran, so release the key it would have released
+        asyncio.ensure_future(run_in_threadpool(shared_store.cache_delete, store_key))
+        if on_abandoned is not None:
+            on_abandoned()
+    
+    status_code, body = await idempotency_flights.run(
+        store_key, execute_idempotent, store_key, fingerprint, func, *args, on_abandoned=abandoned
+    )
+    return status_code, body, False
+
+_gemini_client: Optional[GeminiRegionClient] = None
+_gemini_client_lock = threading.Lock()
+
+
+def get_gemini_client() -> GeminiRegionClient:
+    """Return the process-wide Gemini client, creating it on first use."""
+    global _gemini_client
+    with _gemini_client_lock:
+        if _gemini_client is None:
+            _gemini_client = GeminiRegionClient(
+                logger=logger,
+                store=shared_store,
+                requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+                call_timeouts=MODEL_CALL_TIMEOUTS,
+                call_workers=MODEL_CALL_WORKERS,
+                scheduler=model_scheduler
+            )
+        return _gemini_client
+
+
+async def run_warmup() -> None:
+    """
+    Pre-create region clients (and optionally probe each region), then mark the app ready.
+    
+    Retries every WARMUP_RETRY_SECONDS until at least one region warms up.
+    """
+    while True:
+        try:
+            client = await run_in_threadpool(get_gemini_client)
+            model_names = tuple(dict.fromkeys(name for tiers in STAGE_MODELS.values() for name in tiers))
+            results = await asyncio.gather(
+                *(run_in_threadpool(client.warm_region, region, WARMUP_PROBE, model_names)
+                  for region in client.regions),
+                return_exceptions=True
+            )
+            for region, result in zip(client.regions, results):
+                if isinstance(result, Exception):
+                    logger.warning(f"Warm-up failed for region {region}: {str(result)}")
+                    app.state.warmup[region] = {"status": "failed", "error": str(result)}
+                else:
+                    app.state.warmup[region] = {"status": "ok", **result}
+            
+            if any(region["status"] == "ok" for region in app.state.warmup.values()):
+                app.state.ready = True
+                logger.info("Warm-up complete; ready for traffic")
+                return
+            logger.error(f"Warm-up failed in every region; retrying in {WARMUP_RETRY_SECONDS}s")
+        except Exception as e:
+            logger.error(f"Warm-up failed: {str(e)}; retrying in {WARMUP_RETRY_SECONDS}s", exc_info=True)
+        
+        await asyncio.sleep(WARMUP_RETRY_SECONDS)
+
 # API Models
 class ProductInfo(BaseModel):
     catalog_info: Dict[str, Any]
     reviews_info: Dict[str, Any]
+    stages: Dict[str, str] = {}
+    errors: Optional[Dict[str, str]] = None
+    usage: Optional[Dict[str, Any]] = None
+    pipeline_version: Optional[str] = None
+    products: Optional[List[Dict[str, Any]]] = None
+
+# Lifecycle
+@app.on_event("startup")
+async def start_warmup():
+    app.state.ready = not WARMUP_ENABLED
+    app.state.warmup = {}
+    app.state.warmup_task = asyncio.create_task(run_warmup()) if WARMUP_ENABLED else None
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    if app.state.warmup_task is not None:
+        app.state.warmup_task.cancel()
+    image_pool.shutdown()
+    for executor in (*pipeline_executors.values(), *review_shard_executors.values()):
+        executor.shutdown(wait=False, cancel_futures=True)
+    if _gemini_client is not None:
+        _gemini_client.shutdown()
 
 # API Routes
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Pic2Catalog API"}
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness probe; never loads the Vertex AI SDK."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness probe; 503 until the startup warm-up has finished."""
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up", "regions": app.state.warmup})
+    return {"status": "ready", "regions": app.state.warmup}
+
+async def authenticate_tenant(x_api_key: Optional[str] = Header(None, alias="X-API-Key")) -> str:
+    """Resolve the tenant of a request from its X-API-Key header (see TENANT_API_KEYS)."""
+    if not TENANT_API_KEYS:
+        return DEFAULT_TENANT
+    tenant = TENANT_API_KEYS.get(x_api_key) if x_api_key else None
+    if tenant is None:
+        raise HTTPException(status_code=401, detail="Missing or unknown API key", headers={"WWW-Authenticate": "ApiKey"})
+    return tenant
+
+
+class TenantAdmission:
+    """
+    Enforces per-tenant request limits and counts each tenant's requests.
+    
+    Concurrency is limited per worker process; the rate limit is a token bucket
+    in the shared store, so it holds across workers.
+    """
+    
+    def __init__(self, store: SharedStore):
+        self.store = store
+        self._active: Dict[str, int] = {}
+    
+    @staticmethod
+    def limits(tenant: str) -> Tuple[int, float]:
+        """Return a tenant's (max concurrency, requests per minute)."""
+        return TENANT_LIMITS.get(tenant, (TENANT_MAX_CONCURRENCY, TENANT_REQUESTS_PER_MINUTE))
+    
+    def active(self) -> Dict[str, int]:
+        """Return the requests in progress per tenant in this worker."""
+        return {tenant: count for tenant, count in self._active.items() if count}
+    
+    @contextlib.asynccontextmanager
+    async def admit(self, tenant: str):
+        """
+        Hold one of the tenant's request slots for the duration of the block.
+        
+        Raises:
+            HTTPException: 429 (with Retry-After) if the tenant is at its concurrency or rate limit
+        """
+        max_concurrency, requests_per_minute = self.limits(tenant)
+        if max_concurrency and self._active.get(tenant, 0) >= max_concurrency:
+            await run_in_threadpool(self.store.record_tenant_usage, tenant, throttled=1)
+            raise HTTPException(
+                status_code=429, detail=f"Too many requests in progress (limit {max_concurrency})",
+                headers={"Retry-After": "1"}
+            )
+        # Reserve the slot before awaiting anything, so concurrent requests see it
+        self._active[tenant] = self._active.get(tenant, 0) + 1
+        try:
+            if requests_per_minute:
+                wait_seconds = await run_in_threadpool(
+                    self.store.acquire_token, f"tenant:{tenant}", requests_per_minute / 60, TENANT_RATE_LIMIT_BURST
+                )
+                if wait_seconds:
+                    await run_in_threadpool(self.store.record_tenant_usage, tenant, throttled=1)
+                    raise HTTPException(
+                        status_code=429, detail=f"Rate limit of {requests_per_minute:g} requests per minute exceeded",
+                        headers={"Retry-After": str(math.ceil(wait_seconds))}
+                    )
+            await run_in_threadpool(self.store.record_tenant_usage, tenant, requests=1)
+            yield
+        finally:
+            self._active[tenant] -= 1
+
+
+tenant_admission = TenantAdmission(shared_store)
+
+async def process_catalog_request(gemini_client, spools: List, image_hash: str, partial: bool,
+                                  include_usage: bool = False,
+                                  options: PipelineOptions = None) -> ProductInfo:
+    """
+    Produce the /generate_catalog response for uploads already in spools.
+    
+    Takes ownership of the spools.
+    
+    Args:
+        gemini_client: GeminiRegionClient instance
+        spools: Buffers holding the uploaded images of one product
+        image_hash: Content hash of the uploads (see combine_image_hashes)
+        partial: Return partial results with per-stage status when a later stage fails
+        include_usage: Include the token usage of the model calls in the response
+        options: What to generate
+        
+    Returns:
+        ProductInfo: The generated catalog entry and reviews
+    """
+    options = options or PipelineOptions()
+    cache_key = options.cache_key(image_hash)
+    
+    # Process uploaded image
+    spool_handed_off = False
+    try:
+        # Results are shared by every worker, so check the cache before any image work
+        cached = await run_in_threadpool(shared_store.cache_get, cache_key)
+        if cached:
+            await run_in_threadpool(shared_store.record_tenant_usage, request_tenant.get(), cache_hits=1)
+            return ProductInfo(**cached, stages={stage: "cached" for stage in options.stages})
+        
+        # Identical uploads already in flight share one generation; only the first
+        # request's spools are used, and generate_catalog_result closes them
+        spool_handed_off = cache_key not in catalog_flights
+        result = await catalog_flights.run(
+            cache_key, generate_catalog_result, gemini_client, spools, cache_key, options,
+            on_abandoned=functools.partial(close_spools, spools)
+        )
+        if not include_usage:
+            result = {**result, "usage": None}
+        return ProductInfo(**result)
+        
+    except ImageRejectedError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except PipelineStageError as e:
+        logger.error(f"Error processing image: {str(e)}", exc_info=True)
+        if partial and options.stages[0] in e.results:
+            return ProductInfo(
+                **assemble_result(e.results, options.version, options.multi_product),
+                stages=e.statuses,
+                errors={e.stage: str(e.__cause__)},
+                usage=e.usage if include_usage else None
+            )
+        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error processing image: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+    finally:
+        if not spool_handed_off:
+            close_spools(spools)
+
+async def is_usage_admin(x_admin_key: Optional[str] = Header(None, alias="X-Admin-Key")) -> bool:
+    """Whether a request may see usage across all tenants (see USAGE_ADMIN_API_KEY)."""
+    if not TENANT_API_KEYS:
+        return True
+    return bool(USAGE_ADMIN_API_KEY) and x_admin_key is not None and hmac.compare_digest(
+        x_admin_key.encode(), USAGE_ADMIN_API_KEY.encode()
+    )
+
+@app.get("/usage")
+async def usage_report(tenant: str = Depends(authenticate_tenant), admin: bool = Depends(is_usage_admin)):
+    """
+    The tenant section holds the calling tenant's counters (requests, throttled
+    requests, cache hits, model calls and tokens) and limits.
+    
+    Usage across all tenants is added for admins (every caller when tenants are
+    not configured): token usage per stage and region across all workers, with
+    the output budgets in use and suggested, and how often each model tier's
+    output was accepted. The scheduler section covers this worker process only.
+    """
+    tenant_report = {
+        "name": tenant,
+        **(await run_in_threadpool(shared_store.tenant_stats, tenant)).get(
+            tenant, dict.fromkeys(SharedStore.TENANT_COUNTERS, 0)
+        ),
+        "max_concurrency": TenantAdmission.limits(tenant)[0],
+        "requests_per_minute": TenantAdmission.limits(tenant)[1],
+        "in_progress": tenant_admission.active().get(tenant, 0),
+    }
+    if not admin:
+        return {"tenant": tenant_report}
+    
+    stats = await run_in_threadpool(shared_store.usage_stats)
+    stages = {}
+    for stage, regions in stats.items():
+        totals = await run_in_threadpool(stage_usage_stats, stage)
+        stages[stage] = {
+            "calls": totals["calls"],
+            "prompt_tokens": totals["prompt_tokens"],
+            "output_tokens": totals["output_tokens"],
+            "mean_output_tokens": totals["output_tokens"] / totals["calls"],
+            "max_output_tokens": totals["max_output_tokens"],
+            "regions": {
+                region: {key: value for key, value in region_stats.items() if key != "output_tokens_squared"}
+                for region, region_stats in regions.items()
+            },
+        }
+        if stage in STAGE_OUTPUT_BUDGETS:
+            stages[stage]["configured_budget"] = STAGE_OUTPUT_BUDGETS[stage]
+            stages[stage]["suggested_budget"] = suggest_output_budget(totals)
+            stages[stage]["budget_in_use"] = await run_in_threadpool(output_budget, stage)
+    
+    cascade = {}
+    for stage, models in (await run_in_threadpool(shared_store.cascade_stats)).items():
+        cascade[stage] = {
+            "tiers": list(STAGE_MODELS.get(stage, ())),
+            "models": {
+                model: {**counts, "hit_rate": counts["accepted"] / counts["attempts"]}
+                for model, counts in models.items()
+            },
+        }
+    return {
+        "autotune": OUTPUT_BUDGET_AUTOTUNE,
+        "stages": stages,
+        "cascade": cascade,
+        "scheduler": model_scheduler.stats(),
+        "tenant": tenant_report,
+    }
+
+async def cancel_on_disconnect(request: Request, coro):
+    """
+    Await coro, cancelling it as soon as the client disconnects.
+    
+    Cancellation runs down to the pipeline: pending stages are skipped, the model
+    call in progress is abandoned and no further calls, retries or region
+    fallbacks are made (see run_cancellable). Work shared with other requests
+    through SingleFlight keeps running for them.
+    
+    Args:
+        request: The request being served
+        coro: Coroutine producing the response
+        
+    Returns:
+        The result of coro, or a 499 response if the client went away first
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                break
+    finally:
+        task.cancel()
+    
+    logger.info(f"Client disconnected; cancelled {request.method} {request.url.path}")
+    with contextlib.suppress(BaseException):
+        await task
+    return JSONResponse(status_code=499, content={"detail": "Client closed request"})
+
 @app.post("/generate_catalog", response_model=ProductInfo)
-async def create_product_catalog(file: UploadFile = File(...)):
-    """Generate product catalog information from an uploaded image"""
+async def create_product_catalog(request: Request, file: List[UploadFile] = File(...), partial: bool = False, usage: bool = False,
+                                 fields: Optional[str] = None, multi_product: bool = False,
+                                 sharded_reviews: Optional[bool] = None, priority: str = DEFAULT_PRIORITY,
+                                 idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+                                 tenant: str = Depends(authenticate_tenant)):
+    """
+    Generate product catalog information from an uploaded image.
+    
+    Several images of the same product (e.g. different angles) can be sent as
+    repeated "file" parts, up to MAX_IMAGES_PER_PRODUCT. They go to the model in
+    a single catalog call and share the image pixel budget.
+    
+    With partial=true, a failing stage returns what the earlier stages produced,
+    with per-stage status, instead of an error. Either way the completed stages
+    are checkpointed, so retrying the same upload resumes at the failed stage.
+    
+    With fields (comma-separated catalog field names or aliases such as
+    "name,category,short_description"), only those catalog fields are requested
+    from the model, which shrinks the prompt, schema and output.
+    
+    With multi_product=true, a single shelf or flat-lay photo is searched for
+    every product in it (up to MAX_PRODUCTS_PER_IMAGE). The response lists them
+    under "products", each with its bounding box ([ymin, xmin, ymax, xmax],
+    normalized to 0-1000), catalog entry and reviews; the reviews of all the
+    products come from batched calls.
+    
+    With sharded_reviews=true, the reviews are generated by parallel, shorter
+    calls (one per reviewer profile) that are merged and de-duplicated, which
+    lowers latency at a small extra cost. Defaults to REVIEWS_SHARDED.
+    
+    With usage=true, the response includes the token usage of the model calls,
+    per stage and per region.
+    
+    With an Idempotency-Key header, a repeated key returns the stored response
+    (or joins the request still in flight) instead of generating again.
+    
+    With priority (a class of PRIORITY_WEIGHTS: interactive, batch or backfill),
+    bulk jobs can yield to interactive requests: model calls are admitted in
+    weighted fair order across classes whenever the MODEL_CONCURRENCY slots are busy.
+    
+    If the client disconnects before the response is ready, the pending stages
+    and model calls are cancelled (unless an identical request shares them).
+    
+    When TENANT_API_KEYS is set, requests must carry a tenant's key in X-API-Key.
+    Each tenant has its own concurrency and rate limits (429 when exceeded),
+    usage counters and idempotency keys, and the model calls of tenants with the
+    same priority share the model slots fairly.
+    """
     
     # Check for project ID
     project_id = os.environ.get("GCP_PROJECT")
     if not project_id:
         raise HTTPException(status_code=500, detail="GCP_PROJECT environment variable not set")
     
-    # Initialize Gemini client
+    # Get the shared Gemini client
     try:
-        gemini_client = GeminiRegionClient(project_id=project_id, logger=logger)
+        gemini_client = get_gemini_client()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to initialize Gemini client: {str(e)}")
     
-    # Process uploaded image
     try:
-        # Read image file
-        contents = await file.read()
-        
-        # Convert to PIL Image for validation and possible processing
-        image = Image.open(io.BytesIO(contents))
-        
-        # Convert image back to bytes for API call
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format=image.format or 'JPEG')
-        image_bytes = img_byte_arr.getvalue()
-        
-        # Generate catalog information
-        catalog_info = generate_product_catalog_info(gemini_client, image_bytes)
-        
-        # Generate reviews
-        reviews_info = generate_product_reviews(gemini_client, catalog_info)
-        
-        return ProductInfo(catalog_info=catalog_info, reviews_info=reviews_info)
+        options = PipelineOptions(
+            fields=resolve_catalog_fields(fields),
+            multi_product=multi_product,
+            sharded_reviews=REVIEWS_SHARDED if sharded_reviews is None else sharded_reviews
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    if priority not in PRIORITY_WEIGHTS:
+        raise HTTPException(
+            status_code=422, detail=f"Unknown priority '{priority}'; expected one of: {', '.join(PRIORITY_WEIGHTS)}"
+        )
+    # Model calls made for this request, in any thread, are scheduled with its priority
+    # and tenant, and their token usage is counted for the tenant
+    request_priority.set(priority)
+    request_tenant.set(tenant)
+    
+    if multi_product and len(file) > 1:
+        raise HTTPException(status_code=422, detail="Multi-product mode takes a single image")
+    if len(file) > MAX_IMAGES_PER_PRODUCT:
+        raise HTTPException(
+            status_code=422, detail=f"At most {MAX_IMAGES_PER_PRODUCT} images per product are accepted"
+        )
+    
+    async with tenant_admission.admit(tenant):
+        return await serve_catalog_request(
+            request, gemini_client, file, partial, usage, options, idempotency_key, tenant
+        )
+
+
+async def serve_catalog_request(request: Request, gemini_client, file: List[UploadFile], partial: bool,
+                                usage: bool, options: PipelineOptions, idempotency_key: Optional[str],
+                                tenant: str = DEFAULT_TENANT):
+    """
+    Read the uploads and produce the /generate_catalog response, once per
+    idempotency key if one was sent (keys are scoped to the tenant).
+    """
+    # Take over the files the uploads were spooled into (the body size was capped while
+    # it was received) and hash them
+    spools = []
+    image_hashes = []
+    try:
+        for upload in file:
+            spool, upload_hash = await take_upload_spool(upload)
+            spools.append(spool)
+            image_hashes.append(upload_hash)
+    except BaseException:
+        close_spools(spools)
+        raise
+    image_hash = combine_image_hashes(image_hashes)
+    
+    if not idempotency_key:
+        return await cancel_on_disconnect(
+            request, process_catalog_request(gemini_client, spools, image_hash, partial, usage, options)
+        )
+    
+    tenant_key = f"{tenant}:{idempotency_key}"
+    try:
+        outcome = await cancel_on_disconnect(request, run_idempotent(
+            tenant_key, f"{options.cache_key(image_hash)}:{partial}:{usage}",
+            process_catalog_request, gemini_client, spools, image_hash, partial, usage, options,
+            on_abandoned=functools.partial(close_spools, spools)
+        ))
+    finally:
+        # A run still in flight (we were cancelled) may be reading these spools and owns them;
+        # otherwise they are no longer needed, and closing them twice is harmless
+        if f"idempotency:{tenant_key}" not in idempotency_flights:
+            close_spools(spools)
+    
+    if isinstance(outcome, JSONResponse):
+        return outcome
+    status_code, body, replayed = outcome
+    if replayed:
+        await run_in_threadpool(shared_store.record_tenant_usage, tenant, cache_hits=1)
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return JSONResponse(status_code=status_code, content=body, headers=headers)
+
+def run_production(host: str, port: int, workers: int) -> None:
+    """
+    Serve the app with several preloaded worker processes.
+    
+    Uses gunicorn with uvicorn workers when available, so the app (and the Vertex AI
+    SDK) is imported once in the master and shared copy-on-write by the forked
+    workers. Falls back to uvicorn's own multi-process mode otherwise.
+    
+    Args:
+        host: Interface to bind
+        port: Port to bind
+        workers: Number of worker processes
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        logger.warning("gunicorn is not installed; starting uvicorn workers without preloading")
+        import uvicorn
+        uvicorn.run("main:app", host=host, port=port, workers=workers)
+        return
+    
+    # Preload the SDK modules in the master; clients and channels are still created per worker
+    vertex_sdk()
+    
+    class ProductionApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", "uvicorn.workers.UvicornWorker")
+            self.cfg.set("preload_app", True)
         
-    except Exception as e:
-        logger.error(f"Error processing image: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+        def load(self):
+            return app
+    
+    ProductionApplication().run()
+
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Run the Pic2Catalog API")
+    parser.add_argument("--production", action="store_true",
+                        help="Run several preloaded workers without auto-reload")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+                        help="Number of worker processes in production mode")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    args = parser.parse_args()
+    
+    if args.production:
+        run_production(args.host, args.port, args.workers)
+    else:
+        import uvicorn
+        uvicorn.run("main:app", host=args.host, port=args.port, reload=True) 
\ No newline at end of file
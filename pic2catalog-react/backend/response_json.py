@@ -0,0 +1,204 @@
+import json
+import logging
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# orjson is optional; when installed it parses model responses several times faster
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover - depends on the environment
+    _loads = json.loads
+
+FENCE = "```"
+WHITESPACE = " \t\r\n"
+CLOSERS = {"{": "}", "[": "]"}
+
+
+def extract_json_text(response_text: str) -> str:
+    """
+    Return the JSON payload of a model response in a single pass.
+
+    Takes the body of the fenced code block if there is one (a missing closing
+    fence is tolerated, since truncated responses lose it), otherwise the whole
+    response, from its first brace or bracket on; this skips the language tag
+    whether or not the fence is on a line of its own.
+
+    Args:
+        response_text: The raw text response from Gemini
+
+    Returns:
+        str: The text to parse as JSON
+    """
+    fence_start = response_text.find(FENCE)
+    if fence_start != -1:
+        # The language tag is left for the brace search below to skip, which also
+        # covers single-line fences such as ```json {"a": 1}```
+        body_start = fence_start + len(FENCE)
+        body_end = response_text.rfind(FENCE, body_start)
+        text = response_text[body_start:] if body_end == -1 else response_text[body_start:body_end]
+    else:
+        text = response_text
+
+    starts = [position for position in (text.find("{"), text.find("[")) if position != -1]
+    if starts:
+        return text[min(starts):]
+    if fence_start != -1 and "\n" in text:
+        # A scalar on the lines after the language tag
+        text = text.split("\n", 1)[1]
+    return text.strip()
+
+
+def repair_json_text(text: str) -> Optional[str]:
+    """
+    Repair the common defects of model JSON output, in a single scan.
+
+    - Output cut off mid-value is trimmed back and every open array and object
+      is closed. Inside an array, the whole incomplete trailing element is
+      dropped, so a cut-off review never shows up as a partial object; only
+      objects outside any array keep their complete members.
+    - Trailing commas before a closing bracket are dropped.
+    - Anything after the top-level value (stray prose, a second fence) is ignored.
+
+    Args:
+        text: JSON text that failed to parse
+
+    Returns:
+        str: The repaired text, or None if the text is not repairable
+            (mismatched brackets, or no complete value at all)
+    """
+    stack = []
+    # Per open bracket: for arrays, where its last complete element ends and the
+    # closers needed there; None for objects
+    element_ends = []
+    in_string = False
+    string_is_key = False
+    escaped = False
+    expect_key = False
+    in_literal = False
+    last_significant = ""
+    last_comma = -1
+    dropped_commas = []
+
+    # End of the last complete value and the brackets still open at that point
+    safe_end = 0
+    safe_closers = ""
+
+    def value_completed(end: int) -> None:
+        nonlocal safe_end, safe_closers
+        safe_end, safe_closers = end, "".join(reversed(stack))
+        if stack and stack[-1] == "]":
+            element_ends[-1] = (safe_end, safe_closers)
+
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+                last_significant = char
+                if not string_is_key:
+                    value_completed(index + 1)
+            continue
+
+        if in_literal:
+            if char not in WHITESPACE and char not in ",]}":
+                continue
+            # Numbers, true, false and null are only complete once a delimiter follows
+            in_literal = False
+            value_completed(index)
+
+        if char in WHITESPACE:
+            continue
+
+        if char == '"':
+            in_string = True
+            string_is_key = expect_key
+        elif char in CLOSERS:
+            stack.append(CLOSERS[char])
+            element_ends.append(None)
+            expect_key = char == "{"
+            safe_end, safe_closers = index + 1, "".join(reversed(stack))
+            if char == "[":
+                element_ends[-1] = (safe_end, safe_closers)
+        elif char in "]}":
+            if not stack or stack[-1] != char:
+                return None
+            if last_significant == ",":
+                dropped_commas.append(last_comma)
+            stack.pop()
+            element_ends.pop()
+            expect_key = False
+            value_completed(index + 1)
+            if not stack:
+                break
+        elif char == ",":
+            expect_key = bool(stack) and stack[-1] == "}"
+            last_comma = index
+        elif char == ":":
+            expect_key = False
+        else:
+            in_literal = True
+        last_significant = char
+
+    if stack:
+        # Cut off: everything after the last complete element of the outermost
+        # open array belongs to an element that never finished
+        array_ends = [end for end in element_ends if end is not None]
+        if array_ends:
+            safe_end, safe_closers = array_ends[0]
+
+    if safe_end == 0:
+        return None
+
+    pieces = []
+    previous = 0
+    for comma in dropped_commas:
+        if comma >= safe_end:
+            break
+        pieces.append(text[previous:comma])
+        previous = comma + 1
+    pieces.append(text[previous:safe_end])
+
+    return "".join(pieces) + safe_closers
+
+
+def clean_json_response(response_text: str) -> Any:
+    """
+    Extract and parse the JSON in a Gemini response, repairing it if needed.
+
+    Repairing a truncated or slightly malformed response is much cheaper than
+    regenerating it, so ValueError is only raised when nothing usable is left.
+
+    Args:
+        response_text: The raw text response from Gemini
+
+    Returns:
+        dict: Parsed JSON object
+    """
+    text = extract_json_text(response_text)
+    try:
+        return _loads(text)
+    except ValueError as e:
+        parse_error = e
+
+    repaired = repair_json_text(text)
+    if repaired is not None:
+        try:
+            result = _loads(repaired)
+        except ValueError:
+            pass
+        else:
+            logger.warning(
+                f"Repaired malformed JSON response ({parse_error}); "
+                f"kept {len(repaired)} of {len(text)} characters"
+            )
+            return result
+
+    logger.error(f"JSON parsing error: {parse_error}")
+    logger.error(f"Cleaned text: {text}")
+    raise ValueError(f"Failed to parse JSON response: {parse_error}")
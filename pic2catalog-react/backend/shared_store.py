@@ -0,0 +1,310 @@
+import os
+import json
+import contextlib
+import logging
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Default location of the store shared by all workers on this host
+DEFAULT_STORE_PATH = os.path.join(tempfile.gettempdir(), "pic2catalog-store.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS region_stats (
+    region TEXT PRIMARY KEY,
+    latency_ms REAL,
+    successes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS usage_stats (
+    stage TEXT NOT NULL,
+    region TEXT NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens_squared REAL NOT NULL DEFAULT 0,
+    max_output_tokens INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (stage, region)
+);
+CREATE TABLE IF NOT EXISTS cascade_stats (
+    stage TEXT NOT NULL,
+    model TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    accepted INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (stage, model)
+);
+CREATE TABLE IF NOT EXISTS tenant_usage (
+    tenant TEXT PRIMARY KEY,
+    requests INTEGER NOT NULL DEFAULT 0,
+    throttled INTEGER NOT NULL DEFAULT 0,
+    cache_hits INTEGER NOT NULL DEFAULT 0,
+    calls INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS rate_limits (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class SharedStore:
+    """
+    A small SQLite-backed store shared by every worker process on the host.
+
+    Holds the result cache, region health, token usage, model cascade and
+    per-tenant usage stats, and rate limiter state, so that running several workers does not multiply
+    cache misses or quota overruns.
+    The database runs in WAL mode, so readers never block the single writer.
+    """
+
+    def __init__(self, path: str = None):
+        """
+        Initialize the SharedStore.
+
+        Args:
+            path (str, optional): SQLite database file. If None, uses SHARED_STORE_PATH
+                or a file in the system temp directory.
+        """
+        self.path = path or os.environ.get("SHARED_STORE_PATH", DEFAULT_STORE_PATH)
+        self._local = threading.local()
+
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening a new one after a fork."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Open a write transaction that takes the database lock up front."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # Result cache
+
+    def cache_get(self, key: str) -> Optional[Any]:
+        """Return the cached JSON value for key, or None if missing or expired."""
+        row = self._connect().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?",
+            (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def cache_set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        """Store a JSON-serializable value under key for ttl_seconds."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now + ttl_seconds)
+            )
+            # Expired rows are swept opportunistically on writes
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+
+    def cache_add(self, key: str, value: Any, ttl_seconds: float) -> bool:
+        """Store a value only if key is missing or expired; returns whether it was stored."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now + ttl_seconds)
+            )
+        return True
+
+    def cache_delete(self, *keys: str) -> None:
+        """Remove keys from the cache."""
+        with self._transaction() as conn:
+            conn.executemany("DELETE FROM cache WHERE key = ?", [(key,) for key in keys])
+
+    # Region health stats
+
+    def record_region_result(self, region: str, latency_ms: float = None, smoothing: float = 0.2) -> None:
+        """
+        Record a call outcome for a region; a missing latency counts as a failure.
+
+        Args:
+            region: Region the call went to
+            latency_ms: Call latency, or None if the call failed
+            smoothing: Weight of the newest sample in the latency moving average
+        """
+        with self._transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO region_stats (region) VALUES (?)", (region,))
+            if latency_ms is None:
+                conn.execute("UPDATE region_stats SET failures = failures + 1 WHERE region = ?", (region,))
+            else:
+                conn.execute(
+                    """UPDATE region_stats
+                       SET successes = successes + 1,
+                           latency_ms = CASE WHEN latency_ms IS NULL THEN ?
+                                             ELSE latency_ms + ? * (? - latency_ms) END
+                       WHERE region = ?""",
+                    (latency_ms, smoothing, latency_ms, region)
+                )
+
+    def region_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return the stats recorded for every region."""
+        rows = self._connect().execute(
+            "SELECT region, latency_ms, successes, failures FROM region_stats"
+        ).fetchall()
+        return {
+            region: {"latency_ms": latency_ms, "successes": successes, "failures": failures}
+            for region, latency_ms, successes, failures in rows
+        }
+
+    # Token usage
+
+    def record_usage(self, stage: str, region: str, prompt_tokens: int, output_tokens: int) -> None:
+        """Add one model call's token usage to the per-stage, per-region totals."""
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO usage_stats (stage, region) VALUES (?, ?)", (stage, region)
+            )
+            conn.execute(
+                """UPDATE usage_stats
+                   SET calls = calls + 1,
+                       prompt_tokens = prompt_tokens + ?,
+                       output_tokens = output_tokens + ?,
+                       output_tokens_squared = output_tokens_squared + ?,
+                       max_output_tokens = MAX(max_output_tokens, ?)
+                   WHERE stage = ? AND region = ?""",
+                (prompt_tokens, output_tokens, output_tokens ** 2, output_tokens, stage, region)
+            )
+
+    def usage_stats(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Return token usage totals keyed by stage, then region."""
+        rows = self._connect().execute(
+            """SELECT stage, region, calls, prompt_tokens, output_tokens,
+                      output_tokens_squared, max_output_tokens
+               FROM usage_stats"""
+        ).fetchall()
+        stats: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for stage, region, calls, prompt_tokens, output_tokens, squared, max_output in rows:
+            stats.setdefault(stage, {})[region] = {
+                "calls": calls,
+                "prompt_tokens": prompt_tokens,
+                "output_tokens": output_tokens,
+                "output_tokens_squared": squared,
+                "max_output_tokens": max_output,
+            }
+        return stats
+
+    # Model cascade
+
+    def record_cascade_result(self, stage: str, model: str, accepted: bool) -> None:
+        """Record whether a model tier's output for a stage was accepted or escalated."""
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO cascade_stats (stage, model) VALUES (?, ?)", (stage, model)
+            )
+            conn.execute(
+                """UPDATE cascade_stats
+                   SET attempts = attempts + 1, accepted = accepted + ?
+                   WHERE stage = ? AND model = ?""",
+                (int(accepted), stage, model)
+            )
+
+    def cascade_stats(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Return model tier attempts and acceptances keyed by stage, then model."""
+        rows = self._connect().execute(
+            "SELECT stage, model, attempts, accepted FROM cascade_stats"
+        ).fetchall()
+        stats: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for stage, model, attempts, accepted in rows:
+            stats.setdefault(stage, {})[model] = {"attempts": attempts, "accepted": accepted}
+        return stats
+
+    # Tenant usage
+
+    TENANT_COUNTERS = ("requests", "throttled", "cache_hits", "calls", "prompt_tokens", "output_tokens")
+
+    def record_tenant_usage(self, tenant: str, **counters: int) -> None:
+        """
+        Add to a tenant's usage counters.
+
+        Args:
+            tenant: Tenant the usage belongs to
+            **counters: Increments, keyed by TENANT_COUNTERS names
+        """
+        unknown = set(counters) - set(self.TENANT_COUNTERS)
+        if unknown:
+            raise ValueError(f"Unknown tenant counters: {', '.join(sorted(unknown))}")
+        assignments = ", ".join(f"{name} = {name} + ?" for name in counters)
+        with self._transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO tenant_usage (tenant) VALUES (?)", (tenant,))
+            conn.execute(
+                f"UPDATE tenant_usage SET {assignments} WHERE tenant = ?",
+                (*counters.values(), tenant)
+            )
+
+    def tenant_stats(self, tenant: str = None) -> Dict[str, Dict[str, int]]:
+        """Return usage counters keyed by tenant, for one tenant or all of them."""
+        query = f"SELECT tenant, {', '.join(self.TENANT_COUNTERS)} FROM tenant_usage"
+        params: tuple = ()
+        if tenant is not None:
+            query += " WHERE tenant = ?"
+            params = (tenant,)
+        rows = self._connect().execute(query, params).fetchall()
+        return {row[0]: dict(zip(self.TENANT_COUNTERS, row[1:])) for row in rows}
+
+    # Rate limiting
+
+    def acquire_token(self, name: str, rate_per_second: float, capacity: float) -> float:
+        """
+        Take one token from a shared token bucket.
+
+        Args:
+            name: Bucket name
+            rate_per_second: Refill rate
+            capacity: Maximum burst size
+
+        Returns:
+            float: 0 if a token was taken, otherwise the seconds to wait before retrying
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM rate_limits WHERE name = ?", (name,)
+            ).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate_per_second)
+
+            if tokens >= 1:
+                tokens -= 1
+                wait_seconds = 0.0
+            else:
+                wait_seconds = (1 - tokens) / rate_per_second
+
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limits (name, tokens, updated_at) VALUES (?, ?, ?)",
+                (name, tokens, now)
+            )
+        return wait_seconds
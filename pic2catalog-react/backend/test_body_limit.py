@@ -0,0 +1,14 @@
+from fastapi.testclient import TestClient
+
+import main
+
+
+def test_oversized_upload_rejection_carries_cors_headers():
+    limit = main.MAX_IMAGES_PER_PRODUCT * (main.MAX_UPLOAD_BYTES + main.MULTIPART_OVERHEAD_BYTES)
+    response = TestClient(main.app).post(
+        "/generate_catalog",
+        content=b"x" * (limit + 1),
+        headers={"Origin": "https://loja.example", "Content-Type": "application/octet-stream"},
+    )
+    assert response.status_code == 413
+    assert "access-control-allow-origin" in response.headers
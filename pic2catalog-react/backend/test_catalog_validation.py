@@ -0,0 +1,38 @@
+import pytest
+
+from main import catalog_prompt, invalid_catalog_fields
+
+REQUIRED_ONLY = {
+    "Nome do Produto": "Garrafa Térmica",
+    "Categoria": "Casa e Cozinha",
+    "Descrição Curta": "Garrafa térmica de aço inox.",
+    "Descrição Longa": "Garrafa térmica de aço inox com parede dupla.",
+    "Características Principais": ["Aço inox", "Parede dupla", "1 litro"],
+}
+
+
+def test_required_fields_are_what_the_fixture_fills():
+    assert set(catalog_prompt().response_schema["required"]) == set(REQUIRED_ONLY)
+
+
+def test_entry_with_only_required_fields_is_valid():
+    assert invalid_catalog_fields(REQUIRED_ONLY) == ()
+
+
+def test_optional_fields_may_be_null():
+    assert invalid_catalog_fields({**REQUIRED_ONLY, "Marca": None}) == ()
+
+
+@pytest.mark.parametrize("entry, expected", [
+    ({key: value for key, value in REQUIRED_ONLY.items() if key != "Categoria"}, ("Categoria",)),
+    ({**REQUIRED_ONLY, "Nome do Produto": ""}, ("Nome do Produto",)),
+    ({**REQUIRED_ONLY, "Características Principais": "Aço inox"}, ("Características Principais",)),
+    ({**REQUIRED_ONLY, "Marca": 42}, ("Marca",)),
+])
+def test_missing_required_or_mistyped_fields_are_invalid(entry, expected):
+    assert invalid_catalog_fields(entry) == expected
+
+
+def test_non_object_output_fails_every_requested_field():
+    fields = ("Nome do Produto", "Marca")
+    assert invalid_catalog_fields(["not", "an", "object"], fields) == fields
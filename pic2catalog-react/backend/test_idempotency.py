@@ -0,0 +1,144 @@
+import asyncio
+import io
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+import main
+
+
+def new_key() -> str:
+    return f"test:{uuid.uuid4()}"
+
+
+class Handler:
+    """Request handler double counting how often it actually runs."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.runs = 0
+
+    async def __call__(self, value):
+        self.runs += 1
+        await asyncio.sleep(self.delay)
+        return {"value": value}
+
+
+def test_repeated_key_replays_the_stored_outcome():
+    handler = Handler()
+    key = new_key()
+
+    async def scenario():
+        first = await main.run_idempotent(key, "payload", handler, 1)
+        second = await main.run_idempotent(key, "payload", handler, 2)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == (200, {"value": 1}, False)
+    assert second == (200, {"value": 1}, True)
+    assert handler.runs == 1
+
+
+def test_key_reused_for_a_different_request_is_rejected():
+    handler = Handler()
+    key = new_key()
+
+    async def scenario():
+        await main.run_idempotent(key, "payload", handler, 1)
+        await main.run_idempotent(key, "other payload", handler, 1)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(scenario())
+    assert error.value.status_code == 422
+    assert handler.runs == 1
+
+
+def test_concurrent_repeats_join_the_run_in_flight():
+    handler = Handler(delay=0.2)
+    key = new_key()
+
+    async def scenario():
+        return await asyncio.gather(*(main.run_idempotent(key, "payload", handler, 1) for _ in range(3)))
+
+    outcomes = asyncio.run(scenario())
+    assert handler.runs == 1
+    assert {(status, tuple(body.items())) for status, body, _ in outcomes} == {(200, (("value", 1),))}
+    assert sorted(replayed for _, _, replayed in outcomes) == [False, True, True]
+
+
+def test_single_flight_fans_one_run_out_to_every_caller():
+    flight = main.SingleFlight()
+    handler = Handler(delay=0.1)
+
+    async def scenario():
+        return await asyncio.gather(*(flight.run("key", handler, 7) for _ in range(4)))
+
+    assert asyncio.run(scenario()) == [{"value": 7}] * 4
+    assert handler.runs == 1
+
+
+def test_single_flight_cancels_the_run_when_its_last_caller_leaves():
+    flight = main.SingleFlight()
+    handler = Handler(delay=10)
+
+    async def scenario():
+        waiter = asyncio.create_task(flight.run("key", handler, 1))
+        await asyncio.sleep(0.05)
+        task = flight._inflight["key"]
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+        return task
+
+    task = asyncio.run(scenario())
+    assert task.cancelled()
+    assert "key" not in flight
+
+
+def test_run_cancelled_before_it_started_releases_its_spools():
+    flight = main.SingleFlight()
+    handler = Handler()
+    spools = [io.BytesIO(b"image")]
+
+    async def scenario():
+        waiter = asyncio.create_task(
+            flight.run("key", handler, 1, on_abandoned=lambda: main.close_spools(spools))
+        )
+        # Let the waiter create the run, then cancel the run before its first step
+        await asyncio.sleep(0)
+        flight._inflight["key"].cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(scenario())
+    assert handler.runs == 0
+    assert spools[0].closed
+
+
+def test_idempotent_run_cancelled_before_it_started_releases_its_key():
+    handler = Handler()
+    key = new_key()
+    spools = [io.BytesIO(b"image")]
+
+    async def scenario():
+        waiter = asyncio.create_task(main.run_idempotent(
+            key, "payload", handler, 1, on_abandoned=lambda: main.close_spools(spools)
+        ))
+        while f"idempotency:{key}" not in main.idempotency_flights:
+            await asyncio.sleep(0)
+        main.idempotency_flights._inflight[f"idempotency:{key}"].cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # The key is released in the background
+        for _ in range(50):
+            if await main.run_in_threadpool(main.shared_store.cache_get, f"idempotency:{key}") is None:
+                break
+            await asyncio.sleep(0.01)
+        # A retry with the same key runs instead of waiting on the abandoned claim
+        return await main.run_idempotent(key, "payload", handler, 2)
+
+    assert asyncio.run(scenario()) == (200, {"value": 2}, False)
+    assert handler.runs == 1
+    assert spools[0].closed
@@ -0,0 +1,30 @@
+import pytest
+
+import main
+
+REVIEW = {"nome": "Ana", "estrelas": 5, "titulo": "Ótimo", "texto": "Gostei muito.", "data": "2024-05-01", "pros": ["Leve"]}
+VALID = {"reviews": [REVIEW] * 5}
+# What a truncated response repairs to: the cut-off fifth review is dropped
+TRUNCATED = {"reviews": [REVIEW] * 4}
+
+
+@pytest.fixture
+def two_tiers(monkeypatch):
+    monkeypatch.setitem(main.STAGE_MODELS, "reviews", ("cheap-model", "strong-model"))
+
+
+def test_escalates_past_invalid_output(two_tiers):
+    outputs = {"cheap-model": TRUNCATED, "strong-model": VALID}
+    calls = []
+
+    def generate(model_name):
+        calls.append(model_name)
+        return outputs[model_name]
+
+    assert main.run_model_cascade("reviews", generate, main.REVIEWS_MODEL) == VALID
+    assert calls == ["cheap-model", "strong-model"]
+
+
+def test_invalid_output_of_last_tier_fails_the_stage(two_tiers):
+    with pytest.raises(ValueError, match="failed validation"):
+        main.run_model_cascade("reviews", lambda model_name: TRUNCATED, main.REVIEWS_MODEL)
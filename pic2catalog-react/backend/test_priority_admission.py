@@ -0,0 +1,41 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def small_pipeline_pools(monkeypatch):
+    pools = {priority: ThreadPoolExecutor(max_workers=2) for priority in main.PRIORITY_WEIGHTS}
+    monkeypatch.setattr(main, "pipeline_executors", pools)
+    yield
+    for pool in pools.values():
+        pool.shutdown(wait=True)
+
+
+async def run_request(priority: str, seconds: float, finished: list, name: str):
+    main.request_priority.set(priority)
+    await main.run_cancellable(time.sleep, seconds)
+    finished.append(name)
+
+
+def test_interactive_request_overtakes_saturated_batch_backlog(small_pipeline_pools):
+    async def scenario():
+        finished = []
+        # Ten bulk requests, five times more than the batch pipeline threads
+        backlog = [
+            asyncio.create_task(run_request("batch", 0.1, finished, f"batch-{number}"))
+            for number in range(10)
+        ]
+        await asyncio.sleep(0.02)
+        await run_request("interactive", 0.01, finished, "interactive")
+        await asyncio.gather(*backlog)
+        return finished
+
+    finished = asyncio.run(scenario())
+    # Only the first wave of batch requests (holding both batch threads) can finish first
+    assert finished.index("interactive") <= 2
+    assert len(finished) == 11
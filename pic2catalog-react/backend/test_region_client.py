@@ -0,0 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+
+
+def test_region_results_recorded_from_many_threads_are_all_counted():
+    client = main.GeminiRegionClient(project_id="test-project")
+    try:
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            for i in range(2000):
+                pool.submit(client._record_region_result, "us-central1", None if i % 2 else 100.0)
+        stats = client.get_region_stats()["us-central1"]
+        assert (stats["successes"], stats["failures"]) == (1000, 1000)
+        assert stats["latency_ms"] == 100.0
+    finally:
+        client.shutdown()
+
+
+def test_region_stats_are_a_snapshot():
+    client = main.GeminiRegionClient(project_id="test-project")
+    try:
+        snapshot = client.get_region_stats()
+        client._record_region_result("us-central1", 50.0)
+        assert snapshot["us-central1"]["successes"] == 0
+    finally:
+        client.shutdown()
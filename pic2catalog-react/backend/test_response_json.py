@@ -0,0 +1,63 @@
+import pytest
+
+from response_json import clean_json_response, extract_json_text, repair_json_text
+
+
+@pytest.mark.parametrize("response_text, expected", [
+    ('{"a": 1}', '{"a": 1}'),
+    ('Here it is:\n{"a": 1}', '{"a": 1}'),
+    ('```json\n{"a": 1}\n```', '{"a": 1}\n'),
+    ('```\n[1, 2]\n```', '[1, 2]\n'),
+    ('```json {"a": 1}```', '{"a": 1}'),
+    ('```json {"a": 1}```\n', '{"a": 1}'),
+    ('```json\n{"a": 1', '{"a": 1'),
+    ('```json\n"text"\n```', '"text"'),
+])
+def test_extract_json_text(response_text, expected):
+    assert extract_json_text(response_text) == expected
+
+
+@pytest.mark.parametrize("response_text, expected", [
+    ('```json {"a": 1}```', {"a": 1}),
+    ('```json\n{"a": 1}\n```\nHope this helps!', {"a": 1}),
+    ('{"a": "x}y", "b": "[not a list"}', {"a": "x}y", "b": "[not a list"}),
+    ('{"a": "quote \\" and } brace"}', {"a": 'quote " and } brace'}),
+])
+def test_clean_json_response_parses(response_text, expected):
+    assert clean_json_response(response_text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Truncated mid-string: the incomplete value and its key are dropped
+    ('{"a": 1, "b": "unfinis', {"a": 1}),
+    # Truncated mid-number: a number is only complete once a delimiter follows
+    ('{"a": [1, 2, 3', {"a": [1, 2]}),
+    # An array element cut off anywhere inside is dropped whole, never closed
+    ('{"reviews": [{"text": "good"}, {"text": "ba', {"reviews": [{"text": "good"}]}),
+    ('{"reviews": [{"nome": "a", "estrelas": 4}, {"nome": "b", "estrelas": 5',
+     {"reviews": [{"nome": "a", "estrelas": 4}]}),
+    ('{"reviews": [{"nome": "a", "tags": ["x", "y"]}, {"nome": "b", "tags": ["x"',
+     {"reviews": [{"nome": "a", "tags": ["x", "y"]}]}),
+    ('["a", "b', ["a"]),
+    ('{"reviews": [', {"reviews": []}),
+    ('[1, 2,', [1, 2]),
+    # Braces inside strings don't open or close anything
+    ('{"a": "{[", "b": "}]", "c": "tr', {"a": "{[", "b": "}]"}),
+    ('[{"a": "}"}, {"b": "{', [{"a": "}"}]),
+    # Trailing commas
+    ('{"a": [1, 2,], "b": 3,}', {"a": [1, 2], "b": 3}),
+    # Prose after the value
+    ('{"a": 1} and some notes', {"a": 1}),
+])
+def test_clean_json_response_repairs(text, expected):
+    assert clean_json_response(text) == expected
+
+
+@pytest.mark.parametrize("text", ['{"a": 1]', '"unfinished'])
+def test_repair_json_text_gives_up(text):
+    assert repair_json_text(text) is None
+
+
+def test_clean_json_response_raises_when_unusable():
+    with pytest.raises(ValueError):
+        clean_json_response("I can't help with that.")
@@ -0,0 +1,58 @@
+import json
+import re
+import threading
+
+import main
+
+
+class FakeClient:
+    """Answers batched reviews prompts, titling each product's reviews with its name."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        listing = re.findall(r'"id": "(\d+)",\s*"nome": "([^"]*)"', prompt)
+        review = {"nome": "Ana", "estrelas": 5, "texto": "Gostei.", "data": "2024-05-01", "pros": ["Leve"]}
+        summary = {"pontos_fortes": ["a", "b", "c"], "criticas": [], "sentimento_geral": "positivo",
+                   "recomendacoes": "Compre."}
+        return json.dumps({"produtos": [
+            {"id": product_id, "reviews": [{**review, "titulo": name}] * 5, "resumo": summary}
+            for product_id, name in listing
+        ]})
+
+
+def review_concurrently(coalescer, client, requests):
+    results = {}
+
+    def run(tenant, name):
+        results[name] = coalescer.review(client, tenant, {"Nome do Produto": name})
+
+    threads = [threading.Thread(target=run, args=request) for request in requests]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_requests_share_one_call():
+    client = FakeClient()
+    names = [f"Produto {number}" for number in range(4)]
+    results = review_concurrently(main.ReviewCoalescer(0.5), client, [("loja-a", name) for name in names])
+
+    assert client.calls == 1
+    for name in names:
+        assert {review["titulo"] for review in results[name]["reviews"]} == {name}
+        assert results[name]["summary"]["sentimento_geral"] == "positivo"
+
+
+def test_tenants_never_share_a_call():
+    client = FakeClient()
+    results = review_concurrently(
+        main.ReviewCoalescer(0.5), client, [("loja-a", "A1"), ("loja-a", "A2"), ("loja-b", "B1")]
+    )
+
+    assert client.calls == 2
+    assert {review["titulo"] for review in results["B1"]["reviews"]} == {"B1"}
@@ -0,0 +1,41 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "TENANT_API_KEYS", {"key-a": "loja-a", "key-b": "loja-b"})
+    monkeypatch.setattr(main, "USAGE_ADMIN_API_KEY", "admin-key")
+    return TestClient(main.app)
+
+
+def test_tenant_sees_only_its_own_usage(client):
+    response = client.get("/usage", headers={"X-API-Key": "key-a"})
+    assert response.status_code == 200
+    assert set(response.json()) == {"tenant"}
+    assert response.json()["tenant"]["name"] == "loja-a"
+
+
+@pytest.mark.parametrize("admin_key", ["wrong", ""])
+def test_wrong_admin_key_gets_tenant_usage_only(client, admin_key):
+    response = client.get("/usage", headers={"X-API-Key": "key-b", "X-Admin-Key": admin_key})
+    assert set(response.json()) == {"tenant"}
+
+
+def test_admin_key_adds_usage_across_tenants(client):
+    response = client.get("/usage", headers={"X-API-Key": "key-a", "X-Admin-Key": "admin-key"})
+    assert {"stages", "cascade", "scheduler", "tenant"} <= set(response.json())
+
+
+def test_without_an_admin_key_configured_nobody_sees_global_usage(client, monkeypatch):
+    monkeypatch.setattr(main, "USAGE_ADMIN_API_KEY", "")
+    response = client.get("/usage", headers={"X-API-Key": "key-a", "X-Admin-Key": ""})
+    assert set(response.json()) == {"tenant"}
+
+
+def test_single_tenant_deployment_keeps_the_full_report(monkeypatch):
+    monkeypatch.setattr(main, "TENANT_API_KEYS", {})
+    response = TestClient(main.app).get("/usage")
+    assert {"stages", "cascade", "scheduler", "tenant"} <= set(response.json())
@@ -0,0 +1,37 @@
+import functools
+from types import SimpleNamespace
+
+# Lazy loader for the Vertex AI SDK, which both the FastAPI backend and the Streamlit
+# app call through vertex_sdk() instead of importing it at module load.
+
+
+@functools.lru_cache(maxsize=None)
+def vertex_sdk() -> SimpleNamespace:
+    """
+    Import the Vertex AI SDK on first model use.
+    
+    The SDK takes seconds to import, so it is kept off the startup path and only
+    loaded when a model call actually needs it.
+    
+    Returns:
+        SimpleNamespace: The SDK entry points used by the model clients
+    """
+    import vertexai
+    from google.api_core.exceptions import ResourceExhausted
+    from vertexai.generative_models import (
+        GenerationConfig,
+        GenerativeModel,
+        HarmBlockThreshold,
+        HarmCategory,
+        Part,
+    )
+    
+    return SimpleNamespace(
+        vertexai=vertexai,
+        ResourceExhausted=ResourceExhausted,
+        GenerationConfig=GenerationConfig,
+        GenerativeModel=GenerativeModel,
+        HarmBlockThreshold=HarmBlockThreshold,
+        HarmCategory=HarmCategory,
+        Part=Part,
+    )
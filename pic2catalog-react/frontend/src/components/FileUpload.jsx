@@ -6,20 +6,27 @@ import { useTheme } from '@mui/material/styles';
 const FileUpload = ({ onFileSelect, isLoading }) => {
   const theme = useTheme();
   const [previewUrl, setPreviewUrl] = useState(null);
+  const [fileCount, setFileCount] = useState(0);
   const fileInputRef = useRef(null);
 
-  const handleFileChange = (event) => {
-    const file = event.target.files[0];
-    if (file && file.type.startsWith('image/')) {
+  // Several images are treated as angles of the same product
+  const selectFiles = (fileList) => {
+    const files = Array.from(fileList).filter((file) => file.type.startsWith('image/'));
+    if (files.length > 0) {
       const reader = new FileReader();
       reader.onload = () => {
         setPreviewUrl(reader.result);
       };
-      reader.readAsDataURL(file);
-      onFileSelect(file);
+      reader.readAsDataURL(files[0]);
+      setFileCount(files.length);
+      onFileSelect(files);
     }
   };
 
+  const handleFileChange = (event) => {
+    selectFiles(event.target.files);
+  };
+
   const handleClick = () => {
     fileInputRef.current.click();
   };
@@ -30,15 +37,7 @@ const FileUpload = ({ onFileSelect, isLoading }) => {
 
   const handleDrop = (event) => {
     event.preventDefault();
-    const file = event.dataTransfer.files[0];
-    if (file && file.type.startsWith('image/')) {
-      const reader = new FileReader();
-      reader.onload = () => {
-        setPreviewUrl(reader.result);
-      };
-      reader.readAsDataURL(file);
-      onFileSelect(file);
-    }
+    selectFiles(event.dataTransfer.files);
   };
 
   return (
@@ -54,6 +53,7 @@ const FileUpload = ({ onFileSelect, isLoading }) => {
       <input
         type="file"
         accept="image/*"
+        multiple
         onChange={handleFileChange}
         ref={fileInputRef}
         style={{ display: 'none' }}
@@ -97,6 +97,11 @@ const FileUpload = ({ onFileSelect, isLoading }) => {
         ) : previewUrl ? (
           <Box sx={{ textAlign: 'center' }}>
             <img src={previewUrl} alt="Preview" className="file-preview" style={{ maxHeight: '300px', maxWidth: '100%', borderRadius: '4px' }} />
+            {fileCount > 1 && (
+              <Typography variant="body2" color="text.secondary" sx={{ mt: 1 }}>
+                {fileCount} imagens do mesmo produto selecionadas
+              </Typography>
+            )}
             <Typography variant="body2" color="text.secondary" sx={{ mt: 1 }}>
               Clique ou arraste uma nova imagem para alterar
             </Typography>
@@ -113,6 +118,9 @@ const FileUpload = ({ onFileSelect, isLoading }) => {
             <Typography variant="body2" color="text.secondary" sx={{ mt: 1 }}>
               Formatos suportados: JPG, PNG
             </Typography>
+            <Typography variant="body2" color="text.secondary">
+              Selecione várias imagens para enviar ângulos diferentes do mesmo produto
+            </Typography>
           </>
         )}
       </Box>
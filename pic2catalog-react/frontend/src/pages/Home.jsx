@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { Container, Typography, Box, Alert, Tabs, Tab, Paper, Button, Divider, ButtonGroup, Snackbar } from '@mui/material';
+import { Container, Typography, Box, Alert, Tabs, Tab, Paper, Button, Divider, ButtonGroup, Snackbar, FormControlLabel, Switch } from '@mui/material';
 import { useTheme } from '@mui/material/styles';
 import FileUpload from '../components/FileUpload';
 import WebcamCapture from '../components/WebcamCapture';
@@ -32,6 +32,24 @@ const TabPanel = (props) => {
   );
 };
 
+// Crop one detected product out of the photo; boxes are [ymin, xmin, ymax, xmax] on a 0-1000 scale
+const cropToBox = (imageUrl, [ymin, xmin, ymax, xmax]) => new Promise((resolve, reject) => {
+  const image = new Image();
+  image.onload = () => {
+    const x = (xmin / 1000) * image.naturalWidth;
+    const y = (ymin / 1000) * image.naturalHeight;
+    const width = Math.max(1, ((xmax - xmin) / 1000) * image.naturalWidth);
+    const height = Math.max(1, ((ymax - ymin) / 1000) * image.naturalHeight);
+    const canvas = document.createElement('canvas');
+    canvas.width = width;
+    canvas.height = height;
+    canvas.getContext('2d').drawImage(image, x, y, width, height, 0, 0, width, height);
+    resolve(canvas.toDataURL('image/jpeg'));
+  };
+  image.onerror = reject;
+  image.src = imageUrl;
+});
+
 const Home = () => {
   const theme = useTheme();
   const [tabValue, setTabValue] = useState(0);
@@ -39,11 +57,13 @@ const Home = () => {
   const [error, setError] = useState(null);
   const [productData, setProductData] = useState(null);
   const [imagePreview, setImagePreview] = useState(null);
-  const [selectedFile, setSelectedFile] = useState(null);
+  const [selectedFiles, setSelectedFiles] = useState([]);
   const [inputMethod, setInputMethod] = useState('upload'); // 'upload' or 'camera'
   const [notification, setNotification] = useState({ open: false, message: '', severity: 'info' });
   const [isCameraSupported, setIsCameraSupported] = useState(true);
   const [cameraKey, setCameraKey] = useState(0); // Used to force remount of camera component
+  const [multiProduct, setMultiProduct] = useState(false); // One photo showing several products
+  const [productImages, setProductImages] = useState([]); // Crop of each detected product
 
   // Check if camera is supported on component mount
   useEffect(() => {
@@ -70,21 +90,34 @@ const Home = () => {
     checkCameraSupport();
   }, []);
 
+  // Crop each detected product out of the photo for its product page
+  useEffect(() => {
+    const products = productData?.products || [];
+    if (!imagePreview || products.length === 0) {
+      setProductImages([]);
+      return;
+    }
+    Promise.all(products.map((product) => cropToBox(imagePreview, product.bounding_box).catch(() => imagePreview)))
+      .then(setProductImages);
+  }, [productData, imagePreview]);
+
   const handleTabChange = (event, newValue) => {
     setTabValue(newValue);
   };
 
-  const handleFileSelect = (file) => {
-    if (file) {
-      setSelectedFile(file);
+  const handleFileSelect = (files) => {
+    if (files && files.length > 0) {
+      setSelectedFiles(files);
       const reader = new FileReader();
       reader.onload = () => {
         setImagePreview(reader.result);
       };
-      reader.readAsDataURL(file);
+      reader.readAsDataURL(files[0]);
       setNotification({
         open: true,
-        message: 'Imagem selecionada com sucesso!',
+        message: files.length > 1
+          ? `${files.length} imagens selecionadas com sucesso!`
+          : 'Imagem selecionada com sucesso!',
         severity: 'success'
       });
     }
@@ -92,7 +125,7 @@ const Home = () => {
 
   const handleImageCapture = (file, imageDataUrl) => {
     if (file) {
-      setSelectedFile(file);
+      setSelectedFiles([file]);
       setImagePreview(imageDataUrl);
       setInputMethod('upload'); // Switch back to upload view after capture
       setNotification({
@@ -123,13 +156,16 @@ const Home = () => {
   };
 
   const handleGenerateCatalog = async () => {
-    if (!selectedFile) return;
+    if (selectedFiles.length === 0) return;
     
     setLoading(true);
     setError(null);
     
     try {
-      const data = await generateCatalog(selectedFile);
+      // Multi-product mode splits a single photo, so it only applies to one image
+      const data = await generateCatalog(selectedFiles, {
+        multiProduct: multiProduct && selectedFiles.length === 1,
+      });
       setProductData(data);
       setTabValue(1); // Switch to product view tab
     } catch (err) {
@@ -325,7 +361,22 @@ const Home = () => {
               </Box>
             )}
             
-            {selectedFile && !loading && (
+            {selectedFiles.length === 1 && !loading && (
+              <Box sx={{ textAlign: 'center', mt: 2 }}>
+                <FormControlLabel
+                  control={
+                    <Switch
+                      checked={multiProduct}
+                      onChange={(event) => setMultiProduct(event.target.checked)}
+                      color="primary"
+                    />
+                  }
+                  label="A foto mostra vários produtos (prateleira ou flat-lay)"
+                />
+              </Box>
+            )}
+            
+            {selectedFiles.length > 0 && !loading && (
               <Box sx={{ textAlign: 'center', mt: 2 }}>
                 <Button 
                   variant="contained" 
@@ -359,7 +410,27 @@ const Home = () => {
         </TabPanel>
 
         <TabPanel value={tabValue} index={1}>
-          {productData && (
+          {productData && productData.products ? (
+            productData.products.length === 0 ? (
+              <Alert severity="info" sx={{ maxWidth: 600, mx: 'auto' }}>
+                Nenhum produto foi encontrado na foto.
+              </Alert>
+            ) : (
+              productData.products.map((product, index) => (
+                <Box key={index} sx={{ mb: 4 }}>
+                  <Typography variant="h6" gutterBottom sx={{ px: 3 }}>
+                    Produto {index + 1} de {productData.products.length}
+                  </Typography>
+                  <ProductDisplay 
+                    productInfo={product.catalog_info} 
+                    reviewsInfo={product.reviews_info}
+                    imageUrl={productImages[index] || imagePreview}
+                  />
+                  {index < productData.products.length - 1 && <Divider sx={{ mt: 4 }} />}
+                </Box>
+              ))
+            )
+          ) : productData && (
             <ProductDisplay 
               productInfo={productData.catalog_info} 
               reviewsInfo={productData.reviews_info}
@@ -382,14 +453,23 @@ const Home = () => {
                 </Button>
               </Box>
               <Divider sx={{ mb: 3 }} />
-              <JsonDisplay 
-                data={productData.catalog_info} 
-                title="Informações do Catálogo" 
-              />
-              <JsonDisplay 
-                data={productData.reviews_info} 
-                title="Avaliações e Resumo" 
-              />
+              {productData.products ? (
+                <JsonDisplay 
+                  data={productData.products} 
+                  title="Produtos Encontrados" 
+                />
+              ) : (
+                <>
+                  <JsonDisplay 
+                    data={productData.catalog_info} 
+                    title="Informações do Catálogo" 
+                  />
+                  <JsonDisplay 
+                    data={productData.reviews_info} 
+                    title="Avaliações e Resumo" 
+                  />
+                </>
+              )}
             </Box>
           )}
         </TabPanel>
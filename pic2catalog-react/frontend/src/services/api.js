@@ -1,6 +1,7 @@
 import axios from 'axios';
 
 // Create an axios instance with default config
+// Tenant API keys never reach the browser: the /api proxy adds X-API-Key (see vite.config.js)
 const api = axios.create({
   baseURL: '/api',
   headers: {
@@ -9,12 +10,18 @@ const api = axios.create({
 });
 
 // API functions
-export const generateCatalog = async (imageFile) => {
+// Accepts one image file or an array of images of the same product (e.g. several angles),
+// which the backend analyzes together in a single catalog call.
+// With multiProduct, a single shelf or flat-lay photo is split into one entry per product,
+// returned under `products` with bounding boxes.
+export const generateCatalog = async (imageFiles, { multiProduct = false } = {}) => {
   try {
     const formData = new FormData();
-    formData.append('file', imageFile);
+    const files = Array.isArray(imageFiles) ? imageFiles : [imageFiles];
+    files.forEach((file) => formData.append('file', file));
     
-    const response = await api.post('/generate_catalog', formData);
+    const params = multiProduct ? { multi_product: true } : undefined;
+    const response = await api.post('/generate_catalog', formData, { params });
     return response.data;
   } catch (error) {
     console.error('Error generating catalog:', error);
@@ -1,6 +1,12 @@
 import { defineConfig } from 'vite';
 import react from '@vitejs/plugin-react';
 
+// With tenant API keys enabled on the backend, the proxy adds this storefront's key
+// server-side. It is read from CATALOG_API_KEY (no VITE_ prefix), so it is never
+// bundled into the browser code; in production the reverse proxy or the storefront
+// backend in front of the API must add the header instead.
+const apiKey = process.env.CATALOG_API_KEY;
+
 export default defineConfig({
   plugins: [react()],
   server: {
@@ -9,7 +15,8 @@ export default defineConfig({
       '/api': {
         target: 'http://localhost:8000',
         changeOrigin: true,
-        rewrite: (path) => path.replace(/^\/api/, '')
+        rewrite: (path) => path.replace(/^\/api/, ''),
+        ...(apiKey ? { headers: { 'X-API-Key': apiKey } } : {})
       }
     }
   }